@@ -1,44 +1,82 @@
 import os
-import uuid
-import datetime
+import asyncio
+import functools
 import logging
+import sqlite3
+from collections import Counter
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
 from dotenv import load_dotenv
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import SystemMessage
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.tools import BaseTool, tool
 
+import numpy as np
+
+from embedding_service import EmbeddingBatcher, QueryEmbeddingCache
+from fake_llm import FakeSupportLLM
+from intent_router import INTENT_ESCALATION, IntentRouter, RoutedIntent
+from kb_prefetch import KBPrefetch, prefetch_query
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from llm_client import CircuitBreaker, LLMCallPolicy, ManagedChatModel
+from metadata_index import MetadataIndex
 from mock_data import MOCK_IT_DOCUMENTS
+from response_cache import ResponseCache
+from session_store import ChatSession, SessionStore
+from telemetry import begin_request, end_request, register_stats, span
+from ticket_store import KIND_ESCALATION, KIND_TICKET, TicketStore
+from vector_index import (
+    IndexConfig,
+    KnowledgeBaseStore,
+    PREBUILT_LEXICAL_DIR,
+    PREBUILT_METADATA_DIR,
+    is_prebuilt_index,
+    load_prebuilt_vector_store,
+    memory_report,
+    sync_vector_store,
+)
+from warranty_engine import WarrantyEngine
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-FAISS_INDEX_DIR = "./faiss_index"
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "./faiss_index")
 
 # ---------------------------------------------------------------------------
 # Global vector store reference (set during startup, used inside tools)
 # ---------------------------------------------------------------------------
-_vector_store: FAISS | None = None
+_vector_store: KnowledgeBaseStore | None = None
+_lexical_index: LexicalIndex | None = None
+_metadata_index: MetadataIndex | None = None
+
+# hybrid: BM25 + vector search fused with reciprocal-rank fusion; vector: FAISS only
+KB_SEARCH_MODE = os.getenv("KB_SEARCH_MODE", "hybrid").lower()
+_RRF_K = int(os.getenv("KB_RRF_K", "60"))
+# Each retriever contributes k * this many candidates to the fusion.
+_HYBRID_CANDIDATES = 4
 
-_EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # ~80MB, fast, local — no API key needed
-_embeddings_instance: HuggingFaceEmbeddings | None = None
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # ~80MB, fast, local — no API key needed
+_embeddings_instance: Embeddings | None = None
 
 
-def get_embeddings() -> HuggingFaceEmbeddings:
+def get_embeddings() -> Embeddings:
     """Return a cached instance of the local HuggingFace embedding model."""
     global _embeddings_instance
     if _embeddings_instance is None:
-        logger.info("Loading local embedding model '%s'...", _EMBEDDING_MODEL)
+        # Imported on first use: sentence-transformers pulls in torch.
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        logger.info("Loading local embedding model '%s'...", EMBEDDING_MODEL)
         _embeddings_instance = HuggingFaceEmbeddings(
-            model_name=_EMBEDDING_MODEL,
+            model_name=EMBEDDING_MODEL,
             model_kwargs={"device": "cpu"},
             encode_kwargs={"normalize_embeddings": True},
         )
@@ -46,23 +84,224 @@ def get_embeddings() -> HuggingFaceEmbeddings:
     return _embeddings_instance
 
 
+_query_embedder: QueryEmbeddingCache | None = None
+
+
+def get_query_embedder() -> QueryEmbeddingCache:
+    """Return the shared query-embedding cache wrapping get_embeddings()."""
+    global _query_embedder
+    if _query_embedder is None:
+        _query_embedder = QueryEmbeddingCache(
+            get_embeddings(),
+            max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096")),
+        )
+    return _query_embedder
+
+
+# ---------------------------------------------------------------------------
+# BLOCKING WORK EXECUTOR
+# ---------------------------------------------------------------------------
+# Embedding forward passes and FAISS searches are CPU-bound and synchronous.
+# On the async path they run on this bounded pool so the event loop stays
+# free to serve other requests; the bound keeps a burst of chats from
+# oversubscribing the CPU.
+
+_BLOCKING_WORKERS = int(os.getenv("AI_ENGINE_BLOCKING_WORKERS", "4"))
+_blocking_executor: ThreadPoolExecutor | None = None
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """Return the shared bounded executor, creating it on first use."""
+    global _blocking_executor
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(
+            max_workers=_BLOCKING_WORKERS,
+            thread_name_prefix="ai-engine-blocking",
+        )
+    return _blocking_executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a synchronous callable on the bounded blocking executor, in a copy
+    of the caller's context (so its request trace follows it)."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_blocking_executor(), call)
+
+
+_embedding_batcher: EmbeddingBatcher | None = None
+_embedding_batcher_configured = False
+
+
+def get_embedding_batcher() -> EmbeddingBatcher | None:
+    """Return the shared search micro-batcher, or None when
+    EMBEDDING_BATCH_MAX_SIZE is 1 (batching disabled)."""
+    global _embedding_batcher, _embedding_batcher_configured
+    if not _embedding_batcher_configured:
+        max_batch_size = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+        if max_batch_size > 1:
+            _embedding_batcher = EmbeddingBatcher(
+                get_query_embedder(),
+                search_knowledge_base_by_vectors,
+                run_blocking,
+                max_batch_size=max_batch_size,
+                max_wait_ms=float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5")),
+            )
+        _embedding_batcher_configured = True
+    return _embedding_batcher
+
+
+def shutdown_blocking_executor() -> None:
+    global _blocking_executor
+    if _blocking_executor is not None:
+        _blocking_executor.shutdown(wait=False, cancel_futures=True)
+        _blocking_executor = None
+
+
 # ---------------------------------------------------------------------------
 # AGENT TOOLS
 # ---------------------------------------------------------------------------
 
+def _format_kb_results(docs: list[Document]) -> str:
+    if not docs:
+        return "No relevant documentation found in the knowledge base for this query."
+    chunks = [f"[Chunk {i + 1}]\n{d.page_content}" for i, d in enumerate(docs)]
+    return "\n\n---\n\n".join(chunks)
+
+
+def _documents_at(positions: list[int]) -> list[Document]:
+    docs = []
+    for position in positions:
+        doc = _vector_store.docstore.search(_vector_store.index_to_docstore_id[position])
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+
+def search_knowledge_base_by_vectors(
+    embeddings: np.ndarray,
+    k: int = 3,
+    queries: list[str] | None = None,
+    subset: np.ndarray | None = None,
+) -> list[list[Document]]:
+    """Run one FAISS search for a matrix of query embeddings (one per row).
+    When ``queries`` are given and the lexical index is loaded, each row is
+    fused with the BM25 ranking of its query text. ``subset`` restricts both
+    rankings to those chunk positions."""
+    hybrid = queries is not None and _lexical_index is not None
+    fetch_k = k * _HYBRID_CANDIDATES if hybrid else k
+    with span("vector_search"):
+        _, ids = _vector_store.search_vectors(np.asarray(embeddings, dtype="float32"), fetch_k, subset)
+    results: list[list[Document]] = []
+    for row_index, row in enumerate(ids):
+        ranking = [int(idx) for idx in row if idx != -1]
+        if hybrid:
+            with span("lexical_search"):
+                lexical = _lexical_index.search(queries[row_index], fetch_k, subset)
+            ranking = reciprocal_rank_fusion([ranking, lexical], k, _RRF_K)
+        results.append(_documents_at(ranking[:k]))
+    return results
+
+
+def search_knowledge_base_by_vector(
+    embedding: list[float],
+    k: int = 3,
+    query: str | None = None,
+    subset: np.ndarray | None = None,
+) -> list[Document]:
+    """Search the vector store with a precomputed query embedding."""
+    queries = [query] if query is not None else None
+    return search_knowledge_base_by_vectors(np.asarray([embedding], dtype="float32"), k, queries, subset)[0]
+
+
+def _model_subset(laptop_model: str) -> np.ndarray | None:
+    """Chunk positions for ``laptop_model``, or None to search everything."""
+    if not laptop_model or _metadata_index is None:
+        return None
+    return _metadata_index.subset(model=laptop_model)
+
+
+def _lexical_shortcut(query: str, k: int, subset: np.ndarray | None = None) -> list[Document] | None:
+    # Part numbers and error codes are answered from the inverted index
+    # alone; this is a few dict lookups, cheap enough for the event loop.
+    if _lexical_index is None:
+        return None
+    with span("lexical_shortcut"):
+        positions = _lexical_index.exact_match(query, k, subset)
+    return _documents_at(positions) if positions is not None else None
+
+
+def _search_knowledge_base(query: str, k: int = 3, subset: np.ndarray | None = None) -> list[Document]:
+    docs = _lexical_shortcut(query, k, subset)
+    if docs is not None:
+        return docs
+    # Repeated queries hit the embedding cache and skip the transformer pass.
+    with span("embed_query"):
+        embedding = get_query_embedder().embed_query(query)
+    return search_knowledge_base_by_vector(embedding, k=k, query=query, subset=subset)
+
+
 @tool
-def search_it_knowledge_base(query: str) -> str:
+def search_it_knowledge_base(query: str, laptop_model: str = "") -> str:
     """Search the internal IT knowledge base for troubleshooting guides,
     hardware repair procedures, driver fixes, OS recovery steps, and technical
     documentation for enterprise laptops and PCs. Always use this tool first
-    when a user reports any hardware or software issue."""
+    when a user reports any hardware or software issue. Pass laptop_model
+    (e.g. "ThinkPad T14s Gen 3") to search only that model's documentation."""
     if _vector_store is None:
         return "ERROR: Knowledge base is not available. Cannot retrieve documentation."
-    docs = _vector_store.similarity_search(query, k=3)
-    if not docs:
-        return "No relevant documentation found in the knowledge base for this query."
-    chunks = [f"[Chunk {i + 1}]\n{d.page_content}" for i, d in enumerate(docs)]
-    return "\n\n---\n\n".join(chunks)
+    docs = _search_knowledge_base(query, k=3, subset=_model_subset(laptop_model))
+    return _format_kb_results(docs)
+
+
+async def _asearch_kb(query: str, laptop_model: str = "") -> str:
+    if _vector_store is None:
+        return "ERROR: Knowledge base is not available. Cannot retrieve documentation."
+    subset = _model_subset(laptop_model)
+    docs = _lexical_shortcut(query, k=3, subset=subset)
+    if docs is None:
+        batcher = get_embedding_batcher()
+        if batcher is not None:
+            docs = await batcher.search(query, k=3, subset=subset)
+        else:
+            docs = await run_blocking(_search_knowledge_base, query, k=3, subset=subset)
+    return _format_kb_results(docs)
+
+
+async def _asearch_it_knowledge_base(query: str, laptop_model: str = "") -> str:
+    prefetch = _kb_prefetch.get()
+    if prefetch is not None and prefetch.matches(query, laptop_model):
+        result = await prefetch.result()
+        if result is not None:
+            _prefetch_counts["served"] += 1
+            return result
+    return await _asearch_kb(query, laptop_model)
+
+
+_ticket_store: TicketStore | None = None
+
+
+def get_ticket_store() -> TicketStore:
+    """Return the shared ticket store, opening the database on first use."""
+    global _ticket_store
+    if _ticket_store is None:
+        _ticket_store = TicketStore(
+            os.getenv("TICKET_DB_PATH", "./tickets.db"),
+            max_batch_size=int(os.getenv("TICKET_WRITE_BATCH_SIZE", "512")),
+        )
+    return _ticket_store
+
+
+def close_ticket_store() -> None:
+    """Flush queued tickets to disk and stop the writer thread."""
+    global _ticket_store
+    if _ticket_store is not None:
+        _ticket_store.close()
+        _ticket_store = None
+
+
+def _display_timestamp(created_at: str) -> str:
+    return created_at.replace("T", " ").replace("Z", " UTC")
 
 
 @tool
@@ -74,8 +313,12 @@ def create_support_ticket(issue_summary: str, laptop_model: str, priority: str =
     valid_priorities = {"Low", "Medium", "High", "Critical"}
     if priority not in valid_priorities:
         priority = "Medium"
-    ticket_id = f"INC-{uuid.uuid4().hex[:8].upper()}"
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
+    try:
+        ticket = get_ticket_store().create(KIND_TICKET, issue_summary, device=laptop_model, priority=priority)
+    except sqlite3.Error as exc:
+        logger.error("Ticket store unavailable: %s", exc)
+        return "ERROR: The ticketing system is not available. Cannot create a support ticket."
+    ticket_id = ticket["ticket_id"]
     sla_map = {
         "Critical": "1 hour response / 4 hour resolution",
         "High": "2 hour response / 8 hour resolution",
@@ -89,77 +332,39 @@ def create_support_ticket(issue_summary: str, laptop_model: str, priority: str =
         f"- **Device**: {laptop_model}\n"
         f"- **Priority**: {priority}\n"
         f"- **SLA**: {sla_map[priority]}\n"
-        f"- **Created**: {timestamp}\n"
+        f"- **Created**: {_display_timestamp(ticket['created_at'])}\n"
         f"- **Status**: Open — Assigned to IT Support Queue\n"
         f"- **Tracking**: it-portal.company.internal/tickets/{ticket_id}"
     )
 
 
+_warranty_engine: WarrantyEngine | None = None
+
+
+def get_warranty_engine() -> WarrantyEngine:
+    """Return the shared warranty engine, loading its data files on first use."""
+    global _warranty_engine
+    if _warranty_engine is None:
+        _warranty_engine = WarrantyEngine.load(
+            os.getenv("WARRANTY_PLANS_PATH", os.path.join(os.path.dirname(__file__), "data", "warranty_plans.csv")),
+            os.getenv("WARRANTY_ASSETS_PATH") or None,
+        )
+    return _warranty_engine
+
+
 @tool
-def check_warranty_status(laptop_model: str) -> str:
+def check_warranty_status(laptop_model: str, serial_number: str = "") -> str:
     """Check the warranty status, coverage type, and expiry date for a
     specific laptop model. Use this when hardware replacement or repair
-    authorization is being discussed."""
-    model_lower = laptop_model.lower()
-
-    warranty_db = {
-        "thinkpad": {
-            "plan": "3-Year Lenovo Premier Support",
-            "expires": "2026-12-31",
-            "coverage": "Parts, labor, on-site next-business-day service, accidental damage protection",
-            "contact": "1-800-426-7378 | support.lenovo.com",
-        },
-        "dell xps": {
-            "plan": "3-Year Dell ProSupport Plus",
-            "expires": "2026-09-15",
-            "coverage": "Hardware repair, accidental damage, next-business-day on-site, Keep Your Hard Drive",
-            "contact": "1-800-624-9897 | dell.com/support",
-        },
-        "dell latitude": {
-            "plan": "3-Year Dell ProSupport",
-            "expires": "2027-03-20",
-            "coverage": "Parts & labor, next-business-day on-site hardware support",
-            "contact": "1-800-624-9897 | dell.com/support",
-        },
-        "macbook": {
-            "plan": "AppleCare+ for Enterprise (3 Years)",
-            "expires": "2026-07-01",
-            "coverage": "Hardware defects, battery service, 2 incidents of accidental damage per year",
-            "contact": "1-800-275-2273 | apple.com/support",
-        },
-        "hp elitebook": {
-            "plan": "3-Year HP Care Pack (Next Business Day On-Site)",
-            "expires": "2027-01-10",
-            "coverage": "Parts, labor, on-site repair, defective media retention",
-            "contact": "1-800-474-6836 | support.hp.com",
-        },
-        "surface": {
-            "plan": "Microsoft Complete for Business (2 Years)",
-            "expires": "2026-05-22",
-            "coverage": "Hardware defects, accidental damage (limited), Microsoft Store service",
-            "contact": "1-800-642-7676 | support.microsoft.com",
-        },
-        "zenbook": {
-            "plan": "2-Year ASUS Commercial Warranty",
-            "expires": "2026-11-30",
-            "coverage": "Manufacturing defects, parts & labor, mail-in service",
-            "contact": "1-888-678-3688 | asus.com/support",
-        },
-        "ideapad": {
-            "plan": "2-Year Lenovo Standard Warranty",
-            "expires": "2026-08-14",
-            "coverage": "Parts & labor, depot/mail-in service",
-            "contact": "1-800-426-7378 | support.lenovo.com",
-        },
-    }
-
-    matched_brand = None
-    for key in warranty_db:
-        if key in model_lower:
-            matched_brand = key
-            break
+    authorization is being discussed. Pass serial_number when the user
+    provides it for a device-specific result."""
+    try:
+        w = get_warranty_engine().lookup(model=laptop_model, serial=serial_number)
+    except (OSError, sqlite3.Error, KeyError, ValueError) as exc:
+        logger.error("Warranty data unavailable: %s", exc)
+        return "ERROR: Warranty records are not available right now. Cannot check warranty status."
 
-    if not matched_brand:
+    if not w.found:
         return (
             f"**Warranty Status: Not Found**\n\n"
             f"No warranty record found for model: **{laptop_model}**\n\n"
@@ -167,20 +372,16 @@ def check_warranty_status(laptop_model: str) -> str:
             f"or contact the IT Asset Management team at assets@company.com."
         )
 
-    w = warranty_db[matched_brand]
-    expiry = datetime.datetime.strptime(w["expires"], "%Y-%m-%d")
-    today = datetime.datetime.now()
-    days_remaining = (expiry - today).days
-    status = "Active" if days_remaining > 0 else "Expired"
+    days_remaining = w.days_remaining
     days_label = f"{days_remaining} days remaining" if days_remaining > 0 else f"expired {abs(days_remaining)} days ago"
 
     return (
-        f"**Warranty Status for {laptop_model}**\n\n"
-        f"- **Status**: {status} ({days_label})\n"
-        f"- **Plan**: {w['plan']}\n"
-        f"- **Expiry Date**: {w['expires']}\n"
-        f"- **Coverage**: {w['coverage']}\n"
-        f"- **Support Contact**: {w['contact']}"
+        f"**Warranty Status for {w.model or laptop_model}**\n\n"
+        f"- **Status**: {w.status} ({days_label})\n"
+        f"- **Plan**: {w.plan or 'Unknown'}\n"
+        f"- **Expiry Date**: {w.expires}\n"
+        f"- **Coverage**: {w.coverage or 'Unknown'}\n"
+        f"- **Support Contact**: {w.contact or 'assets@company.com'}"
     )
 
 
@@ -190,8 +391,17 @@ def escalate_to_tier2(issue_summary: str, ticket_id: str = "") -> str:
     Use this when the knowledge base does not contain a solution, when hardware
     replacement is confirmed needed, or when the issue is business-critical.
     Optionally pass an existing ticket_id to link the escalation."""
-    escalation_id = f"ESC-{uuid.uuid4().hex[:6].upper()}"
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
+    try:
+        store = get_ticket_store()
+        linked = store.get(ticket_id) if ticket_id else None
+        escalation = store.create(
+            KIND_ESCALATION, issue_summary, device=linked["device"] if linked else "", linked_ticket_id=ticket_id
+        )
+    except sqlite3.Error as exc:
+        logger.error("Ticket store unavailable: %s", exc)
+        return "ERROR: The ticketing system is not available. Escalate by phone: Extension 4357 (HELP)."
+    escalation_id = escalation["ticket_id"]
+    timestamp = _display_timestamp(escalation["created_at"])
     ticket_ref = f" (linked to `{ticket_id}`)" if ticket_id else ""
 
     return (
@@ -209,6 +419,74 @@ def escalate_to_tier2(issue_summary: str, ticket_id: str = "") -> str:
     )
 
 
+# AgentExecutor's async path already runs the tool calls of one agent step
+# concurrently (asyncio.gather). For that to overlap real work, every tool
+# that can block -- FAISS, SQLite, loading warranty data -- runs on the
+# blocking executor, and each call is bounded by a timeout so one slow
+# backend cannot hold up the whole step.
+
+_TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "15"))
+
+
+def _tool_timeout(name: str) -> float:
+    """TOOL_TIMEOUT_<TOOL NAME> overrides TOOL_TIMEOUT_SECONDS; 0 disables."""
+    return float(os.getenv(f"TOOL_TIMEOUT_{name.upper()}", str(_TOOL_TIMEOUT_SECONDS)))
+
+
+def _attach_coroutine(agent_tool: BaseTool, coroutine=None, offload: bool = False, writes: bool = False) -> None:
+    """Give a sync ``@tool`` a native async implementation.
+
+    Without one, LangChain runs the sync function on the loop's default
+    executor. Tools that only format strings are cheap enough to call inline;
+    ``offload`` runs the sync function on the bounded executor instead, and
+    tools that touch the embedding model or FAISS pass an explicit coroutine.
+    A call that exceeds the tool's timeout returns an ERROR observation so
+    the agent can carry on without it. For a tool that ``writes`` (a ticket,
+    an escalation) the call may still complete in the background, so the
+    observation says the outcome is unknown and must not be retried.
+    """
+    if coroutine is None:
+        sync_func = agent_tool.func
+
+        if offload:
+            async def coroutine(*args, **kwargs):
+                return await run_blocking(sync_func, *args, **kwargs)
+        else:
+            async def coroutine(*args, **kwargs):
+                return sync_func(*args, **kwargs)
+
+    timeout = _tool_timeout(agent_tool.name)
+    if timeout <= 0:
+        agent_tool.coroutine = coroutine
+        return
+    run = coroutine
+
+    async def run_with_timeout(*args, **kwargs):
+        try:
+            return await asyncio.wait_for(run(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            # The executor thread cannot be interrupted; it finishes in the
+            # background and its result is discarded.
+            logger.warning("Tool %s timed out after %.1fs.", agent_tool.name, timeout)
+            display_name = TOOL_DISPLAY_NAMES[agent_tool.name]
+            if writes:
+                return (
+                    f"{display_name} is still running after {timeout:g} seconds; it may yet succeed. "
+                    f"Do NOT call {agent_tool.name} again for this issue, as that could create a duplicate. "
+                    "Tell the user the request was submitted and is still being processed, and that it "
+                    "will appear in their ticket list once it completes."
+                )
+            return f"ERROR: {display_name} did not respond within {timeout:g} seconds."
+
+    agent_tool.coroutine = run_with_timeout
+
+
+_attach_coroutine(search_it_knowledge_base, _asearch_it_knowledge_base)
+_attach_coroutine(create_support_ticket, offload=True, writes=True)
+_attach_coroutine(check_warranty_status, offload=True)
+_attach_coroutine(escalate_to_tier2, offload=True, writes=True)
+
+
 # ---------------------------------------------------------------------------
 # AGENT SYSTEM PROMPT
 # ---------------------------------------------------------------------------
@@ -217,7 +495,7 @@ AGENT_SYSTEM_PROMPT = """You are **SkillPalavar IT Assistant** — an expert Age
 
 ## YOUR TOOLS & WHEN TO USE THEM
 
-1. **search_it_knowledge_base** — ALWAYS call this first for any technical issue. Search with the issue description and laptop model for best results.
+1. **search_it_knowledge_base** — ALWAYS call this first for any technical issue. Search with the issue description, and pass the laptop model as `laptop_model` to limit results to that model's documentation.
 2. **create_support_ticket** — Create a ticket for EVERY reported issue after you have the issue details and laptop model. Set priority based on severity (Critical = cannot work at all, High = major function broken, Medium = degraded performance, Low = cosmetic or minor).
 3. **check_warranty_status** — Call this whenever hardware repair or part replacement is mentioned or recommended by the knowledge base.
 4. **escalate_to_tier2** — Use when: the knowledge base has no solution, hardware failure is confirmed, or the issue is business-critical and unresolved.
@@ -237,59 +515,184 @@ AGENT_SYSTEM_PROMPT = """You are **SkillPalavar IT Assistant** — an expert Age
 # ---------------------------------------------------------------------------
 
 
-def get_llm() -> ChatGoogleGenerativeAI:
+# Every agent shares one client (and its connections) behind one call
+# policy: per-call timeout, jittered retries, a circuit breaker and a cap on
+# concurrent calls (see llm_client). LLM_PROVIDER=fake swaps Gemini for a
+# deterministic local model, so the whole agent path runs offline.
+
+GEMINI_MODEL = "gemini-2.5-flash"
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()  # gemini | fake
+
+_llm: ManagedChatModel | None = None
+
+
+def get_llm_info() -> dict:
+    """The configured LLM provider and model."""
+    return {"provider": LLM_PROVIDER, "model": "fake" if LLM_PROVIDER == "fake" else GEMINI_MODEL}
+
+
+def _create_chat_model(timeout: float) -> BaseChatModel:
+    if LLM_PROVIDER == "fake":
+        return FakeSupportLLM(
+            latency_seconds=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")) / 1000,
+            token_delay_seconds=float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "0")) / 1000,
+            find_model=lambda text: get_warranty_engine().find_model(text),
+        )
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY environment variable is not set.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
+        model=GEMINI_MODEL,
         google_api_key=api_key,
         temperature=0.1,
+        timeout=timeout or None,
+        # Retries are the policy's job; one attempt per call here.
+        max_retries=1,
     )
 
 
+def get_llm() -> ManagedChatModel:
+    """Return the shared, policy-managed chat model."""
+    global _llm
+    if _llm is None:
+        timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+        policy = LLMCallPolicy(
+            timeout_seconds=timeout,
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            backoff_seconds=float(os.getenv("LLM_BACKOFF_SECONDS", "0.5")),
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "16")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            ),
+        )
+        model_name = get_llm_info()["model"]
+        _llm = ManagedChatModel(model=_create_chat_model(timeout), policy=policy, model_name=model_name)
+        logger.info("LLM client ready (%s, timeout=%ss, max_in_flight=%d).", model_name, timeout, policy.max_in_flight)
+    return _llm
+
+
+def get_llm_stats() -> dict | None:
+    """Call counters and breaker state of the LLM client, or None before use."""
+    if _llm is None:
+        return None
+    return {"model": _llm.model_name, **_llm.policy.stats()}
+
+
 # ---------------------------------------------------------------------------
 # VECTOR STORE INITIALIZATION
 # ---------------------------------------------------------------------------
 
-def initialize_vector_store() -> FAISS:
-    global _vector_store
-    embeddings = get_embeddings()
-    index_file = os.path.join(FAISS_INDEX_DIR, "index.faiss")
-
-    if os.path.exists(index_file):
-        logger.info("Loading existing FAISS index from '%s'...", FAISS_INDEX_DIR)
-        vs = FAISS.load_local(
-            FAISS_INDEX_DIR,
-            embeddings,
-            allow_dangerous_deserialization=True,
-        )
-        logger.info("FAISS index loaded successfully.")
-        _vector_store = vs
-        return vs
-
-    logger.info("No existing FAISS index. Building from mock documents...")
-    raw_documents = [
+def load_knowledge_base_documents() -> list[Document]:
+    """Raw knowledge base documents, one per source, before chunking."""
+    return [
         Document(page_content=doc_text, metadata={"source": f"mock_doc_{idx}"})
         for idx, doc_text in enumerate(MOCK_IT_DOCUMENTS)
     ]
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=150,
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""],
-    )
-    chunks = text_splitter.split_documents(raw_documents)
-    logger.info("Split %d raw documents into %d chunks.", len(raw_documents), len(chunks))
 
-    vs = FAISS.from_documents(documents=chunks, embedding=embeddings)
-    os.makedirs(FAISS_INDEX_DIR, exist_ok=True)
-    vs.save_local(FAISS_INDEX_DIR)
-    logger.info("FAISS index saved at '%s' with %d chunks.", FAISS_INDEX_DIR, len(chunks))
+
+def initialize_vector_store(index_config: IndexConfig | None = None) -> KnowledgeBaseStore:
+    """
+    Load or build the knowledge base vector store. The index type defaults
+    to FAISS_INDEX_TYPE (flat | hnsw | ivf | sq8 | ivfpq) and related FAISS_*
+    env vars. Model/category posting lists and, in hybrid search mode, a
+    BM25 index over the same chunks are loaded alongside a prebuilt index,
+    or built from its chunks.
+    """
+    global _vector_store, _lexical_index, _metadata_index
+    index_config = index_config or IndexConfig.from_env()
+    prebuilt_dir = None
+    if is_prebuilt_index(FAISS_INDEX_DIR):
+        # Built offline by ingest.py; the server never re-embeds it.
+        vs = load_prebuilt_vector_store(FAISS_INDEX_DIR, get_embeddings(), EMBEDDING_MODEL, index_config)
+        prebuilt_dir = FAISS_INDEX_DIR
+    else:
+        vs = sync_vector_store(
+            FAISS_INDEX_DIR,
+            load_knowledge_base_documents(),
+            get_embeddings(),
+            EMBEDDING_MODEL,
+            index_config,
+        )
+    logger.info("Vector index memory: %s", memory_report(vs))
+    _metadata_index = _load_prebuilt(MetadataIndex, prebuilt_dir, PREBUILT_METADATA_DIR, vs)
+    if _metadata_index is None:
+        _metadata_index = build_metadata_index(vs)
+    _lexical_index = None
+    if KB_SEARCH_MODE == "hybrid":
+        _lexical_index = _load_prebuilt(LexicalIndex, prebuilt_dir, PREBUILT_LEXICAL_DIR, vs)
+        if _lexical_index is None:
+            _lexical_index = build_lexical_index(vs)
+    if _lexical_index is not None:
+        # "T14s" or "i7-1365U" in a question is context, not an exact-match token.
+        _lexical_index.model_words = _metadata_index.words("model")
     _vector_store = vs
     return vs
 
 
+def _iter_chunks(vs: KnowledgeBaseStore) -> Iterator[Document]:
+    for i in range(vs.index.ntotal):
+        yield vs.docstore.search(vs.index_to_docstore_id[i])
+
+
+def _load_prebuilt(index_cls, index_dir: str | None, name: str, vs: KnowledgeBaseStore):
+    """The ``index_cls`` ingest.py saved under ``index_dir``, or None if
+    there is none (or it does not cover the loaded chunks)."""
+    if index_dir is None or not index_cls.exists(os.path.join(index_dir, name)):
+        return None
+    index = index_cls.load(os.path.join(index_dir, name))
+    if index.size != vs.index.ntotal:
+        logger.warning(
+            "Prebuilt %s index covers %d chunks, the vector index %d; rebuilding it.",
+            name, index.size, vs.index.ntotal,
+        )
+        return None
+    logger.info("Prebuilt %s index loaded (%d chunks).", name, index.size)
+    return index
+
+
+def build_lexical_index(vs: KnowledgeBaseStore) -> LexicalIndex:
+    """BM25 index over the chunks of ``vs``, addressed by FAISS position."""
+    return LexicalIndex.build(doc.page_content for doc in _iter_chunks(vs))
+
+
+def build_metadata_index(vs: KnowledgeBaseStore) -> MetadataIndex:
+    """Model / category posting lists over the chunks of ``vs``."""
+    return MetadataIndex.build(doc.metadata for doc in _iter_chunks(vs))
+
+
+def get_vector_store_report() -> dict | None:
+    """Size and compression of the loaded vector index, or None before startup."""
+    if _vector_store is None:
+        return None
+    report = memory_report(_vector_store)
+    if _lexical_index is not None:
+        report["lexical"] = _lexical_index.stats()
+    if _metadata_index is not None:
+        report["metadata_values"] = _metadata_index.stats()
+    return report
+
+
+_WARM_UP_QUERY = "laptop screen flickering after a driver update"
+
+
+def warm_up() -> None:
+    """
+    Run one dummy query through the embedding model and the vector index and
+    create the shared caches, so the first request does not pay for the
+    model's first forward pass or for paging the index in. The query goes
+    around the query-embedding cache and the metrics.
+    """
+    vector = get_query_embedder().base_embeddings.embed_query(_WARM_UP_QUERY)
+    if _vector_store is not None:
+        _vector_store.search_vectors(np.asarray([vector], dtype="float32"), 3)
+    get_response_cache()
+    get_embedding_batcher()
+    get_intent_router()
+
+
 # ---------------------------------------------------------------------------
 # AGENT EXECUTOR BUILDER
 # ---------------------------------------------------------------------------
@@ -307,9 +710,10 @@ TOOL_DISPLAY_NAMES = {
     "check_warranty_status": "Checking Warranty Status",
     "escalate_to_tier2": "Escalating to Tier 2",
 }
+_TOOLS_BY_NAME = {t.name: t for t in AGENT_TOOLS}
 
 
-def build_agent_executor(vector_store: FAISS) -> AgentExecutor:
+def build_agent_executor(vector_store: KnowledgeBaseStore) -> AgentExecutor:
     global _vector_store
     _vector_store = vector_store
     llm = get_llm()
@@ -317,6 +721,7 @@ def build_agent_executor(vector_store: FAISS) -> AgentExecutor:
     prompt = ChatPromptTemplate.from_messages([
         ("system", AGENT_SYSTEM_PROMPT),
         MessagesPlaceholder(variable_name="chat_history", optional=True),
+        MessagesPlaceholder(variable_name="kb_context", optional=True),
         ("human", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
@@ -325,58 +730,526 @@ def build_agent_executor(vector_store: FAISS) -> AgentExecutor:
     executor = AgentExecutor(
         agent=agent,
         tools=AGENT_TOOLS,
-        verbose=True,
+        # Per-stage timings are in the request traces (see telemetry).
+        verbose=os.getenv("AGENT_VERBOSE", "off").lower() == "on",
         max_iterations=6,
         handle_parsing_errors=True,
+        return_intermediate_steps=True,
     )
     logger.info("AgentExecutor built with %d tools: %s", len(AGENT_TOOLS), [t.name for t in AGENT_TOOLS])
     return executor
 
 
+# ---------------------------------------------------------------------------
+# RESPONSE CACHE
+# ---------------------------------------------------------------------------
+# Repeated support questions are answered from a cache instead of a full
+# agent run. Responses produced by tools with side effects (tickets,
+# escalations) are never stored: replaying them would hand out a ticket ID
+# that was created for someone else.
+
+_NON_CACHEABLE_TOOLS = {
+    TOOL_DISPLAY_NAMES["create_support_ticket"],
+    TOOL_DISPLAY_NAMES["escalate_to_tier2"],
+}
+
+_response_cache: ResponseCache | None = None
+_response_cache_configured = False
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Return the shared response cache, or None when RESPONSE_CACHE_MODE=off."""
+    global _response_cache, _response_cache_configured
+    if not _response_cache_configured:
+        mode = os.getenv("RESPONSE_CACHE_MODE", "semantic").lower()
+        if mode != "off":
+            _response_cache = ResponseCache(
+                embeddings=get_query_embedder() if mode == "semantic" else None,
+                semantic=mode == "semantic",
+                similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+                ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+                max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+                max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_MB", "32")) * 1024 * 1024,
+            )
+            logger.info("Response cache enabled (mode=%s).", mode)
+        _response_cache_configured = True
+    return _response_cache
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters for the in-process caches that are in use. Never
+    creates one, so reading stats does not load the embedding model."""
+    stats = {}
+    if _query_embedder is not None:
+        stats["query_embeddings"] = _query_embedder.stats()
+    if _embedding_batcher is not None:
+        stats["search_batches"] = _embedding_batcher.stats()
+    cache = _response_cache
+    if cache is not None:
+        stats["responses"] = {**vars(cache.stats), "entries": len(cache), "bytes": cache.size_bytes}
+    if KB_PREFETCH_MODE != "off":
+        stats["kb_prefetch"] = {"mode": KB_PREFETCH_MODE, **_prefetch_counts}
+    return stats
+
+
+def _is_cacheable(response_text: str, tools_used: list[str]) -> bool:
+    if response_text in (_EMPTY_AGENT_RESPONSE, _AGENT_ERROR_RESPONSE):
+        return False
+    return not _NON_CACHEABLE_TOOLS.intersection(tools_used)
+
+
+def _cache_lookup(user_message: str, chat_history: list[dict] | None) -> tuple[str, list[str]] | None:
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    return cache.lookup(user_message, chat_history)
+
+
+def _cache_store(
+    user_message: str,
+    chat_history: list[dict] | None,
+    response_text: str,
+    tools_used: list[str],
+) -> None:
+    cache = get_response_cache()
+    if cache is not None and _is_cacheable(response_text, tools_used):
+        cache.store(user_message, chat_history, response_text, tools_used)
+
+
+# ---------------------------------------------------------------------------
+# CONVERSATION SESSIONS
+# ---------------------------------------------------------------------------
+# History is held server-side, so a turn carries only the new message and the
+# prompt's message objects are appended to instead of rebuilt. The prompt
+# history is kept within HISTORY_TOKEN_BUDGET by folding old turns into a
+# rolling summary (see history_compactor).
+
+_session_store: SessionStore | None = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore(
+            max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")),
+            idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800")),
+            max_messages=int(os.getenv("SESSION_MAX_MESSAGES", "100")),
+            spill_dir=os.getenv("SESSION_SPILL_DIR") or None,
+            spill_ttl_seconds=float(os.getenv("SESSION_SPILL_TTL_SECONDS", str(7 * 86400))),
+            token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "2000")),
+            max_response_tokens=int(os.getenv("HISTORY_MAX_RESPONSE_TOKENS", "300")),
+        )
+    return _session_store
+
+
+def close_session_store() -> None:
+    """Spill in-memory sessions to disk (if SESSION_SPILL_DIR is set)."""
+    global _session_store
+    if _session_store is not None:
+        _session_store.close()
+        _session_store = None
+
+
+def _finish_turn(
+    session: ChatSession | None,
+    user_message: str,
+    chat_history: list[dict] | None,
+    response_text: str,
+    tools_used: list[str],
+    cacheable: bool = True,
+) -> None:
+    if cacheable:
+        _cache_store(user_message, chat_history, response_text, tools_used)
+    if session is not None and response_text not in (_EMPTY_AGENT_RESPONSE, _AGENT_ERROR_RESPONSE):
+        get_session_store().record_turn(session, user_message, response_text)
+
+
+# ---------------------------------------------------------------------------
+# INTENT ROUTER
+# ---------------------------------------------------------------------------
+# Single-tool requests (a warranty check, "create a ticket for ...",
+# "escalate INC-...") are answered by calling the tool directly instead of
+# running the agent. Every response reports the path that served it.
+
+ROUTE_AGENT = "agent"
+ROUTE_CACHE = "cache"
+ROUTE_ROUTER_PREFIX = "router:"
+
+_ROUTER_ENABLED = os.getenv("INTENT_ROUTER", "on").lower() != "off"
+_intent_router: IntentRouter | None = None
+_route_counts: Counter = Counter()
+
+
+def get_intent_router() -> IntentRouter | None:
+    """Return the shared intent router, or None when INTENT_ROUTER=off."""
+    global _intent_router
+    if _ROUTER_ENABLED and _intent_router is None:
+        _intent_router = IntentRouter(lambda text: get_warranty_engine().find_model(text))
+    return _intent_router
+
+
+def get_route_stats() -> dict:
+    """How many requests each path (agent, cache, router:<intent>) served."""
+    return dict(_route_counts)
+
+
+def _route(user_message: str) -> RoutedIntent | None:
+    router = get_intent_router()
+    if router is None:
+        return None
+    try:
+        return router.route(user_message)
+    except (OSError, sqlite3.Error, KeyError, ValueError) as exc:
+        # Model matching needs the warranty data; without it the agent decides.
+        logger.warning("Intent router unavailable: %s", exc)
+        return None
+
+
+def _run_routed(routed: RoutedIntent) -> tuple[str, list[str]] | None:
+    """Call the routed tool. None hands the request to the agent: a ticket
+    to escalate that does not exist, or a tool reporting an outage."""
+    args = dict(routed.args)
+    if routed.intent == INTENT_ESCALATION and not args["issue_summary"]:
+        ticket = get_ticket_store().get(args["ticket_id"])
+        if ticket is None:
+            return None
+        args["issue_summary"] = ticket["issue_summary"]
+    output = _TOOLS_BY_NAME[routed.tool].invoke(args)
+    if output.startswith("ERROR:"):
+        return None
+    return output, [TOOL_DISPLAY_NAMES[routed.tool]]
+
+
+# ---------------------------------------------------------------------------
+# KNOWLEDGE BASE PREFETCH
+# ---------------------------------------------------------------------------
+# The search the agent is about to ask for is started while its first LLM
+# call is still planning (see kb_prefetch). KB_PREFETCH=inject also puts the
+# results in the prompt, so the agent skips that planning call altogether.
+
+KB_PREFETCH_MODE = os.getenv("KB_PREFETCH", "on").lower()  # on | inject | off
+
+_kb_prefetch: ContextVar[KBPrefetch | None] = ContextVar("kb_prefetch", default=None)
+_prefetch_counts: Counter = Counter()
+
+
+async def _prefetch_search(query: str, laptop_model: str) -> str | None:
+    try:
+        with span("kb_prefetch"):
+            result = await _asearch_kb(query, laptop_model)
+    except Exception as exc:
+        logger.warning("Knowledge base prefetch failed: %s", exc)
+        return None
+    return None if result.startswith("ERROR:") else result
+
+
+def _start_kb_prefetch(user_message: str, chat_history: list[dict] | None) -> KBPrefetch | None:
+    """Start the search for this turn; agent searches in the current context
+    that match it are answered from it."""
+    if KB_PREFETCH_MODE == "off" or _vector_store is None:
+        return None
+    try:
+        target = prefetch_query(user_message, chat_history, get_warranty_engine().find_model)
+    except (OSError, sqlite3.Error, KeyError, ValueError) as exc:
+        logger.warning("Knowledge base prefetch unavailable: %s", exc)
+        return None
+    if target is None:
+        return None
+    query, laptop_model = target
+    prefetch = KBPrefetch(query, laptop_model, _prefetch_search(query, laptop_model))
+    _kb_prefetch.set(prefetch)
+    _prefetch_counts["started"] += 1
+    return prefetch
+
+
+def _end_kb_prefetch(prefetch: KBPrefetch | None) -> None:
+    _kb_prefetch.set(None)
+    if prefetch is not None:
+        if not prefetch.served:
+            _prefetch_counts["unused"] += 1
+        prefetch.discard()
+
+
+async def _inject_kb_prefetch(invoke_input: dict, prefetch: KBPrefetch | None) -> bool:
+    """With KB_PREFETCH=inject, wait for the prefetch and add its results to
+    the prompt. Returns whether they were added."""
+    if prefetch is None or KB_PREFETCH_MODE != "inject":
+        return False
+    try:
+        timeout = _tool_timeout(search_it_knowledge_base.name) or None
+        result = await asyncio.wait_for(prefetch.result(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    if result is None:
+        return False
+    invoke_input["kb_context"] = [SystemMessage(content=(
+        f"search_it_knowledge_base has already been called for the user's latest message "
+        f"(laptop model: {prefetch.laptop_model}). Results:\n\n{result}\n\n"
+        "Use these results instead of searching again. Call search_it_knowledge_base only "
+        "for information they do not cover."
+    ))]
+    _prefetch_counts["injected"] += 1
+    return True
+
+
+def _with_injected_search(tools_used: list[str]) -> list[str]:
+    display = TOOL_DISPLAY_NAMES[search_it_knowledge_base.name]
+    return [display, *(name for name in tools_used if name != display)]
+
+
 # ---------------------------------------------------------------------------
 # MAIN INFERENCE FUNCTION
 # ---------------------------------------------------------------------------
 
+def _build_invoke_input(
+    user_message: str,
+    chat_history: list[dict] | None,
+    session: ChatSession | None = None,
+) -> dict:
+    invoke_input: dict = {"input": user_message}
+    if session is None and chat_history:
+        # Stateless callers get the same budget as sessions.
+        session = get_session_store().new_session(chat_history)
+    messages = session.messages if session is not None else None
+    if messages:
+        invoke_input["chat_history"] = messages
+    return invoke_input
+
+
+_EMPTY_AGENT_RESPONSE = "I was unable to generate a response. Please rephrase your question."
+
+
+def _parse_agent_result(result: dict) -> tuple[str, list[str]]:
+    response_text = result.get("output", "")
+
+    tools_used: list[str] = []
+    for action, _ in result.get("intermediate_steps", []):
+        raw_name = getattr(action, "tool", None)
+        display = TOOL_DISPLAY_NAMES.get(raw_name, raw_name)
+        if display and display not in tools_used:
+            tools_used.append(display)
+
+    if not response_text:
+        response_text = _EMPTY_AGENT_RESPONSE
+
+    return response_text, tools_used
+
+
+_AGENT_ERROR_RESPONSE = (
+    "I'm experiencing a technical issue and cannot process your request right now. "
+    "Please try again or contact Tier 2 IT Support at extension 4357."
+)
+
+
 def get_agent_response(
     agent_executor: AgentExecutor,
     user_message: str,
     chat_history: list[dict] | None = None,
-) -> tuple[str, list[str]]:
+    session: ChatSession | None = None,
+) -> tuple[str, list[str], str]:
     """
-    Run the user message through the agent executor.
-    Returns (response_text, list_of_tool_display_names_used).
+    Answer the user message through the intent router, the response cache
+    or the agent executor, in that order.
+    Returns (response_text, list_of_tool_display_names_used, route) where
+    route is "router:<intent>", "cache" or "agent".
+
+    With a ``session`` its stored history is used (``chat_history`` is
+    ignored) and the exchange is appended to it.
     """
+    if session is not None:
+        chat_history = session.history
+    route = ROUTE_AGENT
+    trace = begin_request()
     try:
-        invoke_input: dict = {"input": user_message}
-        if chat_history:
-            lc_history = []
-            for msg in chat_history:
-                if msg.get("role") == "user":
-                    lc_history.append(HumanMessage(content=msg["content"]))
-                elif msg.get("role") == "bot":
-                    lc_history.append(AIMessage(content=msg["content"]))
-            if lc_history:
-                invoke_input["chat_history"] = lc_history
-
-        result = agent_executor.invoke(invoke_input)
-        response_text = result.get("output", "")
-
-        tools_used: list[str] = []
-        for action, _ in result.get("intermediate_steps", []):
-            raw_name = getattr(action, "tool", None)
-            display = TOOL_DISPLAY_NAMES.get(raw_name, raw_name)
-            if display and display not in tools_used:
-                tools_used.append(display)
-
-        if not response_text:
-            response_text = "I was unable to generate a response. Please rephrase your question."
-
-        return response_text, tools_used
-
+        routed = _route(user_message)
+        answer = _run_routed(routed) if routed is not None else None
+        if answer is not None:
+            route = ROUTE_ROUTER_PREFIX + routed.intent
+        else:
+            answer = _cache_lookup(user_message, chat_history)
+            if answer is not None:
+                route = ROUTE_CACHE
+            else:
+                answer = _parse_agent_result(
+                    agent_executor.invoke(_build_invoke_input(user_message, chat_history, session))
+                )
+        response_text, tools_used = answer
+        _finish_turn(session, user_message, chat_history, response_text, tools_used, route == ROUTE_AGENT)
     except Exception as exc:
         logger.error("Error during agent execution: %s", exc, exc_info=True)
-        return (
-            "I'm experiencing a technical issue and cannot process your request right now. "
-            "Please try again or contact Tier 2 IT Support at extension 4357.",
-            [],
+        response_text, tools_used = _AGENT_ERROR_RESPONSE, []
+    _route_counts[route] += 1
+    end_request(trace, route)
+    return response_text, tools_used, route
+
+
+async def _arun_agent(
+    agent_executor: AgentExecutor,
+    user_message: str,
+    chat_history: list[dict] | None,
+    session: ChatSession | None,
+) -> tuple[str, list[str]]:
+    prefetch = _start_kb_prefetch(user_message, chat_history)
+    try:
+        invoke_input = _build_invoke_input(user_message, chat_history, session)
+        injected = await _inject_kb_prefetch(invoke_input, prefetch)
+        response_text, tools_used = _parse_agent_result(await agent_executor.ainvoke(invoke_input))
+    finally:
+        _end_kb_prefetch(prefetch)
+    if injected:
+        tools_used = _with_injected_search(tools_used)
+    return response_text, tools_used
+
+
+async def aget_agent_response(
+    agent_executor: AgentExecutor,
+    user_message: str,
+    chat_history: list[dict] | None = None,
+    session: ChatSession | None = None,
+) -> tuple[str, list[str], str]:
+    """
+    Async counterpart of get_agent_response. LLM calls use the Gemini async
+    client and tools run through their coroutines, so the event loop is never
+    blocked for the duration of the agent loop.
+    """
+    if session is not None:
+        chat_history = session.history
+    route = ROUTE_AGENT
+    trace = begin_request()
+    try:
+        routed = _route(user_message)
+        answer = await run_blocking(_run_routed, routed) if routed is not None else None
+        if answer is not None:
+            route = ROUTE_ROUTER_PREFIX + routed.intent
+        else:
+            answer = await run_blocking(_cache_lookup, user_message, chat_history)
+            if answer is not None:
+                route = ROUTE_CACHE
+            else:
+                answer = await _arun_agent(agent_executor, user_message, chat_history, session)
+        response_text, tools_used = answer
+        await run_blocking(
+            _finish_turn, session, user_message, chat_history, response_text, tools_used, route == ROUTE_AGENT,
         )
+    except Exception as exc:
+        logger.error("Error during agent execution: %s", exc, exc_info=True)
+        response_text, tools_used = _AGENT_ERROR_RESPONSE, []
+    _route_counts[route] += 1
+    end_request(trace, route)
+    return response_text, tools_used, route
+
+
+def _chunk_text(chunk) -> str:
+    """Extract plain text from a streamed chat model chunk.
+
+    Gemini can return content either as a string or as a list of parts.
+    """
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+async def astream_agent_response(
+    agent_executor: AgentExecutor,
+    user_message: str,
+    chat_history: list[dict] | None = None,
+    session: ChatSession | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Stream the agent run as a sequence of event dicts:
+
+    - ``{"type": "tool_start", "tool": <display name>}``
+    - ``{"type": "tool_end", "tool": <display name>}``
+    - ``{"type": "token", "content": <text>}`` for every LLM text chunk
+    - ``{"type": "done", "response": <final text>, "tool_calls": [...], "route": ...}``
+    - ``{"type": "error", "response": <fallback text>}`` if the run fails
+
+    Token events from an intermediate LLM round (one that ends in tool calls)
+    may precede a tool_start; the ``done`` event carries the authoritative
+    final response and the path that served it (see get_agent_response).
+    """
+    if session is not None:
+        chat_history = session.history
+    root_run_id = None
+    trace = begin_request()
+    try:
+        routed = _route(user_message)
+        if routed is not None:
+            answer = await run_blocking(_run_routed, routed)
+            if answer is not None:
+                # Announced only once it answers: on fall-through the agent
+                # reports the tools it uses itself.
+                display = TOOL_DISPLAY_NAMES[routed.tool]
+                yield {"type": "tool_start", "tool": display}
+                yield {"type": "tool_end", "tool": display}
+                response_text, tools_used = answer
+                route = ROUTE_ROUTER_PREFIX + routed.intent
+                await run_blocking(_finish_turn, session, user_message, chat_history, response_text, tools_used, False)
+                _route_counts[route] += 1
+                end_request(trace, route)
+                yield {"type": "done", "response": response_text, "tool_calls": tools_used, "route": route}
+                return
+
+        cached = await run_blocking(_cache_lookup, user_message, chat_history)
+        if cached is not None:
+            response_text, tools_used = cached
+            await run_blocking(_finish_turn, session, user_message, chat_history, response_text, tools_used, False)
+            _route_counts[ROUTE_CACHE] += 1
+            end_request(trace, ROUTE_CACHE)
+            yield {"type": "done", "response": response_text, "tool_calls": tools_used, "route": ROUTE_CACHE}
+            return
+
+        prefetch = _start_kb_prefetch(user_message, chat_history)
+        try:
+            invoke_input = _build_invoke_input(user_message, chat_history, session)
+            injected = False
+            if prefetch is not None and KB_PREFETCH_MODE == "inject":
+                display = TOOL_DISPLAY_NAMES[search_it_knowledge_base.name]
+                yield {"type": "tool_start", "tool": display}
+                injected = await _inject_kb_prefetch(invoke_input, prefetch)
+                yield {"type": "tool_end", "tool": display}
+
+            async for event in agent_executor.astream_events(invoke_input, version="v2"):
+                kind = event["event"]
+                if root_run_id is None:
+                    root_run_id = event["run_id"]
+
+                if kind == "on_chat_model_stream":
+                    text = _chunk_text(event["data"].get("chunk"))
+                    if text:
+                        yield {"type": "token", "content": text}
+                elif kind in ("on_tool_start", "on_tool_end"):
+                    display = TOOL_DISPLAY_NAMES.get(event["name"], event["name"])
+                    yield {"type": kind[3:], "tool": display}
+                elif kind == "on_chain_end" and event["run_id"] == root_run_id:
+                    response_text, tools_used = _parse_agent_result(event["data"].get("output") or {})
+                    if injected:
+                        tools_used = _with_injected_search(tools_used)
+                    await run_blocking(_finish_turn, session, user_message, chat_history, response_text, tools_used)
+                    _route_counts[ROUTE_AGENT] += 1
+                    end_request(trace, ROUTE_AGENT)
+                    yield {"type": "done", "response": response_text, "tool_calls": tools_used, "route": ROUTE_AGENT}
+        finally:
+            _end_kb_prefetch(prefetch)
+
+    except Exception as exc:
+        logger.error("Error during streamed agent execution: %s", exc, exc_info=True)
+        _route_counts[ROUTE_AGENT] += 1
+        end_request(trace, ROUTE_AGENT)
+        yield {"type": "error", "response": _AGENT_ERROR_RESPONSE}
+
+
+# ---------------------------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------------------------
+# Request, stage, LLM and tool timings are recorded by telemetry as they
+# happen; the counters kept above are exported from here at scrape time.
+
+register_stats(caches=get_cache_stats, routes=get_route_stats, llm_client=get_llm_stats)
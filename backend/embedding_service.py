@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+
+def _query_key(text: str) -> str:
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    Bounded LRU cache from query text to embedding vector.
+
+    Wraps any LangChain ``Embeddings`` and can be used in its place. Only
+    ``embed_query`` is cached: document embedding happens at index build time
+    where inputs do not repeat. Returned vectors are shared between callers
+    and must not be mutated.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 4096):
+        self._embeddings = embeddings
+        self.max_entries = max_entries
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def base_embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    def get(self, text: str) -> list[float] | None:
+        key = _query_key(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, vector: list[float]) -> None:
+        key = _query_key(text)
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.get(text)
+        if vector is None:
+            vector = self._embeddings.embed_query(text)
+            self.put(text, vector)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class EmbeddingBatcher:
+    """
+    Cross-request micro-batcher for knowledge base searches.
+
+    Concurrent ``search`` calls are collected for up to ``max_wait_ms`` (or
+    until ``max_batch_size`` queries are waiting), then handled together on
+    the blocking executor: cache misses are encoded in a single
+    ``embed_documents`` call and the query vectors go through one batched
+    vector search per distinct ``subset`` (metadata filter) in the batch.
+    Under load the per-query cost falls as the batch fills; an idle server
+    pays at most ``max_wait_ms`` of extra latency.
+
+    ``search_by_vectors(matrix, k, queries, subset)`` must return one result
+    list per row; it also receives the query texts so it can fuse lexical
+    results. Searches share a FAISS call when they pass the same subset
+    object, so callers should reuse the array for a given filter.
+    ``run_blocking(func, *args)`` runs a sync callable off the event loop.
+    """
+
+    def __init__(
+        self,
+        embedder: QueryEmbeddingCache,
+        search_by_vectors: Callable[[np.ndarray, int, list[str], np.ndarray | None], list[list]],
+        run_blocking: Callable[..., Awaitable],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self._embedder = embedder
+        self._search_by_vectors = search_by_vectors
+        self._run_blocking = run_blocking
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._pending: list[tuple[str, int, np.ndarray | None, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # The loop only keeps weak references to tasks; a batch task nobody
+        # holds could be collected mid-flight and strand its futures.
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.queries = 0
+        self.encoded = 0
+
+    async def search(self, query: str, k: int = 3, subset: np.ndarray | None = None) -> list:
+        """Top ``k`` results for ``query``, only among ``subset`` if given."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, k, subset, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, int, np.ndarray | None, asyncio.Future]]) -> None:
+        items = [(query, k, subset) for query, k, subset, _ in batch]
+        try:
+            results = await self._run_blocking(self._process, items)
+        except Exception as exc:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _process(self, items: list[tuple[str, int, np.ndarray | None]]) -> list[list]:
+        vectors: list[list[float] | None] = [self._embedder.get(query) for query, _, _ in items]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            # Deduplicate within the batch so identical concurrent queries
+            # are encoded once.
+            unique_texts = list(dict.fromkeys(items[i][0] for i in missing))
+            with span("embed_query"):
+                encoded = self._embedder.base_embeddings.embed_documents(unique_texts)
+            by_text = dict(zip(unique_texts, encoded))
+            for text, vec in by_text.items():
+                self._embedder.put(text, vec)
+            for i in missing:
+                vectors[i] = by_text[items[i][0]]
+            self.encoded += len(unique_texts)
+
+        matrix = np.asarray(vectors, dtype="float32")
+        groups: dict[int, list[int]] = {}
+        for i, (_, _, subset) in enumerate(items):
+            groups.setdefault(id(subset), []).append(i)
+        results: list[list] = [[] for _ in items]
+        for rows in groups.values():
+            subset = items[rows[0]][2]
+            max_k = max(items[i][1] for i in rows)
+            found = self._search_by_vectors(matrix[rows], max_k, [items[i][0] for i in rows], subset)
+            for i, result in zip(rows, found):
+                results[i] = result[:items[i][1]]
+        self.batches += 1
+        self.queries += len(items)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "encoded": self.encoded,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
@@ -0,0 +1,173 @@
+"""
+Deterministic stand-in for Gemini, for offline runs and load tests.
+
+``FakeSupportLLM`` follows the tool chain the system prompt asks for: it
+asks for the laptop model when none has been mentioned, otherwise searches
+the knowledge base, creates a ticket and answers with the steps the search
+returned. A how-to question ("How do I ...?") reports no issue, so it gets
+an answer without a ticket. The same conversation always produces the same calls and the same
+answer. ``latency_seconds`` is slept before every response (and
+``token_delay_seconds`` between streamed words) to stand in for the
+network round trip.
+"""
+
+import asyncio
+import json
+import re
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_SEARCH = "search_it_knowledge_base"
+_TICKET = "create_support_ticket"
+_STEP_RE = re.compile(r"^\s*(?:\d+[.)]|[-*])\s+(.+)$", re.M)
+# Steps are taken from the fix section of a guide when it has one.
+_FIX_HEADING_RE = re.compile(r"^.*(?:troubleshooting|resolution|solution|steps).*:\s*$", re.I | re.M)
+_TICKET_ID_RE = re.compile(r"\bINC-[A-Z0-9]+\b")
+_HOW_TO_RE = re.compile(r"^\s*(?:how|what|where|which)\b[^\n]*\?\s*$", re.I)
+_MAX_STEPS = 5
+
+ASK_FOR_MODEL = (
+    "To help you with this, I need to know which laptop you are using. "
+    "Please tell me the **make and model** (for example, *Lenovo ThinkPad T14s Gen 3*)."
+)
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+class FakeSupportLLM(BaseChatModel):
+    """``find_model`` returns the laptop model mentioned in a text, or None.
+    Without one every message is assumed to name a model."""
+
+    latency_seconds: float = 0.0
+    token_delay_seconds: float = 0.0
+    create_tickets: bool = True
+    find_model: Callable[[str], str | None] | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-support"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeSupportLLM":
+        # The script only calls tools the agent is known to have.
+        return self
+
+    # -- script --------------------------------------------------------------
+
+    def _model_in(self, messages: list[BaseMessage]) -> str | None:
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                if self.find_model is None:
+                    return ""
+                model = self.find_model(_text(message))
+                if model:
+                    return model
+        return None
+
+    def respond(self, messages: list[BaseMessage]) -> AIMessage:
+        """The next message of the script for this conversation."""
+        turn = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        question = _text(messages[turn]) if turn >= 0 else ""
+        step = messages[turn + 1:]
+        called = {call["name"] for m in step if isinstance(m, AIMessage) for call in m.tool_calls}
+        results = {}
+        for m in step:
+            if isinstance(m, ToolMessage):
+                results[m.additional_kwargs.get("name") or m.name or ""] = _text(m)
+        # Results put in the prompt before the turn count as a search.
+        if any(isinstance(m, SystemMessage) and _SEARCH in _text(m) for m in messages[1:turn]):
+            called.add(_SEARCH)
+            results.setdefault(_SEARCH, next(_text(m) for m in messages[1:turn] if _SEARCH in _text(m)))
+
+        model = self._model_in(messages[:turn + 1])
+        if model is None:
+            return AIMessage(content=ASK_FOR_MODEL)
+        call_id = f"call_{turn}_{len(called)}"
+        if _SEARCH not in called:
+            args = {"query": question, "laptop_model": model}
+            return AIMessage(content="", tool_calls=[{"name": _SEARCH, "args": args, "id": call_id}])
+        if self.create_tickets and _TICKET not in called and not _HOW_TO_RE.match(question):
+            args = {"issue_summary": question[:200], "laptop_model": model or "Unknown", "priority": "Medium"}
+            return AIMessage(content="", tool_calls=[{"name": _TICKET, "args": args, "id": call_id}])
+        return AIMessage(content=self._answer(results))
+
+    @staticmethod
+    def _answer(results: dict[str, str]) -> str:
+        found = results.get(_SEARCH, "")
+        heading = _FIX_HEADING_RE.search(found)
+        if heading is not None:
+            found = found[heading.end():]
+        steps = [step.strip() for step in _STEP_RE.findall(found)][:_MAX_STEPS]
+        lines = ["## Troubleshooting steps", ""]
+        if steps:
+            lines += [f"{i}. {step}" for i, step in enumerate(steps, 1)]
+        else:
+            lines.append("The knowledge base has no documented fix for this issue.")
+        ticket = _TICKET_ID_RE.search(results.get(_TICKET, ""))
+        if ticket:
+            lines += ["", f"**Ticket:** {ticket.group()} has been created to track this issue."]
+        return "\n".join(lines)
+
+    # -- BaseChatModel -------------------------------------------------------
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+    @staticmethod
+    def _chunks(message: AIMessage) -> Iterator[AIMessageChunk]:
+        if message.tool_calls:
+            yield AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ])
+            return
+        for word in re.findall(r"\S+\s*", message.content):
+            yield AIMessageChunk(content=word)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_seconds)
+        for chunk in self._chunks(self.respond(messages)):
+            yield ChatGenerationChunk(message=chunk)
+            time.sleep(self.token_delay_seconds)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_seconds)
+        for chunk in self._chunks(self.respond(messages)):
+            yield ChatGenerationChunk(message=chunk)
+            await asyncio.sleep(self.token_delay_seconds)
@@ -0,0 +1,179 @@
+"""
+Token-budgeted chat history for the agent prompt.
+
+Recent turns are kept as messages. Once they exceed the budget, the oldest
+turns are folded into a rolling summary (one line per turn, sent as a
+system message) and the summary itself drops its oldest lines when it
+outgrows its share of the budget. Long answers are elided before they
+enter the history: code blocks and tables are replaced by placeholders and
+the rest truncated, while ticket and escalation IDs are always kept. The
+prompt therefore stays roughly the same size however long a session runs.
+
+Summaries are extractive (first sentence of each side of the turn plus any
+IDs), so compaction never costs an extra LLM call.
+"""
+
+import re
+from collections.abc import Iterable
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# Share of the token budget the rolling summary may use.
+_SUMMARY_SHARE = 0.25
+_SUMMARY_SNIPPET_CHARS = 160
+_SUMMARY_HEADER = "Summary of earlier turns in this conversation (oldest first):"
+
+_REFERENCE_RE = re.compile(r"\b(?:INC|ESC)-[A-Z0-9]{6,16}\b")
+_CODE_BLOCK_RE = re.compile(r"```.*?(?:```|$)", re.S)
+_TABLE_RE = re.compile(r"(?:^[ \t]*\|.*\n?)+", re.M)
+_MARKDOWN_RE = re.compile(r"[*_`#>]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def _references(text: str) -> list[str]:
+    if "INC-" not in text and "ESC-" not in text:
+        return []
+    return list(dict.fromkeys(_REFERENCE_RE.findall(text)))
+
+
+def elide_response(text: str, max_tokens: int) -> str:
+    """``text`` shortened to about ``max_tokens``: code blocks and tables
+    become placeholders, the remainder is truncated, and ticket IDs that
+    would be lost are listed at the end."""
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    references = _references(text)
+    if "```" in text:
+        text = _CODE_BLOCK_RE.sub("[code block omitted]", text)
+    if "|" in text:
+        text = _TABLE_RE.sub("[table omitted]\n", text)
+    max_chars = max_tokens * 4
+    if len(text) > max_chars:
+        text = text[:max_chars].rsplit(" ", 1)[0] + " ... [truncated]"
+    missing = [ref for ref in references if ref not in text]
+    if missing:
+        text += f"\n(References: {', '.join(missing)})"
+    return text
+
+
+def _snippet(text: str) -> str:
+    # Only the opening sentence is kept, so only the start needs cleaning up.
+    text = text[:_SUMMARY_SNIPPET_CHARS * 2]
+    text = _WHITESPACE_RE.sub(" ", _MARKDOWN_RE.sub("", text)).strip()
+    text = _SENTENCE_END_RE.split(text, 1)[0]
+    if len(text) > _SUMMARY_SNIPPET_CHARS:
+        text = text[:_SUMMARY_SNIPPET_CHARS].rsplit(" ", 1)[0] + "..."
+    return text
+
+
+def summarize_turn(user: str | None, bot: str | None) -> str:
+    """One summary line for a user message and the answer to it."""
+    parts = []
+    if user:
+        parts.append(f"User: {_snippet(user)}")
+    if bot:
+        parts.append(f"Assistant: {_snippet(bot)}")
+    line = "- " + " | ".join(parts)
+    references = [ref for ref in _references(f"{user or ''} {bot or ''}") if ref not in line]
+    if references:
+        line += f" [{', '.join(references)}]"
+    return line
+
+
+class PromptHistory:
+    """The ``chat_history`` a turn is prompted with: a rolling summary plus
+    the most recent messages, within ``token_budget`` (0 = no budget)."""
+
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        max_response_tokens: int = 300,
+        max_messages: int = 100,
+        summary: Iterable[str] = (),
+    ):
+        self.token_budget = token_budget
+        self.max_response_tokens = max_response_tokens
+        self.max_messages = max_messages
+        self.summary: list[str] = list(summary)
+        # (role, prompt message, estimated tokens), oldest first.
+        self._messages: list[tuple[str, BaseMessage, int]] = []
+        self._tokens = 0
+        self._summary_tokens = sum(estimate_tokens(line) for line in self.summary)
+        self._summary_message: SystemMessage | None = None
+        self.folded_turns = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens + self._summary_tokens
+
+    def add(self, role: str, content: str) -> None:
+        if role == "user":
+            message: BaseMessage = HumanMessage(content=content)
+        elif role == "bot":
+            content = elide_response(content, self.max_response_tokens)
+            message = AIMessage(content=content)
+        else:
+            return
+        tokens = estimate_tokens(content)
+        self._messages.append((role, message, tokens))
+        self._tokens += tokens
+
+    def compact(self) -> None:
+        """Fold the oldest turns into the summary until within budget. The
+        latest turn always stays verbatim."""
+        def over_budget() -> bool:
+            if len(self._messages) > self.max_messages:
+                return True
+            return bool(self.token_budget) and self.tokens > self.token_budget
+
+        while len(self._messages) > 2 and over_budget():
+            self._fold_oldest()
+        if self.token_budget:
+            summary_budget = int(self.token_budget * _SUMMARY_SHARE)
+            while self.summary and self._summary_tokens > summary_budget:
+                self._summary_tokens -= estimate_tokens(self.summary.pop(0))
+                self._summary_message = None
+
+    def _fold_oldest(self) -> None:
+        role, message, tokens = self._messages.pop(0)
+        self._tokens -= tokens
+        user = bot = None
+        if role == "user":
+            user = message.content
+            if self._messages and self._messages[0][0] == "bot":
+                _, answer, answer_tokens = self._messages.pop(0)
+                self._tokens -= answer_tokens
+                bot = answer.content
+        else:
+            bot = message.content
+        line = summarize_turn(user, bot)
+        self.summary.append(line)
+        self._summary_tokens += estimate_tokens(line)
+        self._summary_message = None
+        self.folded_turns += 1
+
+    def to_messages(self) -> list[BaseMessage]:
+        messages = [message for _, message, _ in self._messages]
+        if not self.summary:
+            return messages
+        if self._summary_message is None:
+            self._summary_message = SystemMessage(content="\n".join([_SUMMARY_HEADER, *self.summary]))
+        return [self._summary_message, *messages]
+
+    @classmethod
+    def from_history(cls, history: Iterable[dict], **kwargs) -> "PromptHistory":
+        """Build and compact a prompt history from role/content dicts."""
+        prompt = cls(**kwargs)
+        for msg in history:
+            prompt.add(msg.get("role", ""), msg.get("content", ""))
+        prompt.compact()
+        return prompt
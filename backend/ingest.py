@@ -0,0 +1,321 @@
+"""
+Offline bulk ingestion of the IT knowledge base.
+
+Streams documents from a directory tree (.txt, .md, .markdown, .jsonl),
+chunks them with the same splitter the API server uses, embeds chunks in
+large batches across a process pool and writes a sharded FAISS artifact.
+Point the server at the output with FAISS_INDEX_DIR; it loads the artifact
+as-is and never re-embeds it. Shards use the memory-mapped format from
+mmap_store by default, so uvicorn workers share one copy in the page cache.
+The BM25 postings and the model/category posting lists are built while the
+chunks stream past and saved next to the shards, so the server maps them
+instead of re-reading the whole docstore at startup.
+
+    python ingest.py ./kb_export --out ./faiss_index --workers 4
+
+Documents are read lazily, at most ``workers * 2`` embedding batches are in
+flight, and only the shard being filled is held in memory. The postings
+grow with the corpus; ``--no-lexical`` skips the BM25 postings for servers
+that run with KB_SEARCH_MODE=vector.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+
+from lexical_index import LexicalIndexBuilder
+from metadata_index import MetadataIndexBuilder
+from vector_index import (
+    INDEX_TYPES,
+    PREBUILT_LEXICAL_DIR,
+    PREBUILT_MANIFEST_FILE,
+    PREBUILT_METADATA_DIR,
+    STORE_FORMATS,
+    IndexConfig,
+    build_faiss_store,
+    get_text_splitter,
+    index_settings,
+    save_store,
+    split_document,
+)
+
+logger = logging.getLogger("ingest")
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown"}
+JSONL_EXTENSIONS = {".jsonl"}
+
+
+# ---------------------------------------------------------------------------
+# DOCUMENT STREAMING
+# ---------------------------------------------------------------------------
+
+def _jsonl_documents(path: str, rel_path: str) -> Iterator[Document]:
+    """One document per line: ``{"id": ..., "text": ..., "metadata": {...}}``.
+    ``content`` / ``page_content`` are accepted in place of ``text``."""
+    with open(path, encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                logger.warning("Skipping %s:%d: invalid JSON (%s)", rel_path, line_no, exc)
+                continue
+            text = record.get("text") or record.get("content") or record.get("page_content")
+            if not text:
+                logger.warning("Skipping %s:%d: no text field", rel_path, line_no)
+                continue
+            metadata = dict(record.get("metadata") or {})
+            metadata["source"] = f"{rel_path}:{record.get('id', line_no)}"
+            yield Document(page_content=text, metadata=metadata)
+
+
+def iter_source_documents(source_dir: str) -> Iterator[Document]:
+    """Yield documents from ``source_dir`` in a stable (sorted) order."""
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, source_dir).replace(os.sep, "/")
+            ext = os.path.splitext(name)[1].lower()
+            if ext in TEXT_EXTENSIONS:
+                with open(path, encoding="utf-8") as fh:
+                    text = fh.read()
+                if text.strip():
+                    yield Document(page_content=text, metadata={"source": rel_path})
+            elif ext in JSONL_EXTENSIONS:
+                yield from _jsonl_documents(path, rel_path)
+
+
+def iter_chunk_batches(documents: Iterator[Document], batch_size: int) -> Iterator[list[Document]]:
+    splitter = get_text_splitter()
+    batch: list[Document] = []
+    for document in documents:
+        for chunk in split_document(document, splitter):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------------------------------------------------------
+# EMBEDDING WORKERS
+# ---------------------------------------------------------------------------
+
+def _init_worker(threads_per_worker: int) -> None:
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    # Load the model once per process, not once per batch.
+    from ai_engine import get_embeddings
+
+    get_embeddings()
+
+
+def _embed_batch(texts: list[str]) -> np.ndarray:
+    from ai_engine import get_embeddings
+
+    return np.asarray(get_embeddings().embed_documents(texts), dtype="float32")
+
+
+# ---------------------------------------------------------------------------
+# SHARD WRITER
+# ---------------------------------------------------------------------------
+
+class _ShardWriter:
+    """Buffers one shard of chunks + vectors, then builds and saves its index.
+    IVF shards are trained on their own vectors."""
+
+    def __init__(self, out_dir: str, shard_size: int, config: IndexConfig, store_format: str):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.config = config
+        self.store_format = store_format
+        self.shards: list[dict] = []
+        self._reset()
+
+    def _reset(self) -> None:
+        self._chunks: list[Document] = []
+        self._vectors: list[np.ndarray] = []
+
+    def add(self, chunks: list[Document], vectors: np.ndarray) -> None:
+        offset = 0
+        while offset < len(chunks):
+            take = min(self.shard_size - len(self._chunks), len(chunks) - offset)
+            self._chunks.extend(chunks[offset:offset + take])
+            self._vectors.append(vectors[offset:offset + take])
+            offset += take
+            if len(self._chunks) >= self.shard_size:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self._chunks:
+            return
+        name = f"shard_{len(self.shards):05d}"
+        vs = build_faiss_store(self._chunks, np.concatenate(self._vectors), None, self.config)
+        save_store(vs, os.path.join(self.out_dir, name), self.store_format)
+        self.shards.append({"path": name, "chunks": len(self._chunks)})
+        logger.info("Wrote %s (%d chunks, %s index).", name, len(self._chunks), self.config.index_type)
+        self._reset()
+
+
+# ---------------------------------------------------------------------------
+# PIPELINE
+# ---------------------------------------------------------------------------
+
+def _swap_into_place(tmp_dir: str, out_dir: str) -> None:
+    old_dir = f"{out_dir}.old"
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+
+def ingest(
+    source_dir: str,
+    out_dir: str,
+    workers: int = max(1, (os.cpu_count() or 2) // 2),
+    batch_size: int = 256,
+    shard_size: int = 100_000,
+    index_config: IndexConfig | None = None,
+    store_format: str = "mmap",
+    lexical: bool = True,
+) -> dict:
+    """Build a sharded FAISS artifact from ``source_dir`` into ``out_dir``."""
+    from ai_engine import EMBEDDING_MODEL
+
+    index_config = index_config or IndexConfig.from_env()
+
+    out_dir = os.path.abspath(out_dir)
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    started = time.perf_counter()
+    writer = _ShardWriter(tmp_dir, shard_size, index_config, store_format)
+    # Chunks reach these in FAISS position order, like the shard writer.
+    lexical_builder = LexicalIndexBuilder() if lexical else None
+    metadata_builder = MetadataIndexBuilder()
+    documents = 0
+    chunks_total = 0
+
+    def counted(docs: Iterator[Document]) -> Iterator[Document]:
+        nonlocal documents
+        for doc in docs:
+            documents += 1
+            yield doc
+
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    max_in_flight = workers * 2
+    # spawn: the parent never loads torch, and forking after it does is unsafe.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    ) as pool:
+        in_flight: deque[tuple[list[Document], Future]] = deque()
+
+        def drain_one() -> None:
+            nonlocal chunks_total
+            batch, future = in_flight.popleft()
+            writer.add(batch, future.result())
+            for chunk in batch:
+                if lexical_builder is not None:
+                    lexical_builder.add(chunk.page_content)
+                metadata_builder.add(chunk.metadata)
+            chunks_total += len(batch)
+            if chunks_total % (batch_size * 20) < len(batch):
+                rate = chunks_total / (time.perf_counter() - started)
+                logger.info("Embedded %d chunks from %d documents (%.0f chunks/s).", chunks_total, documents, rate)
+
+        for batch in iter_chunk_batches(counted(iter_source_documents(source_dir)), batch_size):
+            in_flight.append((batch, pool.submit(_embed_batch, [c.page_content for c in batch])))
+            # Results are consumed in submission order, which keeps shard
+            # contents deterministic and bounds memory to max_in_flight batches.
+            if len(in_flight) >= max_in_flight:
+                drain_one()
+        while in_flight:
+            drain_one()
+
+    writer.flush()
+    if not writer.shards:
+        shutil.rmtree(tmp_dir)
+        raise ValueError(f"No .txt/.md/.jsonl documents found under '{source_dir}'.")
+
+    metadata_builder.build().save(os.path.join(tmp_dir, PREBUILT_METADATA_DIR))
+    if lexical_builder is not None:
+        lexical_index = lexical_builder.build()
+        lexical_index.save(os.path.join(tmp_dir, PREBUILT_LEXICAL_DIR))
+        logger.info("Wrote lexical index (%d terms).", lexical_index.stats()["terms"])
+
+    manifest = {
+        "version": 1,
+        "settings": index_settings(EMBEDDING_MODEL, index_config),
+        "index_config": index_config.to_dict(),
+        "store_format": store_format,
+        "documents": documents,
+        "chunks": chunks_total,
+        "shards": writer.shards,
+        "lexical_index": PREBUILT_LEXICAL_DIR if lexical else None,
+        "metadata_index": PREBUILT_METADATA_DIR,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(tmp_dir, PREBUILT_MANIFEST_FILE), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1)
+    _swap_into_place(tmp_dir, out_dir)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Ingested %d documents into %d chunks across %d shard(s) in %.1fs -> '%s'.",
+        documents, chunks_total, len(writer.shards), elapsed, out_dir,
+    )
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a sharded FAISS knowledge base artifact.")
+    parser.add_argument("source_dir", help="Directory of .txt / .md / .jsonl documents")
+    parser.add_argument("--out", default="./faiss_index", help="Output index directory (default: ./faiss_index)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Embedding processes (default: half the CPU count)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding call (default: 256)")
+    parser.add_argument("--shard-size", type=int, default=100_000, help="Chunks per index shard (default: 100000)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES,
+                        help="FAISS index type (default: FAISS_INDEX_TYPE or flat); other FAISS_* env vars apply")
+    parser.add_argument("--store-format", choices=STORE_FORMATS, default="mmap",
+                        help="mmap: read-only, shared across workers (default); pickle: LangChain save_local")
+    parser.add_argument("--no-lexical", action="store_true",
+                        help="Do not build the BM25 postings (for KB_SEARCH_MODE=vector servers)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    index_config = IndexConfig.from_env()
+    if args.index_type:
+        index_config.index_type = args.index_type
+    ingest(
+        args.source_dir, args.out, args.workers, args.batch_size, args.shard_size,
+        index_config, args.store_format, not args.no_lexical,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Rule-based pre-router for requests that need exactly one tool call.
+
+Plain warranty checks, "create a ticket for ..." and "escalate INC-..."
+are answered by calling the tool directly, which takes microseconds instead
+of two or three LLM round trips. The rules are deliberately strict: a
+message is routed only when every word in it is accounted for (a warranty
+question) or it starts with an explicit command and names everything the
+tool needs. Anything else -- a symptom, a follow-up that relies on earlier
+turns, a missing laptop model -- goes to the agent.
+"""
+
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+INTENT_WARRANTY = "warranty"
+INTENT_TICKET = "ticket"
+INTENT_ESCALATION = "escalation"
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_WARRANTY_TERMS = frozenset({"warranty", "warranties", "coverage", "covered", "applecare"})
+# Words a bare warranty question may contain besides the model and serial.
+_WARRANTY_FILLER = frozenset(
+    "a about active am an and any are can check could date days did do does expire expired expires expiry "
+    "for has have hello hey hi how i in info information is it its left long look lookup me my n no number "
+    "of on our please remaining s serial show sn status still tell thank thanks that the this to under "
+    "until up valid what whats when which will with you laptop laptops device computer notebook machine "
+    "plan".split()
+)
+_SERIAL_RE = re.compile(r"\b(?:serial(?:\s+number)?|s/?n)\s*(?:is|:|#|no\.?)?\s*([A-Z0-9][A-Z0-9-]{4,})\b", re.I)
+_TICKET_RE = re.compile(
+    r"^\s*(?:please\s+)?(?:(?:can|could|would)\s+you\s+)?(?:please\s+)?"
+    r"(?:create|open|raise|file|log|submit)\s+(?:me\s+)?(?:a\s+|an\s+)?(?:new\s+)?(?:support\s+|it\s+)?"
+    r"(?:ticket|incident)\b[\s:,-]*(?:for|about|regarding|re:?)?\s*(?P<rest>.*?)[\s.!?]*$",
+    re.I | re.S,
+)
+_ESCALATE_RE = re.compile(
+    r"^\s*(?:please\s+)?escalate\s+(?:ticket\s+)?(?P<ticket_id>INC-[A-Z0-9]{6,16})"
+    r"(?:\s+to\s+tier\s*2)?(?:\s*(?:because|since|as|:|-)\s*(?P<reason>.+?))?[\s.!?]*$",
+    re.I | re.S,
+)
+_PRIORITY_RE = re.compile(
+    r"\b(?:(critical|high|medium|low)\s+priority|priority\s*(?:is|:|=)?\s*(critical|high|medium|low))\b", re.I,
+)
+_URGENT_RE = re.compile(r"\burgent(?:ly)?\b|\basap\b", re.I)
+_LEADING_FILLER_RE = re.compile(r"^(?:my|the|our|an?)\s+", re.I)
+_TRAILING_PUNCT_RE = re.compile(r"[\s,;:.!?-]+$")
+
+
+@dataclass
+class RoutedIntent:
+    intent: str
+    tool: str
+    args: dict = field(default_factory=dict)
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _priority(message: str) -> str:
+    match = _PRIORITY_RE.search(message)
+    if match:
+        return (match.group(1) or match.group(2)).capitalize()
+    return "High" if _URGENT_RE.search(message) else "Medium"
+
+
+class IntentRouter:
+    """
+    ``find_model`` returns the laptop model mentioned in a text, or None
+    (see WarrantyEngine.find_model). The router has no other dependencies,
+    so routing never touches the LLM, the embedding model or the disk.
+    """
+
+    def __init__(self, find_model: Callable[[str], str | None]):
+        self.find_model = find_model
+
+    def route(self, message: str) -> RoutedIntent | None:
+        """The single tool call that fully answers ``message``, or None."""
+        return self._escalation(message) or self._ticket(message) or self._warranty(message)
+
+    def _warranty(self, message: str) -> RoutedIntent | None:
+        words = _words(message)
+        if not _WARRANTY_TERMS.intersection(words) or len(words) > 30:
+            return None
+        serial_match = _SERIAL_RE.search(message)
+        serial = serial_match.group(1).upper() if serial_match else ""
+        model = self.find_model(message) or ""
+        if not model and not serial:
+            return None
+        accounted = _WARRANTY_TERMS | _WARRANTY_FILLER | set(_words(model)) | set(_words(serial))
+        if any(word not in accounted for word in words):
+            # Something beyond a warranty question ("... screen is cracked").
+            return None
+        return RoutedIntent(INTENT_WARRANTY, "check_warranty_status", {"laptop_model": model, "serial_number": serial})
+
+    def _ticket(self, message: str) -> RoutedIntent | None:
+        match = _TICKET_RE.match(message)
+        if match is None:
+            return None
+        # Priority phrases set the priority; they are not part of the issue.
+        rest = _URGENT_RE.sub("", _PRIORITY_RE.sub("", match.group("rest")))
+        rest = _TRAILING_PUNCT_RE.sub("", rest.strip())
+        model = self.find_model(rest)
+        if not model:
+            return None
+        # The summary has to say what is wrong, not just name the device.
+        issue_words = [w for w in _words(rest) if w not in _words(model) and w not in _WARRANTY_FILLER]
+        if len(issue_words) < 2:
+            return None
+        summary = _LEADING_FILLER_RE.sub("", rest)
+        summary = summary[:1].upper() + summary[1:]
+        return RoutedIntent(
+            INTENT_TICKET,
+            "create_support_ticket",
+            {"issue_summary": summary, "laptop_model": model, "priority": _priority(message)},
+        )
+
+    def _escalation(self, message: str) -> RoutedIntent | None:
+        match = _ESCALATE_RE.match(message)
+        if match is None:
+            return None
+        # The issue summary comes from the ticket when no reason is given.
+        return RoutedIntent(
+            INTENT_ESCALATION,
+            "escalate_to_tier2",
+            {"issue_summary": (match.group("reason") or "").strip(), "ticket_id": match.group("ticket_id").upper()},
+        )
@@ -0,0 +1,100 @@
+"""
+Speculative knowledge-base search, started before the agent's first LLM call.
+
+The agent is told to search the knowledge base first, so most turns spend a
+whole LLM round trip deciding to make a search whose arguments are already
+in the user's message. The server starts that search as soon as it knows the
+request goes to the agent; when the agent then asks for it, the result is
+(usually) already there.
+
+The agent words its own query, so a request is served from the prefetch
+when it is *about the same thing*: a compatible laptop model, and at least
+half of the agent's query terms (compared by their first few letters, so
+"flicker" matches "flickering") taken from the user's message. Anything
+else runs a normal search.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+
+from lexical_index import tokenize
+from warranty_engine import normalize_model
+
+# Terms are compared by prefix: a cheap stand-in for stemming.
+_STEM_CHARS = 5
+_MIN_OVERLAP = 0.5
+# A message with fewer issue terms than this ("ThinkPad T14s Gen 3", in
+# answer to "which model?") is searched together with the previous one.
+_MIN_ISSUE_TERMS = 2
+# How far back to look for the laptop model in follow-up messages.
+_HISTORY_LOOKBACK = 6
+
+
+def _stems(text: str, exclude: set[str] = frozenset()) -> set[str]:
+    return {term[:_STEM_CHARS] for term in tokenize(text) if term not in exclude}
+
+
+def _model_words(model: str) -> set[str]:
+    return set(normalize_model(model).split())
+
+
+def prefetch_query(
+    user_message: str,
+    history: list[dict] | None,
+    find_model: Callable[[str], str | None],
+) -> tuple[str, str] | None:
+    """(query, laptop_model) to search for ``user_message``, or None when no
+    laptop model is known yet -- the agent asks for one before searching."""
+    model = find_model(user_message)
+    previous = [
+        msg.get("content", "") for msg in (history or [])[-_HISTORY_LOOKBACK:] if msg.get("role") == "user"
+    ]
+    if model is None:
+        for text in reversed(previous):
+            model = find_model(text)
+            if model is not None:
+                break
+        if model is None:
+            return None
+        return user_message, model
+    if previous and len(_stems(user_message, _model_words(model))) < _MIN_ISSUE_TERMS:
+        return f"{previous[-1]} {user_message}", model
+    return user_message, model
+
+
+class KBPrefetch:
+    """One in-flight speculative search and the query it was started for.
+    ``search`` resolves to the formatted results, or None if it failed."""
+
+    def __init__(self, query: str, laptop_model: str, search: Awaitable[str | None]):
+        self.query = query
+        self.laptop_model = laptop_model
+        self._model_words = _model_words(laptop_model)
+        self._stems = _stems(query, self._model_words)
+        self.task: asyncio.Future = asyncio.ensure_future(search)
+        self.served = 0
+
+    def matches(self, query: str, laptop_model: str = "") -> bool:
+        """Whether a search for (``query``, ``laptop_model``) can be answered
+        with this prefetch."""
+        requested = _model_words(laptop_model)
+        if requested and not (requested <= self._model_words or self._model_words <= requested):
+            return False
+        stems = _stems(query, requested | self._model_words)
+        if not stems:
+            # Nothing but the model name: the prefetch is as good a guess as any.
+            return True
+        return len(stems & self._stems) / len(stems) >= _MIN_OVERLAP
+
+    async def result(self) -> str | None:
+        # Shielded: a caller that times out must not cancel the search for
+        # the next one.
+        result = await asyncio.shield(self.task)
+        if result is not None:
+            self.served += 1
+        return result
+
+    def discard(self) -> None:
+        """Drop the search if nobody is going to use it."""
+        if not self.task.done():
+            self.task.cancel()
@@ -0,0 +1,330 @@
+"""
+BM25 inverted index over knowledge base chunks.
+
+Chunks are addressed by FAISS position, so lexical and vector results can be
+fused directly. Tokenization keeps part numbers, error codes and command
+switches intact ("5C10S30404", "DRIVER_IRQL_NOT_LESS_OR_EQUAL", "/batteryreport")
+and also indexes the pieces of compound tokens so "IRQL" still matches.
+
+Postings are stored as flat arrays (terms sorted, each term's postings a
+slice), which ``save`` writes next to a prebuilt index and ``load`` maps
+read-only, so a server starts without re-tokenizing the corpus.
+"""
+
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"([/\-]?)([A-Za-z0-9#][A-Za-z0-9_.\-]*[A-Za-z0-9]|[A-Za-z0-9])")
+_PART_RE = re.compile(r"[_.\-]+")
+
+_META_FILE = "lexical.json"
+_TERMS_FILE = "terms.bin"
+_TERM_OFFSETS_FILE = "term_offsets.npy"
+_OFFSETS_FILE = "offsets.npy"
+_POSITIONS_FILE = "positions.npy"
+_WEIGHTS_FILE = "weights.npy"
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my no not of on or so that the their then there these this to was what when where "
+    "which while why will with you your".split()
+)
+
+
+# A token without other marks is a code ("5c10s30404", "0xc000021a") only if
+# it is this long and has this many digits; "t14s" and "ux3402" are not.
+_CODE_MIN_LENGTH = 7
+_CODE_MIN_DIGITS = 4
+
+
+def _is_identifier(prefix: str, token: str) -> bool:
+    """Part numbers, error codes, file names and command switches: a switch
+    prefix ("/batteryreport"), a "#", "_" or "." ("#5C10S30404",
+    "DRIVER_IRQL_NOT_LESS_OR_EQUAL", "igdkmd64.sys"), or a long code."""
+    if prefix or token.startswith("#") or "_" in token or "." in token:
+        return True
+    return len(token) >= _CODE_MIN_LENGTH and sum(c.isdigit() for c in token) >= _CODE_MIN_DIGITS
+
+
+def _words(text: str) -> list[tuple[str, bool]]:
+    """Whole tokens of ``text`` (lowercased, stopwords dropped), each with
+    whether it looks like an identifier."""
+    words = []
+    for prefix, raw in _TOKEN_RE.findall(text):
+        is_identifier = _is_identifier(prefix, raw.lower())
+        token = raw.lower().lstrip("#")
+        if not token:
+            continue
+        if is_identifier or token not in _STOPWORDS:
+            words.append((token, is_identifier))
+    return words
+
+
+def tokenize(text: str) -> list[str]:
+    """Index terms: each whole token followed by the parts of compound ones."""
+    terms: list[str] = []
+    for token, _ in _words(text):
+        terms.append(token)
+        parts = _PART_RE.split(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p and p not in _STOPWORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int, rrf_k: int = 60) -> list[int]:
+    """Fuse ranked position lists: score(d) = sum(1 / (rrf_k + rank))."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+
+
+# ---------------------------------------------------------------------------
+# Postings
+# ---------------------------------------------------------------------------
+
+class _TermTable(Sequence):
+    """Sorted terms in one UTF-8 blob, decoded on access (for bisect)."""
+
+    def __init__(self, blob: bytes | mmap.mmap, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __getitem__(self, i: int) -> str:
+        return self._blob[int(self._offsets[i]):int(self._offsets[i + 1])].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+class PackedPostings(Mapping):
+    """term -> (positions, BM25 weights). ``terms`` is sorted; the postings
+    of ``terms[i]`` are ``positions[offsets[i]:offsets[i + 1]]``."""
+
+    def __init__(self, terms: Sequence[str], offsets: np.ndarray, positions: np.ndarray, weights: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.positions = positions
+        self.weights = weights
+
+    def _find(self, term: str) -> int | None:
+        i = bisect_left(self.terms, term)
+        return i if i < len(self.terms) and self.terms[i] == term else None
+
+    def __getitem__(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        i = self._find(term)
+        if i is None:
+            raise KeyError(term)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.positions[start:end], self.weights[start:end]
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self._find(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.positions.nbytes + self.weights.nbytes
+
+
+class LexicalIndexBuilder:
+    """Collects chunks one at a time; the n-th ``add`` is chunk position n."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._raw: dict[str, tuple[list[int], list[int]]] = {}
+        self._lengths: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, text: str) -> None:
+        position = len(self._lengths)
+        terms = tokenize(text)
+        self._lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            positions, tfs = self._raw.setdefault(term, ([], []))
+            positions.append(position)
+            tfs.append(tf)
+
+    def build(self, **kwargs) -> "LexicalIndex":
+        k1, b = self.k1, self.b
+        size = len(self._lengths)
+        doc_len = np.asarray(self._lengths, dtype="float32")
+        avg_len = float(doc_len.mean()) if size else 0.0
+        norm = k1 * (1 - b + b * doc_len / avg_len) if avg_len else np.full(size, k1, dtype="float32")
+        terms = sorted(self._raw)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        offsets[1:] = np.cumsum([len(self._raw[term][0]) for term in terms])
+        positions = np.empty(int(offsets[-1]), dtype="int32")
+        weights = np.empty(int(offsets[-1]), dtype="float32")
+        for i, term in enumerate(terms):
+            term_positions, tfs = self._raw[term]
+            pos = np.asarray(term_positions, dtype="int32")
+            tf = np.asarray(tfs, dtype="float32")
+            idf = math.log(1 + (size - len(pos) + 0.5) / (len(pos) + 0.5))
+            positions[offsets[i]:offsets[i + 1]] = pos
+            weights[offsets[i]:offsets[i + 1]] = idf * tf * (k1 + 1) / (tf + norm[pos])
+        return LexicalIndex(PackedPostings(terms, offsets, positions, weights), size, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class LexicalIndex:
+    """
+    BM25 inverted index with precomputed per-posting impact scores, so a
+    query is a sum of weights over its terms' postings.
+
+    ``exact_match`` answers queries built around codes and part numbers
+    without touching the embedding model: when the query is short, mostly
+    identifiers, and every identifier occurs together in at least one chunk,
+    the matching chunks ranked by BM25 are the answer. Laptop-model words
+    (``model_words``, e.g. "i7-1365u") never count as identifiers, so a
+    question that names a model still gets semantic search.
+    """
+
+    def __init__(
+        self,
+        postings: PackedPostings,
+        size: int,
+        exact_max_terms: int = 6,
+        model_words: frozenset[str] = frozenset(),
+    ):
+        self._postings = postings
+        self.size = size
+        self.exact_max_terms = exact_max_terms
+        self.model_words = model_words
+        self.searches = 0
+        self.exact_hits = 0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75, **kwargs) -> "LexicalIndex":
+        """Index ``texts``; the i-th text is chunk position i."""
+        started = time.perf_counter()
+        builder = LexicalIndexBuilder(k1, b)
+        for text in texts:
+            builder.add(text)
+        index = builder.build(**kwargs)
+        logger.info(
+            "Lexical index built: %d chunks, %d terms in %.2fs.",
+            index.size, len(index._postings), time.perf_counter() - started,
+        )
+        return index
+
+    def save(self, folder: str) -> None:
+        """Write the postings to ``folder`` for ``load``."""
+        os.makedirs(folder, exist_ok=True)
+        postings = self._postings
+        encoded = [term.encode("utf-8") for term in postings.terms]
+        term_offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        term_offsets[1:] = np.cumsum([len(term) for term in encoded])
+        with open(os.path.join(folder, _TERMS_FILE), "wb") as fh:
+            fh.write(b"".join(encoded))
+        np.save(os.path.join(folder, _TERM_OFFSETS_FILE), term_offsets)
+        np.save(os.path.join(folder, _OFFSETS_FILE), np.asarray(postings.offsets))
+        np.save(os.path.join(folder, _POSITIONS_FILE), np.asarray(postings.positions))
+        np.save(os.path.join(folder, _WEIGHTS_FILE), np.asarray(postings.weights))
+        with open(os.path.join(folder, _META_FILE), "w", encoding="utf-8") as fh:
+            json.dump({"chunks": self.size, "terms": len(postings)}, fh)
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, _META_FILE))
+
+    @classmethod
+    def load(cls, folder: str, **kwargs) -> "LexicalIndex":
+        """Open an index written by ``save``, memory-mapped and read-only."""
+        with open(os.path.join(folder, _META_FILE), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        blob: bytes | mmap.mmap = b""
+        if os.path.getsize(os.path.join(folder, _TERMS_FILE)):
+            with open(os.path.join(folder, _TERMS_FILE), "rb") as fh:
+                blob = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        postings = PackedPostings(
+            _TermTable(blob, np.load(os.path.join(folder, _TERM_OFFSETS_FILE), mmap_mode="r")),
+            np.load(os.path.join(folder, _OFFSETS_FILE), mmap_mode="r"),
+            np.load(os.path.join(folder, _POSITIONS_FILE), mmap_mode="r"),
+            np.load(os.path.join(folder, _WEIGHTS_FILE), mmap_mode="r"),
+        )
+        return cls(postings, meta["chunks"], **kwargs)
+
+    def _score(self, terms: Iterable[str], restrict: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        found = [self._postings[t] for t in dict.fromkeys(terms) if t in self._postings]
+        if not found:
+            return np.empty(0, dtype="int32"), np.empty(0, dtype="float32")
+        positions = np.concatenate([p for p, _ in found])
+        weights = np.concatenate([w for _, w in found])
+        if restrict is not None:
+            mask = np.isin(positions, restrict)
+            positions, weights = positions[mask], weights[mask]
+        unique, inverse = np.unique(positions, return_inverse=True)
+        return unique, np.bincount(inverse, weights=weights).astype("float32")
+
+    @staticmethod
+    def _top(positions: np.ndarray, scores: np.ndarray, k: int) -> list[int]:
+        if len(positions) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[keep], scores[keep]
+        return [int(p) for p in positions[np.argsort(-scores, kind="stable")]]
+
+    def search(self, query: str, k: int, restrict: np.ndarray | None = None) -> list[int]:
+        """Top ``k`` chunk positions by BM25, optionally only among ``restrict``."""
+        self.searches += 1
+        return self._top(*self._score(tokenize(query), restrict), k)
+
+    def exact_match(self, query: str, k: int, restrict: np.ndarray | None = None) -> list[int] | None:
+        """Positions for an exact-token query, or None if the query needs
+        semantic search."""
+        words = _words(query)
+        identifiers = [token for token, is_identifier in words if is_identifier and not self._is_model_word(token)]
+        if not identifiers or len(words) > self.exact_max_terms or 2 * len(identifiers) < len(words):
+            return None
+        candidates: np.ndarray | None = restrict
+        for token in dict.fromkeys(identifiers):
+            entry = self._postings.get(token)
+            if entry is None:
+                return None
+            candidates = entry[0] if candidates is None else np.intersect1d(candidates, entry[0])
+            if len(candidates) == 0:
+                return None
+        self.exact_hits += 1
+        return self._top(*self._score(tokenize(query), restrict=candidates), k)
+
+    def _is_model_word(self, token: str) -> bool:
+        return token in self.model_words or all(
+            part in self.model_words for part in _PART_RE.split(token) if part
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self._postings.nbytes
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.size,
+            "terms": len(self._postings),
+            "postings_bytes": self.nbytes,
+            "searches": self.searches,
+            "exact_hits": self.exact_hits,
+        }
@@ -0,0 +1,430 @@
+"""
+Managed access to the chat model: deadlines, retries, a circuit breaker and
+a cap on concurrent calls.
+
+``ManagedChatModel`` wraps any LangChain chat model and can be used in its
+place (including ``bind_tools``). Every call
+
+- waits for one of ``max_in_flight`` slots, failing with LLMOverloadedError
+  if none frees up within the call timeout;
+- is abandoned after ``timeout_seconds`` (async calls; sync calls rely on the
+  wrapped client's own timeout);
+- is retried up to ``max_retries`` times on timeouts, connection errors and
+  429/5xx responses, after a full-jitter exponential backoff;
+- fails at once with CircuitOpenError while the breaker is open: after
+  ``failure_threshold`` consecutive failed attempts no call is made for
+  ``reset_seconds``, then a single probe call decides whether to close it
+  (a probe that is cancelled or gets no slot lets the next call probe).
+
+All copies made by ``bind_tools`` share one policy, so the limits and the
+breaker apply to the process as a whole. A stream holds its slot until it
+ends, each chunk must arrive within the timeout, and it is retried only
+until its first chunk has been delivered.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from typing import Any
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from pydantic import ConfigDict
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# HTTP statuses worth another attempt: timeouts, rate limits, server errors.
+_RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+# The wrapped client gets no callbacks: the wrapper reports the run itself.
+_INNER_CONFIG = {"callbacks": []}
+_END = object()
+
+
+async def _anext(stream: AsyncIterator) -> Any:
+    return await anext(stream, _END)
+
+
+class CircuitOpenError(RuntimeError):
+    """The LLM failed repeatedly and calls are suspended for a while."""
+
+
+class LLMOverloadedError(RuntimeError):
+    """No call slot became free within the call timeout."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether ``exc`` (or the error it wraps) is likely to be transient."""
+    seen = 0
+    while exc is not None and seen < 5:
+        if isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        if getattr(exc, "code", None) in _RETRYABLE_STATUS:
+            return True
+        exc = exc.__cause__
+        seen += 1
+    return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def admit(self) -> str | None:
+        """The state a call goes ahead in now, or None if it may not. In the
+        half-open state only one probe call is let through at a time; it
+        must end in ``record_success``, ``record_failure`` or
+        ``release_probe``."""
+        if self.failure_threshold <= 0:
+            return STATE_CLOSED
+        with self._lock:
+            state = self.state
+            if state == STATE_CLOSED:
+                return state
+            if state == STATE_HALF_OPEN and not self._probing:
+                self._probing = True
+                return state
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                # Open, or re-open after a failed probe.
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logger.warning("LLM circuit breaker opened after %d failure(s).", self._failures)
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """Free the probe slot without a verdict (the probe was cancelled)."""
+        with self._lock:
+            self._probing = False
+
+
+class LLMCallPolicy:
+    """Limits, retry settings and counters shared by every call."""
+
+    def __init__(
+        self,
+        timeout_seconds: float = 30.0,
+        max_retries: int = 2,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 8.0,
+        max_in_flight: int = 16,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_in_flight = max_in_flight
+        self.breaker = breaker or CircuitBreaker()
+        self._sync_slots = threading.BoundedSemaphore(max_in_flight)
+        # asyncio semaphores belong to one event loop; recreated if it changes.
+        self._async_slots: asyncio.Semaphore | None = None
+        self._async_loop: asyncio.AbstractEventLoop | None = None
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+        self.overloaded = 0
+
+    def _timeout(self) -> float | None:
+        return self.timeout_seconds if self.timeout_seconds > 0 else None
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, base * 2**attempt], capped."""
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+
+    def _check_breaker(self) -> bool:
+        """Raise if the breaker rejects the call; True if the call is the
+        half-open probe."""
+        state = self.breaker.admit()
+        if state is None:
+            self.rejected += 1
+            raise CircuitOpenError("The language model is temporarily unavailable (circuit open).")
+        return state == STATE_HALF_OPEN
+
+    def _record_error(self, exc: BaseException, attempt: int) -> bool:
+        """Count a failed attempt; True if it should be retried."""
+        if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+            self.timeouts += 1
+        if not is_retryable(exc):
+            # The service answered (e.g. a rejected request): it is up.
+            self.breaker.record_success()
+            self.failures += 1
+            return False
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            self.failures += 1
+            return False
+        self.retries += 1
+        logger.warning("LLM call failed (%s: %s); retrying.", type(exc).__name__, exc)
+        return True
+
+    # -- slots ---------------------------------------------------------------
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_slots is None or self._async_loop is not loop:
+            self._async_slots = asyncio.Semaphore(self.max_in_flight)
+            self._async_loop = loop
+        return self._async_slots
+
+    async def _aacquire(self) -> asyncio.Semaphore:
+        slots = self._async_semaphore()
+        try:
+            await asyncio.wait_for(slots.acquire(), self._timeout())
+        except asyncio.TimeoutError:
+            self.overloaded += 1
+            raise LLMOverloadedError(f"All {self.max_in_flight} LLM call slots are busy.") from None
+        self.in_flight += 1
+        return slots
+
+    def _acquire(self) -> None:
+        if not self._sync_slots.acquire(timeout=self._timeout()):
+            self.overloaded += 1
+            raise LLMOverloadedError(f"All {self.max_in_flight} LLM call slots are busy.")
+        self.in_flight += 1
+
+    def _abandon(self, probe: bool) -> None:
+        """The attempt ended without a verdict (cancelled, or no slot): a
+        probe gives its slot back so the next call can probe."""
+        if probe:
+            self.breaker.release_probe()
+
+    def _admit(self) -> bool:
+        probe = self._check_breaker()
+        try:
+            self._acquire()
+        except BaseException:
+            self._abandon(probe)
+            raise
+        self.calls += 1
+        return probe
+
+    async def _aadmit(self) -> tuple[asyncio.Semaphore, bool]:
+        probe = self._check_breaker()
+        try:
+            slots = await self._aacquire()
+        except BaseException:
+            self._abandon(probe)
+            raise
+        self.calls += 1
+        return slots, probe
+
+    # -- calls ---------------------------------------------------------------
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            probe = self._admit()
+            try:
+                result = func()
+            except Exception as exc:
+                if not self._record_error(exc, attempt):
+                    raise
+            except BaseException:
+                self._abandon(probe)
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.in_flight -= 1
+                self._sync_slots.release()
+            time.sleep(self.backoff(attempt))
+            attempt += 1
+
+    async def acall(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        attempt = 0
+        while True:
+            slots, probe = await self._aadmit()
+            try:
+                result = await asyncio.wait_for(func(), self._timeout())
+            except Exception as exc:
+                if not self._record_error(exc, attempt):
+                    raise
+            except BaseException:
+                # Cancelled (client gone, shutdown): no verdict on the LLM.
+                self._abandon(probe)
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.in_flight -= 1
+                slots.release()
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def stream(self, open_stream: Callable[[], Iterator]) -> Iterator:
+        """Items of ``open_stream()``, holding a slot until the stream ends.
+        Only failures before the first item are retried."""
+        attempt = 0
+        while True:
+            probe = self._admit()
+            started = False
+            try:
+                for item in open_stream():
+                    if not started:
+                        started = True
+                        self.breaker.record_success()
+                    yield item
+                if not started:
+                    # An empty stream is still an answer from the LLM.
+                    self.breaker.record_success()
+                return
+            except Exception as exc:
+                if started or not self._record_error(exc, attempt):
+                    raise
+            except BaseException:
+                self._abandon(probe and not started)
+                raise
+            finally:
+                self.in_flight -= 1
+                self._sync_slots.release()
+            time.sleep(self.backoff(attempt))
+            attempt += 1
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Async counterpart of ``stream``; every item must arrive within the
+        call timeout, so a stalled stream is cut off."""
+        attempt = 0
+        while True:
+            slots, probe = await self._aadmit()
+            started = False
+            try:
+                stream = aiter(open_stream())
+                while True:
+                    item = await asyncio.wait_for(_anext(stream), self._timeout())
+                    if item is _END:
+                        if not started:
+                            self.breaker.record_success()
+                        return
+                    if not started:
+                        started = True
+                        self.breaker.record_success()
+                    yield item
+            except Exception as exc:
+                if started:
+                    self._record_error(exc, self.max_retries)
+                    raise
+                if not self._record_error(exc, attempt):
+                    raise
+            except BaseException:
+                self._abandon(probe and not started)
+                raise
+            finally:
+                self.in_flight -= 1
+                slots.release()
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "overloaded": self.overloaded,
+            "breaker_opened": self.breaker.opened,
+        }
+
+
+class ManagedChatModel(BaseChatModel):
+    """``model`` (a chat model, possibly with tools bound) called through
+    ``policy``."""
+
+    model: Runnable
+    policy: LLMCallPolicy
+    model_name: str = ""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "managed"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ManagedChatModel":
+        return ManagedChatModel(
+            model=self.model.bind_tools(tools, **kwargs), policy=self.policy, model_name=self.model_name,
+        )
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self.policy.call(lambda: self.model.invoke(messages, _INNER_CONFIG, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = await self.policy.acall(lambda: self.model.ainvoke(messages, _INNER_CONFIG, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for chunk in self.policy.stream(lambda: self.model.stream(messages, _INNER_CONFIG, stop=stop, **kwargs)):
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.policy.astream(
+            lambda: self.model.astream(messages, _INNER_CONFIG, stop=stop, **kwargs)
+        ):
+            yield ChatGenerationChunk(message=chunk)
@@ -0,0 +1,334 @@
+"""
+Load test for /api/chat: throughput and latency percentiles under concurrency.
+
+Boots the app in-process with the deterministic fake LLM (LLM_PROVIDER=fake)
+and the real embedding model, FAISS index, ticket store and sessions, then
+has ``--concurrency`` simulated users work through a mix of multi-turn
+conversations: troubleshooting with a follow-up, a symptom and then the
+laptop model on request, repeated how-to questions (these create no
+ticket, so the response cache serves the repeats), warranty checks and
+ticket requests (intent router).
+
+    python loadtest.py --concurrency 16 --conversations 400 --llm-latency-ms 400
+    python loadtest.py --compare loadtest_1a2b3c4.json
+
+Reports requests/s and p50/p95/p99 latency overall, per route (agent,
+cache, router:<intent>) and per stage (every LLM call, every tool call and
+the retrieval stages, read from the server's request traces in telemetry).
+Results are written as JSON
+(``--out``) tagged with the git commit; ``--compare`` prints the change
+against an earlier result. ``--url`` drives a running server over HTTP
+instead; stage timings are then not available.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+# (model, symptom) pairs for the knowledge base in mock_data.
+DEVICES = [
+    ("Lenovo ThinkPad T14s Gen 3", "screen keeps flickering and sometimes goes black"),
+    ("Dell XPS 15 9530", "battery drains from full to empty in two hours"),
+    ("Apple MacBook Pro 14-inch", "is stuck in a boot loop on the Apple logo"),
+    ("HP EliteBook 840 G9", "keeps dropping the Wi-Fi connection on 5GHz"),
+    ("Microsoft Surface Pro 9", "touchscreen is not responding and registers ghost touches"),
+    ("Lenovo IdeaPad 5 Pro 16", "is overheating and the fan runs at full speed"),
+    ("Dell Latitude 5540", "crashes with a DRIVER_IRQL_NOT_LESS_OR_EQUAL blue screen"),
+    ("ASUS ZenBook 14 OLED", "display stays black after waking from sleep"),
+]
+# Conversation kinds and their share of the mix.
+MIX = {"troubleshoot": 45, "model_followup": 20, "repeat": 15, "warranty": 10, "ticket": 10}
+# Asked over and over in "repeat" conversations. How-to questions report no
+# issue, so no ticket is created and the answer is cacheable.
+REPEATED_QUESTIONS = [
+    "How do I generate a battery report on my Dell XPS 15 9530?",
+    "How do I update the display driver on my Lenovo ThinkPad T14s Gen 3?",
+    "What should I check when my HP EliteBook 840 G9 drops Wi-Fi?",
+]
+
+
+def make_conversation(kind: str, rng: random.Random) -> list[str]:
+    if kind == "repeat":
+        return [rng.choice(REPEATED_QUESTIONS)]
+    model, symptom = rng.choice(DEVICES)
+    if kind == "troubleshoot":
+        return [f"My {model} {symptom}.", "I tried those steps but it still happens. What should I do next?"]
+    if kind == "model_followup":
+        return [f"My laptop {symptom}.", model]
+    if kind == "warranty":
+        return [f"Is my {model} still under warranty?"]
+    return [f"Create a ticket for my {model}: {symptom}"]
+
+
+# ---------------------------------------------------------------------------
+# Stage timing
+# ---------------------------------------------------------------------------
+
+class StageSamples:
+    """Stage durations and LLM call counts from the traces of the requests
+    the server finishes (a telemetry trace listener)."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.agent_llm_calls = 0
+
+    def __call__(self, trace, route: str) -> None:
+        for stage, seconds in trace.spans:
+            self.samples.setdefault(stage, []).append(seconds)
+        if route == "agent":
+            self.agent_llm_calls += trace.llm_calls
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def percentiles(samples: list[float]) -> dict:
+    """count, mean and p50/p95/p99/max in milliseconds (nearest rank)."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(rank(0.50), 2),
+        "p95_ms": round(rank(0.95), 2),
+        "p99_ms": round(rank(0.99), 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.kinds = self.rng.choices(list(MIX), weights=list(MIX.values()), k=args.conversations)
+        # Drawn up front so the mix does not depend on scheduling.
+        self.conversations = [make_conversation(kind, self.rng) for kind in self.kinds]
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.requests = 0
+
+    async def _send(self, message: str, session_id: str | None) -> str | None:
+        payload = {"message": message}
+        if session_id:
+            payload["session_id"] = session_id
+        started = time.perf_counter()
+        try:
+            response = await self.client.post("/api/chat", json=payload)
+        except httpx.HTTPError as exc:
+            self.errors[type(exc).__name__] = self.errors.get(type(exc).__name__, 0) + 1
+            return None
+        elapsed = time.perf_counter() - started
+        self.requests += 1
+        if response.status_code != 200:
+            self.errors[str(response.status_code)] = self.errors.get(str(response.status_code), 0) + 1
+            return None
+        body = response.json()
+        self.latencies.setdefault(body.get("route", "unknown"), []).append(elapsed)
+        return body.get("session_id")
+
+    async def _user(self, queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                conversation = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            session_id = None
+            for message in conversation:
+                session_id = await self._send(message, session_id)
+                if session_id is None:
+                    break
+                if self.args.think_ms:
+                    await asyncio.sleep(self.args.think_ms / 1000)
+
+    async def run(self) -> float:
+        queue: asyncio.Queue = asyncio.Queue()
+        for conversation in self.conversations:
+            queue.put_nowait(conversation)
+        started = time.perf_counter()
+        await asyncio.gather(*(self._user(queue) for _ in range(self.args.concurrency)))
+        return time.perf_counter() - started
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, timeout: float) -> None:
+    # The server loads its models after it starts accepting connections.
+    deadline = time.monotonic() + timeout
+    while True:
+        ready = await client.get("/api/health/ready")
+        if ready.status_code == 200:
+            return
+        if "failed" in ready.text or time.monotonic() > deadline:
+            raise SystemExit(f"Server is not ready ({ready.status_code}): {ready.text}")
+        await asyncio.sleep(0.2)
+
+
+async def _warm_up(client: httpx.AsyncClient, timeout: float) -> None:
+    # Runs the first searches and loads the warranty data outside the
+    # measured window (without asking any of the repeated questions).
+    await _wait_until_ready(client, timeout)
+    model, symptom = DEVICES[-1]
+    for message in (f"My {model} {symptom}.", f"Is my {model} still under warranty?"):
+        await client.post("/api/chat", json={"message": message})
+
+
+async def run_load_test(args: argparse.Namespace) -> dict:
+    stages = StageSamples()
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        app = None
+    else:
+        import main  # imported late: the environment configures ai_engine
+
+        app = main.app
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=args.timeout,
+        )
+
+    async def drive() -> tuple[LoadTest, float]:
+        async with client:
+            await _warm_up(client, args.timeout)
+            test = LoadTest(client, args)
+            if app is None:
+                return test, await test.run()
+            import telemetry
+
+            telemetry.add_trace_listener(stages)
+            try:
+                return test, await test.run()
+            finally:
+                telemetry.remove_trace_listener(stages)
+
+    if app is not None:
+        async with app.router.lifespan_context(app):
+            if not args.verbose:
+                # Per-request logging would drown the report.
+                logging.getLogger().setLevel(logging.WARNING)
+            test, elapsed = await drive()
+    else:
+        test, elapsed = await drive()
+
+    all_latencies = [s for samples in test.latencies.values() for s in samples]
+    warnings = []
+    if "repeat" in test.kinds and "cache" not in test.latencies:
+        warnings.append("No request was served from the response cache; the repeat conversations did not measure it.")
+    agent_requests = len(test.latencies.get("agent", []))
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "concurrency": args.concurrency,
+            "conversations": args.conversations,
+            "llm_latency_ms": args.llm_latency_ms,
+            "think_ms": args.think_ms,
+            "seed": args.seed,
+            "url": args.url,
+        },
+        "requests": test.requests,
+        "errors": test.errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(test.requests / elapsed, 2) if elapsed else 0.0,
+        "latency": percentiles(all_latencies),
+        "routes": {route: percentiles(samples) for route, samples in sorted(test.latencies.items())},
+        "stages": {stage: percentiles(samples) for stage, samples in sorted(stages.samples.items())},
+        "llm_calls_per_agent_request": (
+            round(stages.agent_llm_calls / agent_requests, 2) if agent_requests and app is not None else None
+        ),
+        "warnings": warnings,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def print_report(result: dict) -> None:
+    print(
+        f"\n{result['requests']} requests in {result['duration_s']:.1f}s "
+        f"({result['throughput_rps']} req/s), errors: {result['errors'] or 'none'}"
+    )
+    if result["llm_calls_per_agent_request"] is not None:
+        print(f"LLM calls per agent request: {result['llm_calls_per_agent_request']}")
+    print(f"\n{'':<34}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = [("all requests", result["latency"])]
+    rows += [(f"route {name}", stats) for name, stats in result["routes"].items()]
+    rows += [(f"stage {name}", stats) for name, stats in result["stages"].items()]
+    for name, stats in rows:
+        if stats.get("count"):
+            print(
+                f"{name:<34}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+                f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+            )
+    for warning in result.get("warnings", []):
+        print(f"\nWARNING: {warning}")
+
+
+def print_comparison(result: dict, baseline: dict) -> None:
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp', '?')}):")
+    print(f"  throughput  {baseline['throughput_rps']:>10} -> {result['throughput_rps']:<10}"
+          f"{change(result['throughput_rps'], baseline['throughput_rps'])}")
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        old, new = baseline["latency"].get(key), result["latency"].get(key)
+        if old is not None and new is not None:
+            print(f"  {key:<11} {old:>10} -> {new:<10}{change(new, old)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test /api/chat and report latency percentiles.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simulated users (default: 8)")
+    parser.add_argument("--conversations", type=int, default=200, help="Conversations to run (default: 200)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0,
+                        help="Fake LLM latency per call (default: 300)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between turns (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the conversation mix (default: 0)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--url", help="Drive a running server (e.g. http://localhost:8000) instead")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's request logging")
+    parser.add_argument("--out", help="Result file (default: loadtest_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    if not args.url:
+        os.environ.setdefault("LLM_PROVIDER", "fake")
+        os.environ.setdefault("FAKE_LLM_LATENCY_MS", str(args.llm_latency_ms))
+        os.environ.setdefault("TICKET_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "tickets.db"))
+    result = asyncio.run(run_load_test(args))
+
+    print_report(result)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            print_comparison(result, json.load(fh))
+    out = args.out or f"loadtest_{result['commit'] or 'result'}.json"
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, indent=1)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
+import asyncio
+import importlib
+import json
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import List, Optional
+from collections.abc import AsyncIterator
+from typing import Annotated, List, Literal, Optional
 
-from fastapi import FastAPI, HTTPException
+from typing_extensions import TypedDict
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, StringConstraints
+
+# Only light modules are imported here: LangChain, torch and FAISS come in
+# with ai_engine, which the startup task imports after the port is bound.
+from session_store import SESSION_ID_PATTERN, ChatSession
+from warranty_engine import WarrantyEngine, aiter_csv_devices, audit_error
 
-from ai_engine import initialize_vector_store, build_agent_executor, get_agent_response
+load_dotenv()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,29 +31,94 @@ logger = logging.getLogger(__name__)
 app_state: dict = {}
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    logger.info("=== SkillPalavar Agentic IT Assistant Backend Starting Up ===")
+# ---------------------------------------------------------------------------
+# STARTUP
+# ---------------------------------------------------------------------------
+# The server accepts connections as soon as this module is imported. A
+# background task then imports the AI engine, loads the embedding model and
+# the FAISS index, builds the agent and runs one dummy encode, so the first
+# request does not pay for the model's first forward pass. Until it is done,
+# /api/health/live answers and /api/health/ready reports the stage reached.
+
+def _startup_stage(stage: str, message: str) -> None:
+    app_state["startup_stage"] = stage
+    logger.info(message)
+
+
+async def _warm_up() -> None:
+    started = time.perf_counter()
     try:
-        logger.info("Initializing FAISS vector store...")
-        vector_store = initialize_vector_store()
+        _startup_stage("importing", "Importing the AI engine...")
+        engine = await asyncio.to_thread(importlib.import_module, "ai_engine")
+        app_state["engine"] = engine
+
+        _startup_stage("vector_store", "Initializing FAISS vector store...")
+        vector_store = await asyncio.to_thread(engine.initialize_vector_store)
         app_state["vector_store"] = vector_store
 
-        logger.info("Building AgentExecutor with 4 tools (search, ticket, warranty, escalate)...")
-        agent_executor = build_agent_executor(vector_store)
-        app_state["agent_executor"] = agent_executor
+        _startup_stage("agent", "Building AgentExecutor with 4 tools (search, ticket, warranty, escalate)...")
+        agent_executor = await asyncio.to_thread(engine.build_agent_executor, vector_store)
 
-        logger.info("=== Backend is ready. Agentic AI engine online. ===")
+        try:
+            _startup_stage("warranty", "Loading warranty records...")
+            await asyncio.to_thread(engine.get_warranty_engine)
+        except Exception as exc:
+            # Not fatal: the warranty tool reports the outage and retries the load.
+            logger.error("Warranty records failed to load: %s", exc)
+
+        try:
+            _startup_stage("tickets", "Opening ticket store...")
+            await asyncio.to_thread(engine.get_ticket_store)
+        except Exception as exc:
+            logger.error("Ticket store failed to open: %s", exc)
+
+        try:
+            _startup_stage("warm_up", "Warming up the embedding model and index...")
+            await asyncio.to_thread(engine.warm_up)
+        except Exception as exc:
+            # Not fatal: the first request pays for it instead.
+            logger.warning("Warm-up failed: %s", exc)
+
+        # Set last: its presence is what makes the server ready.
+        app_state["agent_executor"] = agent_executor
+        _startup_stage(
+            "ready",
+            f"=== Backend is ready after {time.perf_counter() - started:.1f}s. Agentic AI engine online. ===",
+        )
     except Exception as exc:
         logger.critical("FATAL: Failed to initialize AI engine on startup: %s", exc, exc_info=True)
         app_state["startup_error"] = str(exc)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("=== SkillPalavar Agentic IT Assistant Backend Starting Up ===")
+    warm_up = asyncio.create_task(_warm_up())
+
     yield
 
     logger.info("=== SkillPalavar Backend Shutting Down ===")
+    if not warm_up.done():
+        # The step running on a worker thread finishes on its own.
+        warm_up.cancel()
+    engine = app_state.get("engine")
+    if engine is not None:
+        engine.shutdown_blocking_executor()
+        engine.close_ticket_store()
+        engine.close_session_store()
     app_state.clear()
 
 
+def _engine():
+    """The ai_engine module, once the startup task has imported it."""
+    engine = app_state.get("engine")
+    if engine is None:
+        if "startup_error" in app_state:
+            raise HTTPException(status_code=503, detail="The AI engine failed to initialize.")
+        raise HTTPException(status_code=503, detail="The server is starting up. Please try again shortly.")
+    return engine
+
+
 app = FastAPI(
     title="SkillPalavar Agentic IT Assistant API",
     description="Agentic AI-powered IT Support Assistant with autonomous tool use for enterprise field service.",
@@ -75,9 +154,52 @@ class ChatRequest(BaseModel):
         max_length=2000,
         description="The user's IT support question or issue description.",
     )
+    session_id: Optional[str] = Field(
+        default=None,
+        pattern=SESSION_ID_PATTERN,
+        description="session_id from a previous response; omit to start a new conversation.",
+    )
     chat_history: Optional[List[HistoryMessage]] = Field(
         default=None,
-        description="Previous conversation turns for multi-turn context.",
+        description="Deprecated: previous turns, used only to seed a new session.",
+    )
+
+
+class DeviceRef(TypedDict, total=False):
+    # A TypedDict rather than a model: validating 100k devices into plain
+    # dicts is several times faster than building BaseModel instances.
+    serial: Annotated[str, StringConstraints(max_length=128)]
+    model: Annotated[str, StringConstraints(max_length=256)]
+
+
+_AUDIT_MAX_DEVICES = 500_000
+_AUDIT_BATCH_SIZE = 5000
+
+
+class WarrantyAuditRequest(BaseModel):
+    devices: List[DeviceRef] = Field(
+        ...,
+        max_length=_AUDIT_MAX_DEVICES,
+        description="Devices to check, each {\"serial\": ..., \"model\": ...}; the serial wins when known.",
+    )
+
+
+class TicketRecord(BaseModel):
+    ticket_id: str
+    kind: str = Field(..., description="'ticket' or 'escalation'")
+    issue_summary: str
+    device: str
+    priority: Optional[str] = None
+    status: str
+    linked_ticket_id: Optional[str] = Field(default=None, description="Ticket an escalation belongs to.")
+    created_at: str = Field(..., description="UTC, ISO 8601")
+
+
+class TicketPage(BaseModel):
+    items: List[TicketRecord]
+    next_cursor: Optional[int] = Field(
+        default=None,
+        description="Pass as ?cursor= to fetch the next page; null on the last page.",
     )
 
 
@@ -87,6 +209,16 @@ class ChatResponse(BaseModel):
         default=[],
         description="List of tool display names the agent invoked to produce this response.",
     )
+    session_id: str = Field(..., description="Send back with the next message to continue the conversation.")
+    route: str = Field(
+        default="agent",
+        description="What served the request: 'agent', 'cache' or 'router:<intent>' (a tool called directly).",
+    )
+
+
+class SessionHistory(BaseModel):
+    session_id: str
+    messages: List[HistoryMessage]
 
 
 # ---------------------------------------------------------------------------
@@ -97,6 +229,8 @@ class ChatResponse(BaseModel):
 async def root():
     if "startup_error" in app_state:
         return {"status": "degraded", "error": app_state["startup_error"]}
+    if "agent_executor" not in app_state:
+        return {"status": "starting", "stage": app_state.get("startup_stage"), "docs": "/docs"}
     return {
         "status": "healthy",
         "message": "SkillPalavar Agentic IT Assistant API v2.0 is running.",
@@ -106,30 +240,61 @@ async def root():
     }
 
 
+@app.get("/api/health/live", tags=["Health"])
+async def liveness():
+    """Liveness probe: the process is up and its event loop is responsive."""
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready", tags=["Health"])
+async def readiness():
+    """Readiness probe: 200 once the agent can take requests, 503 while the
+    engine is starting (``stage`` says how far it got) or if it failed."""
+    if "startup_error" in app_state:
+        raise HTTPException(status_code=503, detail=f"AI engine failed: {app_state['startup_error']}")
+    if "agent_executor" not in app_state:
+        raise HTTPException(status_code=503, detail=f"Starting up: {app_state.get('startup_stage') or 'pending'}.")
+    return {"status": "ready"}
+
+
 @app.get("/api/health", tags=["Health"])
 async def health_check():
     if "startup_error" in app_state:
         raise HTTPException(status_code=503, detail=f"AI engine failed: {app_state['startup_error']}")
     if "agent_executor" not in app_state:
         raise HTTPException(status_code=503, detail="Agent executor is not yet initialized.")
+    engine = _engine()
     return {
         "status": "healthy",
         "components": {
             "vector_store": "faiss",
             "agent": "AgentExecutor",
-            "llm": "gemini-1.5-pro",
+            "llm": engine.get_llm_info(),
             "tools": 4,
         },
+        "llm_client": engine.get_llm_stats(),
+        "vector_index": engine.get_vector_store_report(),
+        "caches": engine.get_cache_stats(),
+        "sessions": engine.get_session_store().stats(),
+        "routes": engine.get_route_stats(),
     }
 
 
-@app.post("/api/chat", response_model=ChatResponse, tags=["Chat"])
-async def chat(request: ChatRequest):
+@app.get("/metrics", tags=["Health"])
+async def metrics():
     """
-    Main agentic chat endpoint. The agent autonomously decides which tools to
-    call (knowledge base search, ticket creation, warranty check, escalation)
-    based on the user's message and conversation history.
+    Prometheus metrics: request latency by route, LLM calls and tool calls
+    per agent request, LLM and tool latency, retrieval stage latency, cache
+    hits and misses, and the LLM client's counters. 503 until the engine has
+    been imported.
     """
+    _engine()
+    from telemetry import METRICS_CONTENT_TYPE, render_metrics
+
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+def _require_agent_executor():
     if "startup_error" in app_state:
         raise HTTPException(
             status_code=503,
@@ -139,11 +304,200 @@ async def chat(request: ChatRequest):
     agent_executor = app_state.get("agent_executor")
     if agent_executor is None:
         raise HTTPException(status_code=503, detail="The AI agent is not yet ready. Please try again.")
+    return agent_executor
 
-    logger.info("Received chat request. Message: %.80s...", request.message)
 
+async def _open_session(request: ChatRequest) -> ChatSession:
     history = [msg.model_dump() for msg in request.chat_history] if request.chat_history else None
-    response_text, tool_calls = get_agent_response(agent_executor, request.message, history)
+    # Off the event loop: resuming a session may read it back from disk.
+    engine = _engine()
+    return await engine.run_blocking(engine.get_session_store().open, request.session_id, history)
+
+
+@app.post("/api/chat", response_model=ChatResponse, tags=["Chat"])
+async def chat(request: ChatRequest):
+    """
+    Main agentic chat endpoint. The agent autonomously decides which tools to
+    call (knowledge base search, ticket creation, warranty check, escalation)
+    based on the user's message and conversation history. Requests that map
+    to a single tool call are answered directly by the intent router.
+    """
+    agent_executor = _require_agent_executor()
+
+    logger.info("Received chat request. Message: %.80s...", request.message)
+
+    session = await _open_session(request)
+    response_text, tool_calls, route = await _engine().aget_agent_response(
+        agent_executor, request.message, session=session,
+    )
+
+    logger.info("Response ready via %s. Tools used: %s", route, tool_calls)
+    return ChatResponse(response=response_text, tool_calls=tool_calls, session_id=session.session_id, route=route)
+
+
+@app.post("/api/chat/stream", tags=["Chat"])
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /api/chat using Server-Sent Events. Emits
+    ``tool_start`` / ``tool_end`` events as the agent invokes tools, ``token``
+    events as the LLM generates text, and a final ``done`` event carrying the
+    same fields as ChatResponse (``error`` events carry ``session_id`` too).
+    """
+    agent_executor = _require_agent_executor()
+
+    logger.info("Received streaming chat request. Message: %.80s...", request.message)
+    session = await _open_session(request)
+
+    async def event_source():
+        async for event in _engine().astream_agent_response(agent_executor, request.message, session=session):
+            if event["type"] in ("done", "error"):
+                event["session_id"] = session.session_id
+            if event["type"] == "done":
+                logger.info("Streamed response ready via %s. Tools used: %s", event["route"], event["tool_calls"])
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/sessions/{session_id}", response_model=SessionHistory, tags=["Chat"])
+async def get_session(session_id: str):
+    """The stored history of a conversation."""
+    engine = _engine()
+    session = await engine.run_blocking(engine.get_session_store().get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return SessionHistory(session_id=session.session_id, messages=list(session.history))
+
+
+@app.delete("/api/sessions/{session_id}", status_code=204, tags=["Chat"])
+async def delete_session(session_id: str):
+    """Forget a conversation."""
+    engine = _engine()
+    if not await engine.run_blocking(engine.get_session_store().delete, session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+
+
+# ---------------------------------------------------------------------------
+# TICKETS
+# ---------------------------------------------------------------------------
+
+def _require_ticket_store():
+    engine = _engine()
+    try:
+        return engine.get_ticket_store()
+    except Exception as exc:
+        logger.error("Ticket store is unavailable: %s", exc)
+        raise HTTPException(status_code=503, detail="The ticketing system is not available.")
+
+
+@app.get("/api/tickets", response_model=TicketPage, tags=["Tickets"])
+async def list_tickets(
+    status: Optional[str] = Query(None, description="e.g. Open, Escalated"),
+    device: Optional[str] = Query(None, description="Laptop model, matched case- and punctuation-insensitively"),
+    kind: Optional[Literal["ticket", "escalation"]] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+):
+    """Tickets and escalations, newest first, with keyset pagination."""
+    store = _require_ticket_store()
+    items, next_cursor = await _engine().run_blocking(
+        store.list, status=status, device=device, kind=kind, limit=limit, cursor=cursor,
+    )
+    return TicketPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/tickets/{ticket_id}", response_model=TicketRecord, tags=["Tickets"])
+async def get_ticket(ticket_id: str):
+    store = _require_ticket_store()
+    ticket = await _engine().run_blocking(store.get, ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail=f"Ticket {ticket_id} not found.")
+    return ticket
+
+
+# ---------------------------------------------------------------------------
+# WARRANTY AUDIT
+# ---------------------------------------------------------------------------
+
+_AUDIT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _require_warranty_engine() -> WarrantyEngine:
+    engine = _engine()
+    try:
+        return engine.get_warranty_engine()
+    except Exception as exc:
+        logger.error("Warranty records are unavailable: %s", exc)
+        raise HTTPException(status_code=503, detail="Warranty records are not available.")
+
+
+def _audit_response(engine: WarrantyEngine, batches: AsyncIterator[list[dict]], output: str) -> StreamingResponse:
+    run_blocking = _engine().run_blocking
+
+    async def body():
+        row = 1
+        try:
+            async for batch in batches:
+                # Lookups and serialization run off the event loop, one batch at a time.
+                yield await run_blocking(engine.audit, batch, row, output, row == 1)
+                row += len(batch)
+        except ValueError as exc:
+            # The status line has gone out; the stream ends with an error record.
+            logger.warning("Warranty audit stopped at row %d: %s", row, exc)
+            yield audit_error(row, str(exc), output)
+
+    return StreamingResponse(body(), media_type=_AUDIT_MEDIA_TYPES[output])
+
+
+@app.post("/api/warranty/audit", tags=["Warranty"])
+async def warranty_audit(
+    request: WarrantyAuditRequest,
+    output: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+):
+    """
+    Check warranty status for a list of devices without involving the agent.
+    Streams one record per device, in input order: row, serial, model,
+    status, days_remaining, plan, expires.
+    """
+    engine = _require_warranty_engine()
+    devices = request.devices
+    logger.info("Warranty audit of %d devices.", len(devices))
+
+    async def batches():
+        for start in range(0, len(devices), _AUDIT_BATCH_SIZE):
+            yield devices[start:start + _AUDIT_BATCH_SIZE]
+
+    return _audit_response(engine, batches(), output)
+
+
+@app.post("/api/warranty/audit/csv", tags=["Warranty"])
+async def warranty_audit_csv(
+    request: Request,
+    output: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+):
+    """
+    Same as /api/warranty/audit for a CSV upload sent as the raw request body
+    (``Content-Type: text/csv``) with a ``serial`` and/or ``model`` header
+    column. The upload is parsed as it arrives, so results start streaming
+    before the whole file has been received.
+    """
+    engine = _require_warranty_engine()
+    batches = aiter_csv_devices(request.stream(), _AUDIT_BATCH_SIZE)
+    try:
+        first = await anext(batches)
+    except StopAsyncIteration:
+        first = []
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    async def all_batches():
+        if first:
+            yield first
+        async for batch in batches:
+            yield batch
 
-    logger.info("Agent response ready. Tools used: %s", tool_calls)
-    return ChatResponse(response=response_text, tool_calls=tool_calls)
+    return _audit_response(engine, all_batches(), output)
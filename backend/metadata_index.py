@@ -0,0 +1,174 @@
+"""
+Posting lists from chunk metadata (laptop model, category) to FAISS positions.
+
+Used to restrict knowledge base searches to one model's documentation.
+Chunks without a value for a field (general guides) belong to every subset
+of that field, so filtering never hides vendor-neutral documentation.
+``save`` writes the lists next to a prebuilt index; ``load`` maps them.
+"""
+
+import json
+import logging
+import os
+import re
+from collections.abc import Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METADATA_FIELDS = ("model", "category")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_META_FILE = "metadata.json"
+_POSITIONS_FILE = "positions.npy"
+
+
+def _words(value: str) -> tuple[str, ...]:
+    return tuple(_WORD_RE.findall(value.lower()))
+
+
+def _field_values(field: str, value: str) -> list[str]:
+    # "Display / Hardware" is listed under both categories.
+    parts = value.split("/") if field == "category" else [value]
+    return [" ".join(_words(part)) for part in parts if _words(part)]
+
+
+class MetadataIndexBuilder:
+    """Collects chunk metadata one entry at a time; the n-th ``add`` is chunk
+    position n."""
+
+    def __init__(self):
+        self._raw: dict[str, dict[str, list[int]]] = {field: {} for field in METADATA_FIELDS}
+        self._unlabeled: dict[str, list[int]] = {field: [] for field in METADATA_FIELDS}
+        self._size = 0
+
+    def add(self, metadata: dict) -> None:
+        position = self._size
+        self._size += 1
+        for field in METADATA_FIELDS:
+            values = _field_values(field, str(metadata.get(field) or ""))
+            if not values:
+                self._unlabeled[field].append(position)
+            for value in values:
+                self._raw[field].setdefault(value, []).append(position)
+
+    def build(self) -> "MetadataIndex":
+        return MetadataIndex(
+            {f: {v: np.asarray(p, dtype="int64") for v, p in vals.items()} for f, vals in self._raw.items()},
+            {f: np.asarray(p, dtype="int64") for f, p in self._unlabeled.items()},
+            self._size,
+        )
+
+
+class MetadataIndex:
+    """
+    Per-field posting lists: normalized value -> sorted int64 positions.
+
+    A filter matches every stored value whose words include all of the
+    filter's words, so "T14s Gen 3" selects "Lenovo ThinkPad T14s Gen 3" and
+    "ThinkPad" selects every ThinkPad.
+    """
+
+    _MAX_CACHED_SUBSETS = 256
+
+    def __init__(self, postings: dict[str, dict[str, np.ndarray]], unlabeled: dict[str, np.ndarray], size: int):
+        self._postings = postings
+        self._unlabeled = unlabeled
+        self.size = size
+        # The same filter returns the same array, so the search batcher can
+        # serve concurrent searches for one model with one FAISS call.
+        self._subsets: dict[tuple[str | None, str | None], np.ndarray | None] = {}
+
+    @classmethod
+    def build(cls, metadatas: Iterable[dict]) -> "MetadataIndex":
+        """Index ``metadatas``; the i-th entry is chunk position i."""
+        builder = MetadataIndexBuilder()
+        for metadata in metadatas:
+            builder.add(metadata)
+        index = builder.build()
+        logger.info(
+            "Metadata index built: %s.",
+            ", ".join(f"{len(index._postings[f])} {f} value(s)" for f in METADATA_FIELDS),
+        )
+        return index
+
+    def save(self, folder: str) -> None:
+        """Write the posting lists to ``folder`` for ``load``: one array of
+        positions, and per list its [start, end) range in it."""
+        os.makedirs(folder, exist_ok=True)
+        arrays: list[np.ndarray] = []
+        offset = 0
+
+        def span(positions: np.ndarray) -> list[int]:
+            nonlocal offset
+            arrays.append(positions)
+            offset += len(positions)
+            return [offset - len(positions), offset]
+
+        meta = {
+            "chunks": self.size,
+            "values": {f: {v: span(p) for v, p in self._postings[f].items()} for f in METADATA_FIELDS},
+            "unlabeled": {f: span(self._unlabeled[f]) for f in METADATA_FIELDS},
+        }
+        positions = np.concatenate(arrays) if arrays else np.empty(0, dtype="int64")
+        np.save(os.path.join(folder, _POSITIONS_FILE), positions.astype("int64"))
+        with open(os.path.join(folder, _META_FILE), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, _META_FILE))
+
+    @classmethod
+    def load(cls, folder: str) -> "MetadataIndex":
+        """Open lists written by ``save``, memory-mapped and read-only."""
+        with open(os.path.join(folder, _META_FILE), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        positions = np.load(os.path.join(folder, _POSITIONS_FILE), mmap_mode="r")
+        return cls(
+            {f: {v: positions[s:e] for v, (s, e) in meta["values"][f].items()} for f in METADATA_FIELDS},
+            {f: positions[s:e] for f, (s, e) in meta["unlabeled"].items()},
+            meta["chunks"],
+        )
+
+    def values(self, field: str) -> list[str]:
+        return sorted(self._postings[field])
+
+    def words(self, field: str) -> frozenset[str]:
+        """Every word of the stored values of ``field``."""
+        return frozenset(word for value in self._postings[field] for word in value.split())
+
+    def matching_values(self, field: str, query: str) -> list[str]:
+        wanted = set(_words(query))
+        if not wanted:
+            return []
+        return [value for value in self._postings[field] if wanted.issubset(value.split())]
+
+    def subset(self, model: str | None = None, category: str | None = None) -> np.ndarray | None:
+        """Sorted positions matching every given filter, or None when no
+        filter was given or a filter matches no stored value."""
+        key = (model, category)
+        if key not in self._subsets:
+            if len(self._subsets) >= self._MAX_CACHED_SUBSETS:
+                self._subsets.clear()
+            self._subsets[key] = self._compute_subset(model, category)
+        return self._subsets[key]
+
+    def _compute_subset(self, model: str | None, category: str | None) -> np.ndarray | None:
+        result: np.ndarray | None = None
+        for field, query in (("model", model), ("category", category)):
+            if not query:
+                continue
+            matches = self.matching_values(field, query)
+            if not matches:
+                logger.info("No %s matches '%s'; searching without that filter.", field, query)
+                continue
+            positions = np.unique(np.concatenate(
+                [self._postings[field][value] for value in matches] + [self._unlabeled[field]]
+            ))
+            result = positions if result is None else np.intersect1d(result, positions)
+        return result
+
+    def stats(self) -> dict:
+        return {field: len(self._postings[field]) for field in METADATA_FIELDS}
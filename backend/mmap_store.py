@@ -0,0 +1,159 @@
+"""
+Read-only, memory-mapped on-disk format for the knowledge base index.
+
+Each store directory holds:
+
+- ``index.faiss``: written so faiss can map it with IO_FLAG_MMAP. faiss only
+  maps inverted lists, so flat and sq8 indexes are stored as a single-list
+  IVF, which is still an exhaustive, exact scan over the same codes.
+- ``docs.bin`` / ``docs.offsets.npy``: one JSON record per chunk, addressed
+  by FAISS position, instead of a pickled docstore.
+
+Every uvicorn worker that opens the same files shares one copy through the
+OS page cache, and opening is O(1): nothing is deserialized up front.
+"""
+
+import json
+import logging
+import mmap
+import os
+from collections.abc import Iterator, Mapping
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+DOCS_FILE = "docs.bin"
+DOCS_OFFSETS_FILE = "docs.offsets.npy"
+INDEX_FILE = "index.faiss"
+
+_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+def is_mmap_store(folder: str) -> bool:
+    return os.path.exists(os.path.join(folder, DOCS_OFFSETS_FILE))
+
+
+# ---------------------------------------------------------------------------
+# DOCSTORE
+# ---------------------------------------------------------------------------
+
+class PositionalIds(Mapping):
+    """``index_to_docstore_id`` for a positional docstore: FAISS id i maps to
+    docstore key i, without materializing a dict of n entries."""
+
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, i: int) -> int:
+        i = int(i)
+        if not 0 <= i < self._size:
+            raise KeyError(i)
+        return i
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._size))
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class MmapDocstore(Docstore):
+    """Read-only docstore over one or more memory-mapped ``docs.bin`` files,
+    addressed by global FAISS position."""
+
+    def __init__(self, folders: list[str]):
+        self._blobs: list[mmap.mmap] = []
+        self._offsets: list[np.ndarray] = []
+        for folder in folders:
+            with open(os.path.join(folder, DOCS_FILE), "rb") as fh:
+                self._blobs.append(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+            self._offsets.append(np.load(os.path.join(folder, DOCS_OFFSETS_FILE), mmap_mode="r"))
+        self._starts = np.cumsum([0] + [len(off) - 1 for off in self._offsets])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def search(self, search) -> Document | str:
+        position = int(search)
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        segment = int(np.searchsorted(self._starts, position, side="right") - 1)
+        local = position - self._starts[segment]
+        offsets = self._offsets[segment]
+        record = json.loads(self._blobs[segment][int(offsets[local]):int(offsets[local + 1])])
+        return Document(id=record["id"], page_content=record["text"], metadata=record["metadata"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(blob) for blob in self._blobs)
+
+
+def write_docstore(folder: str, documents: list[Document]) -> None:
+    offsets = np.zeros(len(documents) + 1, dtype="int64")
+    with open(os.path.join(folder, DOCS_FILE), "wb") as fh:
+        for i, doc in enumerate(documents):
+            record = json.dumps(
+                {"id": doc.id, "text": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+            fh.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    np.save(os.path.join(folder, DOCS_OFFSETS_FILE), offsets)
+
+
+# ---------------------------------------------------------------------------
+# INDEX
+# ---------------------------------------------------------------------------
+
+def to_mappable_index(index: faiss.Index) -> faiss.Index:
+    """Return an equivalent index whose bulk data faiss can memory-map."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return index
+    n, d = index.ntotal, index.d
+    if isinstance(index, faiss.IndexFlatL2):
+        ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, 1)
+        ivf.quantizer.add(np.zeros((1, d), dtype="float32"))
+        ivf.is_trained = True
+        if n:
+            ivf.add(index.reconstruct_n(0, n))
+        return ivf
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        ivf = faiss.IndexIVFScalarQuantizer(
+            faiss.IndexFlatL2(d), d, 1, index.sq.qtype, faiss.METRIC_L2, False,
+        )
+        ivf.quantizer.add(np.zeros((1, d), dtype="float32"))
+        # Reuse the trained ranges; re-encoding decoded values reproduces
+        # the original codes.
+        ivf.sq = index.sq
+        ivf.is_trained = True
+        if n:
+            ivf.add(index.reconstruct_n(0, n))
+        return ivf
+    logger.warning(
+        "%s cannot be memory-mapped by faiss; each worker will load a private copy.",
+        type(index).__name__,
+    )
+    return index
+
+
+def write_mmap_store(folder: str, index: faiss.Index, documents: list[Document]) -> None:
+    """Write ``index`` and its documents (in FAISS position order)."""
+    os.makedirs(folder, exist_ok=True)
+    faiss.write_index(to_mappable_index(index), os.path.join(folder, INDEX_FILE))
+    write_docstore(folder, documents)
+
+
+def open_mmap_index(folders: list[str]) -> faiss.Index:
+    indexes = [faiss.read_index(os.path.join(folder, INDEX_FILE), _MMAP_FLAGS) for folder in folders]
+    if len(indexes) == 1:
+        return indexes[0]
+    combined = faiss.IndexShards(indexes[0].d, True, True)
+    for index in indexes:
+        combined.add_shard(index)
+    return combined
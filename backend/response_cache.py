@@ -0,0 +1,240 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!]+$")
+
+
+def normalize_message(text: str) -> str:
+    """Canonical form used for exact-match keys: lowercase, single spaces,
+    no trailing punctuation."""
+    text = _WHITESPACE_RE.sub(" ", text.strip().lower())
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def history_fingerprint(chat_history: list[dict] | None) -> str:
+    """Stable digest of the conversation so far. Empty history -> ''."""
+    if not chat_history:
+        return ""
+    digest = hashlib.sha256()
+    for msg in chat_history:
+        digest.update(msg.get("role", "").encode())
+        digest.update(b"\x00")
+        digest.update(normalize_message(msg.get("content", "")).encode())
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+@dataclass
+class _CacheEntry:
+    entry_id: int
+    key: str
+    fingerprint: str
+    response: str
+    tool_calls: list[str]
+    created_at: float
+    size_bytes: int
+    has_vector: bool = False
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    rejected: int = 0
+    evictions: int = 0
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of final agent responses.
+
+    Lookups first try an exact key (normalized message + history fingerprint).
+    In semantic mode a miss falls back to a nearest-neighbour search over the
+    embeddings of previously answered messages; a hit requires cosine
+    similarity >= ``similarity_threshold`` *and* an identical history
+    fingerprint, so follow-up turns never receive an answer produced for a
+    different conversation.
+
+    Eviction is least-recently-used, bounded by both ``max_entries`` and an
+    approximate ``max_bytes`` footprint (text + stored vector).
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        semantic: bool = True,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        search_k: int = 5,
+    ):
+        self._embeddings = embeddings
+        self.semantic = semantic and embeddings is not None
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.search_k = search_k
+
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._by_id: dict[int, _CacheEntry] = {}
+        self._next_id = 0
+        self._bytes = 0
+        self._index: faiss.IndexIDMap | None = None
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    # -- keys & vectors ------------------------------------------------------
+
+    @staticmethod
+    def make_key(user_message: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\x02{normalize_message(user_message)}".encode()).hexdigest()
+
+    def _embed(self, user_message: str) -> np.ndarray:
+        vec = np.asarray(self._embeddings.embed_query(normalize_message(user_message)), dtype="float32")
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        return vec.reshape(1, -1)
+
+    def _ensure_index(self, dim: int) -> faiss.IndexIDMap:
+        if self._index is None:
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        return self._index
+
+    # -- eviction ------------------------------------------------------------
+
+    def _remove(self, entry: _CacheEntry) -> None:
+        self._entries.pop(entry.key, None)
+        self._by_id.pop(entry.entry_id, None)
+        self._bytes -= entry.size_bytes
+        if entry.has_vector and self._index is not None:
+            self._index.remove_ids(np.array([entry.entry_id], dtype="int64"))
+
+    def _expired(self, entry: _CacheEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _evict_to_limits(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, oldest = next(iter(self._entries.items()))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    # -- public API ----------------------------------------------------------
+
+    def lookup(self, user_message: str, chat_history: list[dict] | None = None) -> tuple[str, list[str]] | None:
+        """Return a cached (response_text, tool_calls) or None."""
+        fingerprint = history_fingerprint(chat_history)
+        key = self.make_key(user_message, fingerprint)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, now):
+                    self._remove(entry)
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats.exact_hits += 1
+                    return entry.response, list(entry.tool_calls)
+            if not self.semantic or self._index is None or self._index.ntotal == 0:
+                self.stats.misses += 1
+                return None
+
+        # Embedding runs outside the lock; it is the expensive part.
+        query_vec = self._embed(user_message)
+
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                self.stats.misses += 1
+                return None
+            scores, ids = self._index.search(query_vec, min(self.search_k, self._index.ntotal))
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or score < self.similarity_threshold:
+                    break
+                entry = self._by_id.get(int(entry_id))
+                if entry is None or entry.fingerprint != fingerprint:
+                    continue
+                if self._expired(entry, now):
+                    self._remove(entry)
+                    continue
+                self._entries.move_to_end(entry.key)
+                self.stats.semantic_hits += 1
+                logger.info("Semantic cache hit (similarity %.3f).", score)
+                return entry.response, list(entry.tool_calls)
+            self.stats.misses += 1
+            return None
+
+    def store(
+        self,
+        user_message: str,
+        chat_history: list[dict] | None,
+        response_text: str,
+        tool_calls: list[str],
+    ) -> None:
+        fingerprint = history_fingerprint(chat_history)
+        key = self.make_key(user_message, fingerprint)
+        query_vec = self._embed(user_message) if self.semantic else None
+
+        size = len(user_message.encode()) + len(response_text.encode()) + 256
+        if query_vec is not None:
+            size += query_vec.nbytes
+        if size > self.max_bytes:
+            with self._lock:
+                self.stats.rejected += 1
+            return
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._remove(existing)
+
+            entry = _CacheEntry(
+                entry_id=self._next_id,
+                key=key,
+                fingerprint=fingerprint,
+                response=response_text,
+                tool_calls=list(tool_calls),
+                created_at=time.monotonic(),
+                size_bytes=size,
+                has_vector=query_vec is not None,
+            )
+            self._next_id += 1
+            if query_vec is not None:
+                self._ensure_index(query_vec.shape[1]).add_with_ids(
+                    query_vec, np.array([entry.entry_id], dtype="int64")
+                )
+            self._entries[key] = entry
+            self._by_id[entry.entry_id] = entry
+            self._bytes += size
+            self.stats.stores += 1
+            self._evict_to_limits()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_id.clear()
+            self._bytes = 0
+            if self._index is not None:
+                self._index.reset()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
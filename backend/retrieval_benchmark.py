@@ -0,0 +1,390 @@
+"""
+Retrieval benchmark: recall@k, QPS, build time and memory per index type.
+
+Synthesizes a large knowledge base from the templates in mock_data: every
+document is one of the eight guides rewritten for a different model number
+(the same numbers change throughout the text), with its symptoms shuffled,
+one root cause dropped and an error code of its own. Labeled queries ask
+about one document's symptom, its issue or its error code; the answer is
+that document (or another one written for the same model and issue).
+
+The corpus is chunked with the server's splitter and embedded once with the
+server's embedding model; then every index configuration is built over the
+same vectors and measured:
+
+- build time and index memory (``memory_report``);
+- recall@k against the labels, without and with the laptop-model filter
+  the search tool applies;
+- recall@k against exact search (``flat``), i.e. how much the index loses;
+- single-query and batched QPS.
+
+    python retrieval_benchmark.py --docs 5000 --queries 1000
+    python retrieval_benchmark.py --config flat --config "hnsw:hnsw_ef_search=32,hnsw_m=16" --hybrid
+
+``--config`` takes ``<index type>[:<field>=<value>,...]`` with the fields
+of ``IndexConfig``; repeat it to compare several. ``--hybrid`` fuses each
+ranking with BM25 the way the server does in hybrid mode.
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import textwrap
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, fields
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from metadata_index import MetadataIndex
+from mock_data import MOCK_IT_DOCUMENTS
+from vector_index import IndexConfig, build_faiss_store, memory_report, split_document
+
+logger = logging.getLogger("retrieval_benchmark")
+
+DEFAULT_CONFIGS = [
+    "flat",
+    "hnsw:hnsw_ef_search=16",
+    "hnsw",
+    "hnsw:hnsw_ef_search=128",
+    "ivf:ivf_nprobe=1",
+    "ivf",
+    "ivf:ivf_nprobe=32",
+    "sq8",
+    "sq8:rerank_factor=4",
+    "ivfpq",
+    "ivfpq:rerank_factor=4",
+]
+# Query kinds and their share of the labeled queries.
+QUERY_MIX = {"symptom": 50, "issue": 30, "code": 20}
+# As in ai_engine: hybrid search fuses this many candidates per result.
+_HYBRID_CANDIDATES = 4
+_RRF_K = 60
+_EMBED_BATCH = 256
+
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+
+_TEMPLATES = [textwrap.dedent(doc).strip() for doc in MOCK_IT_DOCUMENTS]
+_HEADER_RE = re.compile(r"^(Document|Model|Issue):[ \t]*(.+)$", re.M)
+# Model-name tokens with a digit ("T14s", "9530", "UX3402") are renumbered.
+_MODEL_TOKEN_RE = re.compile(r"[A-Za-z0-9]*\d[A-Za-z0-9]*")
+
+
+@dataclass
+class SyntheticDoc:
+    document: Document
+    model: str
+    short_model: str
+    issue: str
+    symptoms: list[str]
+    error_code: str
+
+
+@dataclass
+class LabeledQuery:
+    text: str
+    kind: str
+    model: str
+    relevant: frozenset[str]  # document sources
+
+
+def _section_lines(text: str, heading: str) -> tuple[int, int]:
+    """Line range of the list under ``heading`` (up to the next blank line)."""
+    lines = text.splitlines()
+    start = lines.index(heading) + 1
+    end = start
+    while end < len(lines) and lines[end].strip():
+        end += 1
+    return start, end
+
+
+def _renumber(text: str, mapping: dict[str, str]) -> str:
+    if not mapping:
+        return text
+    pattern = re.compile(r"\b(%s)\b" % "|".join(map(re.escape, sorted(mapping, key=len, reverse=True))))
+    return pattern.sub(lambda m: mapping[m.group()], text)
+
+
+def synthesize_document(index: int, rng: random.Random) -> SyntheticDoc:
+    """Document ``index`` of the synthetic corpus."""
+    template_index = index % len(_TEMPLATES)
+    text = _TEMPLATES[template_index]
+    headers = dict(_HEADER_RE.findall(text))
+    mapping = {
+        token: re.sub(r"\d", lambda _: str(rng.randrange(10)), token)
+        for token in set(_MODEL_TOKEN_RE.findall(headers["Model"]))
+        if len(token) >= 2
+    }
+    text = _renumber(text, mapping)
+
+    lines = text.splitlines()
+    start, end = _section_lines(text, "Symptoms:")
+    symptoms = lines[start:end]
+    rng.shuffle(symptoms)
+    error_code = f"0x{rng.getrandbits(32):08X}"
+    symptoms.append(f"- Event log records error code {error_code}")
+    lines[start:end] = symptoms
+    text = "\n".join(lines)
+
+    lines = text.splitlines()
+    start, end = _section_lines(text, "Root Causes:")
+    causes = [re.sub(r"^\d+\.\s*", "", line) for line in lines[start:end]]
+    causes.pop(rng.randrange(len(causes)))
+    lines[start:end] = [f"{i}. {cause}" for i, cause in enumerate(causes, 1)]
+    text = "\n".join(lines)
+
+    headers = dict(_HEADER_RE.findall(text))
+    model = headers["Model"]
+    return SyntheticDoc(
+        document=Document(page_content=text, metadata={"source": f"synthetic_{index}"}),
+        model=model,
+        short_model=headers["Document"].split(" - ")[0],
+        issue=headers["Issue"].split(",")[0].strip(),
+        symptoms=[s.lstrip("- ").rstrip(".") for s in symptoms[:-1]],
+        error_code=error_code,
+    )
+
+
+def synthesize_corpus(n_docs: int, seed: int = 0) -> list[SyntheticDoc]:
+    rng = random.Random(seed)
+    return [synthesize_document(i, rng) for i in range(n_docs)]
+
+
+def make_queries(corpus: list[SyntheticDoc], n_queries: int, seed: int = 0) -> list[LabeledQuery]:
+    """Labeled queries about random documents of ``corpus``. Every document
+    the query text cannot tell apart from the one it was made from (same
+    guide, same model as named in the query) counts as relevant."""
+    rng = random.Random(seed + 1)
+    by_short_model: dict[tuple[str, str], set[str]] = {}
+    by_model: dict[tuple[str, str], set[str]] = {}
+    for doc in corpus:
+        source = doc.document.metadata["source"]
+        by_short_model.setdefault((doc.issue, doc.short_model), set()).add(source)
+        by_model.setdefault((doc.issue, doc.model), set()).add(source)
+    kinds, weights = zip(*QUERY_MIX.items())
+    queries = []
+    for _ in range(n_queries):
+        doc = rng.choice(corpus)
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "symptom":
+            symptom = rng.choice(doc.symptoms)
+            text = f"{symptom} on my {doc.short_model}"
+            relevant = by_short_model[doc.issue, doc.short_model]
+        elif kind == "issue":
+            text = f"{doc.issue} on {doc.model}"
+            relevant = by_model[doc.issue, doc.model]
+        else:
+            text = f"{doc.short_model} shows error {doc.error_code}"
+            relevant = {doc.document.metadata["source"]}
+        queries.append(LabeledQuery(text, kind, doc.short_model, frozenset(relevant)))
+    return queries
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def parse_config(spec: str) -> IndexConfig:
+    """``hnsw:hnsw_ef_search=32,hnsw_m=16`` -> IndexConfig."""
+    index_type, _, params = spec.partition(":")
+    known = {f.name for f in fields(IndexConfig)}
+    values: dict = {"index_type": index_type.strip()}
+    for item in filter(None, (p.strip() for p in params.split(","))):
+        name, _, value = item.partition("=")
+        if name not in known or name == "index_type":
+            raise ValueError(f"Unknown index setting '{name}' in '{spec}'.")
+        values[name] = int(value)
+    return IndexConfig(**values)
+
+
+def embed_texts(texts: list[str], embed: Callable[[list[str]], list[list[float]]]) -> np.ndarray:
+    vectors = []
+    started = time.perf_counter()
+    for i in range(0, len(texts), _EMBED_BATCH):
+        vectors.extend(embed(texts[i:i + _EMBED_BATCH]))
+        if (i // _EMBED_BATCH) % 20 == 19:
+            logger.info("Embedded %d/%d texts (%.0f/s).", i + _EMBED_BATCH, len(texts),
+                        (i + _EMBED_BATCH) / (time.perf_counter() - started))
+    return np.asarray(vectors, dtype="float32")
+
+
+class RetrievalBenchmark:
+    """One corpus, its labeled queries and their embeddings; ``run`` measures
+    one index configuration over them."""
+
+    def __init__(
+        self,
+        chunks: list[Document],
+        vectors: np.ndarray,
+        queries: list[LabeledQuery],
+        query_vectors: np.ndarray,
+        k: int = 3,
+        hybrid: bool = False,
+    ):
+        self.chunks = chunks
+        self.vectors = vectors
+        self.queries = queries
+        self.query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        self.k = k
+        self.sources = [c.metadata["source"] for c in chunks]
+        metadata = MetadataIndex.build(c.metadata for c in chunks)
+        self.subsets = [metadata.subset(model=q.model) for q in queries]
+        self.lexical = LexicalIndex.build(c.page_content for c in chunks) if hybrid else None
+        exact = IndexConfig().build(vectors)
+        _, self.exact_ids = exact.search(self.query_vectors, k)
+
+    @property
+    def fetch_k(self) -> int:
+        return self.k * _HYBRID_CANDIDATES if self.lexical is not None else self.k
+
+    def _rankings(self, ids: np.ndarray, subsets: list[np.ndarray | None]) -> list[list[int]]:
+        rankings = []
+        for row, query, subset in zip(ids, self.queries, subsets):
+            ranking = [int(i) for i in row if i != -1]
+            if self.lexical is not None:
+                lexical = self.lexical.search(query.text, self.fetch_k, subset)
+                ranking = reciprocal_rank_fusion([ranking, lexical], self.k, _RRF_K)
+            rankings.append(ranking[:self.k])
+        return rankings
+
+    def _recall(self, rankings: list[list[int]], kind: str | None = None) -> float:
+        hits = [
+            any(self.sources[p] in query.relevant for p in ranking)
+            for query, ranking in zip(self.queries, rankings)
+            if kind is None or query.kind == kind
+        ]
+        return round(sum(hits) / len(hits), 4) if hits else 0.0
+
+    def run(self, label: str, config: IndexConfig) -> dict:
+        started = time.perf_counter()
+        vs = build_faiss_store(self.chunks, self.vectors, None, config)
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vs.search_vectors(self.query_vectors, self.fetch_k)
+        batch_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        single_ids = [vs.search_vectors(q[None], self.fetch_k)[1][0] for q in self.query_vectors]
+        single_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        filtered_ids = [
+            vs.search_vectors(q[None], self.fetch_k, subset)[1][0]
+            for q, subset in zip(self.query_vectors, self.subsets)
+        ]
+        filtered_s = time.perf_counter() - started
+
+        vector_top_k = np.asarray(single_ids)[:, :self.k]
+        ann_recall = np.mean([
+            len(set(row[row >= 0]) & set(exact[exact >= 0])) / max(1, (exact >= 0).sum())
+            for row, exact in zip(vector_top_k, self.exact_ids)
+        ])
+        rankings = self._rankings(np.asarray(single_ids), [None] * len(self.queries))
+        filtered = self._rankings(np.asarray(filtered_ids), self.subsets)
+        n = len(self.queries)
+        memory = memory_report(vs)
+        return {
+            "config": label,
+            "settings": config.to_dict(),
+            "build_s": round(build_s, 3),
+            "index_bytes": memory["index_bytes"],
+            "compression": memory["compression"],
+            "rerank_vectors_on_disk_bytes": memory["rerank_vectors_on_disk_bytes"],
+            f"recall@{self.k}": self._recall(rankings),
+            f"recall@{self.k}_by_kind": {kind: self._recall(rankings, kind) for kind in QUERY_MIX},
+            f"filtered_recall@{self.k}": self._recall(filtered),
+            f"ann_recall@{self.k}": round(float(ann_recall), 4),
+            "qps": round(n / single_s, 1) if single_s else 0.0,
+            "batch_qps": round(n / batch_s, 1) if batch_s else 0.0,
+            "filtered_qps": round(n / filtered_s, 1) if filtered_s else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def print_table(rows: list[dict], k: int) -> None:
+    print(
+        f"\n{'config':<28}{'build s':>9}{'index MB':>10}{'ratio':>7}{f'recall@{k}':>10}"
+        f"{'filtered':>10}{'vs exact':>10}{'QPS':>10}{'batch QPS':>11}{'filt. QPS':>11}"
+    )
+    for row in rows:
+        print(
+            f"{row['config']:<28}{row['build_s']:>9.2f}{row['index_bytes'] / 2**20:>10.1f}"
+            f"{row['compression']:>6.1f}x{row[f'recall@{k}']:>10.3f}{row[f'filtered_recall@{k}']:>10.3f}"
+            f"{row[f'ann_recall@{k}']:>10.3f}{row['qps']:>10.0f}{row['batch_qps']:>11.0f}{row['filtered_qps']:>11.0f}"
+        )
+    print(f"\nrecall@{k} by query kind:")
+    for row in rows:
+        by_kind = "  ".join(f"{kind} {value:.3f}" for kind, value in row[f"recall@{k}_by_kind"].items())
+        print(f"  {row['config']:<26}{by_kind}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare vector index configurations on a synthetic corpus.")
+    parser.add_argument("--docs", type=int, default=2000, help="Synthetic documents (default: 2000)")
+    parser.add_argument("--queries", type=int, default=500, help="Labeled queries (default: 500)")
+    parser.add_argument("--k", type=int, default=3, help="Results per query, as the search tool (default: 3)")
+    parser.add_argument("--config", action="append", dest="configs", metavar="SPEC",
+                        help="Index configuration to measure, repeatable (default: a sweep of every type)")
+    parser.add_argument("--hybrid", action="store_true", help="Fuse with BM25 as KB_SEARCH_MODE=hybrid does")
+    parser.add_argument("--threads", type=int, help="FAISS threads (default: FAISS's own choice)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for corpus and queries (default: 0)")
+    parser.add_argument("--out", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    configs = [(spec, parse_config(spec)) for spec in (args.configs or DEFAULT_CONFIGS)]
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    from ai_engine import EMBEDDING_MODEL, get_embeddings
+
+    corpus = synthesize_corpus(args.docs, args.seed)
+    queries = make_queries(corpus, args.queries, args.seed)
+    chunks = [chunk for doc in corpus for chunk in split_document(doc.document)]
+    logger.info("Synthesized %d documents (%d chunks) and %d queries.", len(corpus), len(chunks), len(queries))
+
+    embeddings = get_embeddings()
+    started = time.perf_counter()
+    vectors = embed_texts([c.page_content for c in chunks], embeddings.embed_documents)
+    query_vectors = embed_texts([q.text for q in queries], embeddings.embed_documents)
+    logger.info("Embedded with %s in %.1fs.", EMBEDDING_MODEL, time.perf_counter() - started)
+
+    bench = RetrievalBenchmark(chunks, vectors, queries, query_vectors, k=args.k, hybrid=args.hybrid)
+    rows = []
+    for label, config in configs:
+        logger.info("Measuring %s ...", label)
+        rows.append(bench.run(label, config))
+
+    print(f"\n{len(corpus)} documents, {len(chunks)} chunks, {len(queries)} queries"
+          f"{', hybrid' if args.hybrid else ''}")
+    print_table(rows, args.k)
+    if args.out:
+        result = {
+            "docs": len(corpus),
+            "chunks": len(chunks),
+            "queries": len(queries),
+            "k": args.k,
+            "hybrid": args.hybrid,
+            "seed": args.seed,
+            "embedding_model": EMBEDDING_MODEL,
+            "results": rows,
+        }
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=1)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Server-side conversation history, so clients send only the new message.
+
+Sessions live in a bounded in-memory LRU. A session idle for longer than
+``idle_ttl_seconds``, or pushed out by ``max_sessions``, is evicted; with
+``spill_dir`` set it is written there as JSON and reloaded on its next turn
+instead of being lost. Each session keeps its prompt history (see
+history_compactor) alongside the plain history, so a turn appends two
+messages rather than rebuilding the conversation.
+"""
+
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import BaseMessage
+
+from history_compactor import PromptHistory
+
+logger = logging.getLogger(__name__)
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+SESSION_ID_PATTERN = _SESSION_ID_RE.pattern
+
+# Spilled files past their TTL are deleted at most this often.
+_PRUNE_INTERVAL_SECONDS = 300.0
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+class ChatSession:
+    """One conversation: ``history`` as role/content dicts (what clients see
+    and the response cache fingerprints) and ``prompt``, the token-budgeted
+    chat_history the agent is given."""
+
+    def __init__(
+        self,
+        session_id: str,
+        history: list[dict] | None = None,
+        last_used: float | None = None,
+        max_messages: int = 100,
+        prompt: PromptHistory | None = None,
+    ):
+        self.session_id = session_id
+        self.history: list[dict] = [m for m in history or [] if m.get("role") in ("user", "bot")]
+        self.max_messages = max_messages
+        if prompt is None:
+            prompt = PromptHistory.from_history(self.history, max_messages=max_messages)
+        self.prompt = prompt
+        self.last_used = last_used if last_used is not None else time.time()
+        self._trim()
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        return self.prompt.to_messages()
+
+    def _append(self, role: str, content: str) -> None:
+        self.history.append({"role": role, "content": content})
+        self.prompt.add(role, content)
+
+    def _trim(self) -> None:
+        excess = len(self.history) - self.max_messages
+        if excess > 0:
+            # Drop whole turns so the history still starts with a user message.
+            del self.history[:excess + excess % 2]
+
+    def add_turn(self, user_message: str, response: str) -> None:
+        self._append("user", user_message)
+        self._append("bot", response)
+        self._trim()
+        self.prompt.compact()
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "history": self.history,
+            "summary": self.prompt.summary,
+            # The prompt's messages are always the tail of the history.
+            "recent": len(self.prompt),
+            "last_used": self.last_used,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, **prompt_settings) -> "ChatSession":
+        history = data.get("history") or []
+        recent = min(data.get("recent", len(history)), len(history))
+        prompt = PromptHistory.from_history(
+            history[len(history) - recent:], summary=data.get("summary") or (), **prompt_settings,
+        )
+        return cls(
+            data["session_id"], history, data.get("last_used"),
+            max_messages=prompt_settings.get("max_messages", 100), prompt=prompt,
+        )
+
+
+class SessionStore:
+    def __init__(
+        self,
+        max_sessions: int = 10_000,
+        idle_ttl_seconds: float = 1800.0,
+        max_messages: int = 100,
+        spill_dir: str | None = None,
+        spill_ttl_seconds: float = 7 * 86400.0,
+        token_budget: int = 2000,
+        max_response_tokens: int = 300,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_messages = max_messages
+        self.prompt_settings = {
+            "token_budget": token_budget,
+            "max_response_tokens": max_response_tokens,
+            "max_messages": max_messages,
+        }
+        self.spill_dir = spill_dir
+        self.spill_ttl_seconds = spill_ttl_seconds
+        # Ordered by last use, oldest first.
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.created = 0
+        self.restored = 0
+        self.spilled = 0
+        self.expired = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(session_id: str) -> bool:
+        return bool(_SESSION_ID_RE.match(session_id))
+
+    # -- public API ----------------------------------------------------------
+
+    def get(self, session_id: str) -> ChatSession | None:
+        """The session from memory or the spill directory, or None."""
+        if not self.is_valid_id(session_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.time()
+                self._sessions.move_to_end(session_id)
+        if session is None:
+            session = self._restore(session_id)
+            if session is not None:
+                self._insert(session)
+        return session
+
+    def open(self, session_id: str | None = None, history: list[dict] | None = None) -> ChatSession:
+        """Resume ``session_id`` if it is still known, otherwise start a new
+        session (under a fresh ID) seeded with ``history``."""
+        session = self.get(session_id) if session_id else None
+        if session is None:
+            session = self.new_session(history)
+            self.created += 1
+            self._insert(session)
+        return session
+
+    def new_session(self, history: list[dict] | None = None, session_id: str | None = None) -> ChatSession:
+        """A session with this store's limits, not (yet) stored."""
+        prompt = PromptHistory.from_history(history or [], **self.prompt_settings)
+        return ChatSession(
+            session_id or new_session_id(), history, max_messages=self.max_messages, prompt=prompt,
+        )
+
+    def record_turn(self, session: ChatSession, user_message: str, response: str) -> None:
+        """Append one exchange and mark the session as used."""
+        with self._lock:
+            session.add_turn(user_message, response)
+        self._insert(session)
+
+    def delete(self, session_id: str) -> bool:
+        if not self.is_valid_id(session_id):
+            return False
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+        path = self._spill_path(session_id)
+        if path and os.path.exists(path):
+            os.remove(path)
+            found = True
+        return found
+
+    def close(self) -> None:
+        """Spill every in-memory session (when spilling is enabled)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        self._spill(sessions)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._sessions),
+            "created": self.created,
+            "restored": self.restored,
+            "spilled": self.spilled,
+            "expired": self.expired,
+            "token_budget": self.prompt_settings["token_budget"],
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    # -- eviction and spill --------------------------------------------------
+
+    def _insert(self, session: ChatSession) -> None:
+        now = time.time()
+        session.last_used = now
+        evicted: list[ChatSession] = []
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest is session or (
+                    len(self._sessions) <= self.max_sessions and now - oldest.last_used < self.idle_ttl_seconds
+                ):
+                    break
+                evicted.append(self._sessions.popitem(last=False)[1])
+        if evicted:
+            self._spill(evicted)
+        if self.spill_dir and now - self._last_prune > _PRUNE_INTERVAL_SECONDS:
+            self._last_prune = now
+            self._prune_spill(now)
+
+    def _spill_path(self, session_id: str) -> str | None:
+        return os.path.join(self.spill_dir, f"{session_id}.json") if self.spill_dir else None
+
+    def _spill(self, sessions: list[ChatSession]) -> None:
+        if not self.spill_dir:
+            self.expired += len(sessions)
+            return
+        for session in sessions:
+            path = self._spill_path(session.session_id)
+            tmp_path = f"{path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as fh:
+                    json.dump(session.to_dict(), fh)
+                os.replace(tmp_path, path)
+                self.spilled += 1
+            except OSError as exc:
+                self.expired += 1
+                logger.error("Failed to spill session %s: %s", session.session_id, exc)
+
+    def _restore(self, session_id: str) -> ChatSession | None:
+        path = self._spill_path(session_id)
+        if not path:
+            return None
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.error("Failed to restore session %s: %s", session_id, exc)
+            return None
+        if time.time() - data.get("last_used", 0.0) > self.spill_ttl_seconds:
+            self.expired += 1
+            return None
+        session = ChatSession.from_dict(data, **self.prompt_settings)
+        self.restored += 1
+        return session
+
+    def _prune_spill(self, now: float) -> None:
+        try:
+            entries = list(os.scandir(self.spill_dir))
+        except OSError as exc:
+            logger.error("Failed to scan session spill directory: %s", exc)
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith(".json") and now - entry.stat().st_mtime > self.spill_ttl_seconds:
+                    os.remove(entry.path)
+                    self.expired += 1
+            except OSError:
+                continue
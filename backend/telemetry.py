@@ -0,0 +1,297 @@
+"""
+Per-request stage tracing and Prometheus metrics.
+
+Every chat request gets a ``RequestTrace`` (held in a context variable, so
+it follows the request into tool coroutines, prefetch tasks and the blocking
+executor). Two things feed it:
+
+- ``TelemetryCallbackHandler``, registered for every LangChain run, times
+  each LLM call and each tool call;
+- ``span(stage)`` blocks around work LangChain does not see: the embedding
+  pass, the FAISS search, the BM25 search.
+
+Each span is also observed in a histogram. When the request ends its trace
+is logged as one line (at INFO when it took longer than SLOW_REQUEST_SECONDS,
+otherwise at DEBUG) and the LLM and tool calls it made are recorded.
+``StatsCollector`` exports the counters the caches, the router and the LLM
+client already keep, read at scrape time. ``render_metrics`` produces the
+text served on /metrics. ``add_trace_listener`` hands every finished trace
+to an in-process consumer (the load test's per-stage percentiles).
+
+Searches served by the embedding batcher are recorded on the request whose
+search opened the batch.
+"""
+
+import logging
+import os
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+logger = logging.getLogger(__name__)
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "10"))
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+
+REGISTRY = CollectorRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "skillpalavar_chat_request_seconds", "Chat request latency by serving route.",
+    ["route"], buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+LLM_CALLS_PER_REQUEST = Histogram(
+    "skillpalavar_agent_llm_calls", "LLM calls (agent iterations) per agent request.",
+    buckets=_COUNT_BUCKETS, registry=REGISTRY,
+)
+TOOL_CALLS_PER_REQUEST = Histogram(
+    "skillpalavar_agent_tool_calls", "Tool calls per agent request.",
+    buckets=_COUNT_BUCKETS, registry=REGISTRY,
+)
+LLM_SECONDS = Histogram(
+    "skillpalavar_llm_call_seconds", "Duration of one LLM call, retries included.",
+    buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+TOOL_SECONDS = Histogram(
+    "skillpalavar_tool_seconds", "Tool call duration; status is ok or error (an ERROR: observation or an exception).",
+    ["tool", "status"], buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+STAGE_SECONDS = Histogram(
+    "skillpalavar_stage_seconds", "Duration of retrieval stages (embedding, vector and lexical search).",
+    ["stage"], buckets=_STAGE_BUCKETS, registry=REGISTRY,
+)
+
+
+# ---------------------------------------------------------------------------
+# Request traces
+# ---------------------------------------------------------------------------
+
+class RequestTrace:
+    """Stages of one request, in completion order."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+        self.llm_calls = 0
+        self.tool_calls = 0
+
+    def add(self, stage: str, seconds: float) -> None:
+        # list.append is atomic, so spans may come from executor threads.
+        self.spans.append((stage, seconds))
+
+    def summary(self) -> str:
+        totals: dict[str, tuple[int, float]] = {}
+        for stage, seconds in self.spans:
+            count, total = totals.get(stage, (0, 0.0))
+            totals[stage] = (count + 1, total + seconds)
+        return ", ".join(
+            f"{stage} {total * 1000:.1f}ms" + (f" x{count}" if count > 1 else "")
+            for stage, (count, total) in totals.items()
+        )
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("request_trace", default=None)
+_trace_listeners: list[Callable[[RequestTrace, str], None]] = []
+
+
+def add_trace_listener(listener: Callable[[RequestTrace, str], None]) -> None:
+    """Call ``listener(trace, route)`` for every request that ends."""
+    _trace_listeners.append(listener)
+
+
+def remove_trace_listener(listener: Callable[[RequestTrace, str], None]) -> None:
+    _trace_listeners.remove(listener)
+
+
+def begin_request() -> RequestTrace:
+    """Start tracing the request running in the current context."""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def end_request(trace: RequestTrace, route: str) -> None:
+    """Record ``trace`` as a request served by ``route``."""
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    elapsed = time.perf_counter() - trace.started
+    REQUEST_SECONDS.labels(route).observe(elapsed)
+    if route == "agent":
+        LLM_CALLS_PER_REQUEST.observe(trace.llm_calls)
+        TOOL_CALLS_PER_REQUEST.observe(trace.tool_calls)
+    for listener in _trace_listeners:
+        listener(trace, route)
+    level = logging.INFO if elapsed >= SLOW_REQUEST_SECONDS else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, "Request via %s took %.0fms: %s", route, elapsed * 1000, trace.summary() or "no stages")
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the block as ``stage`` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, elapsed)
+
+
+# ---------------------------------------------------------------------------
+# LangChain callbacks
+# ---------------------------------------------------------------------------
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """Times LLM and tool runs. LLM runs without a parent (the client wrapped
+    by llm_client) are not counted twice."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: dict[UUID, tuple[str, float]] = {}
+
+    def _start(self, run_id: UUID, name: str) -> None:
+        self._started[run_id] = (name, time.perf_counter())
+
+    def _finish(self, run_id: UUID, error: bool = False) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        name, at = started
+        elapsed = time.perf_counter() - at
+        trace = _current_trace.get()
+        if name == "llm":
+            LLM_SECONDS.observe(elapsed)
+            if trace is not None:
+                trace.llm_calls += 1
+        else:
+            TOOL_SECONDS.labels(name, "error" if error else "ok").observe(elapsed)
+            if trace is not None:
+                trace.tool_calls += 1
+        if trace is not None:
+            trace.add(name if name == "llm" else f"tool:{name}", elapsed)
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID,
+                            parent_run_id: UUID | None = None, **kwargs: Any) -> None:
+        if parent_run_id is not None:
+            self._start(run_id, "llm")
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID,
+                     parent_run_id: UUID | None = None, **kwargs: Any) -> None:
+        if parent_run_id is not None:
+            self._start(run_id, "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=True)
+
+    def on_tool_start(self, serialized: dict, input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, (serialized or {}).get("name") or kwargs.get("name") or "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        text = getattr(output, "content", output)
+        self._finish(run_id, error=isinstance(text, str) and text.startswith("ERROR:"))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=True)
+
+
+_handler: ContextVar[TelemetryCallbackHandler | None] = ContextVar(
+    "telemetry_handler", default=TelemetryCallbackHandler()
+)
+register_configure_hook(_handler, inheritable=True)
+
+
+# ---------------------------------------------------------------------------
+# Counters kept elsewhere
+# ---------------------------------------------------------------------------
+
+_BREAKER_STATES = ("closed", "open", "half_open")
+_LLM_CLIENT_EVENTS = ("calls", "retries", "timeouts", "failures", "rejected", "overloaded", "breaker_opened")
+
+
+def _cache_lookups(caches: dict) -> dict[str, tuple[int, int]]:
+    """(hits, misses) per cache from ai_engine.get_cache_stats()."""
+    lookups = {}
+    if "query_embeddings" in caches:
+        stats = caches["query_embeddings"]
+        lookups["query_embeddings"] = (stats["hits"], stats["misses"])
+    if "responses" in caches:
+        stats = caches["responses"]
+        lookups["responses"] = (stats["exact_hits"] + stats["semantic_hits"], stats["misses"])
+    if "kb_prefetch" in caches:
+        # A prefetch that was never used is the miss.
+        stats = caches["kb_prefetch"]
+        lookups["kb_prefetch"] = (stats.get("served", 0), stats.get("unused", 0))
+    return lookups
+
+
+class StatsCollector(Collector):
+    """Exports the stats dicts of the caches, the router and the LLM client
+    at scrape time, so they are counted in one place."""
+
+    def __init__(
+        self,
+        caches: Callable[[], dict],
+        routes: Callable[[], dict],
+        llm_client: Callable[[], dict | None],
+    ):
+        self._caches = caches
+        self._routes = routes
+        self._llm_client = llm_client
+
+    def collect(self):
+        requests = CounterMetricFamily("skillpalavar_chat_requests", "Chat requests by serving route.", labels=["route"])
+        for route, count in self._routes().items():
+            requests.add_metric([route], count)
+        yield requests
+
+        hits = CounterMetricFamily("skillpalavar_cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("skillpalavar_cache_misses", "Cache misses.", labels=["cache"])
+        ratio = GaugeMetricFamily("skillpalavar_cache_hit_ratio", "Hits per lookup since startup.", labels=["cache"])
+        for cache, (hit, miss) in _cache_lookups(self._caches()).items():
+            hits.add_metric([cache], hit)
+            misses.add_metric([cache], miss)
+            ratio.add_metric([cache], hit / (hit + miss) if hit + miss else 0.0)
+        yield from (hits, misses, ratio)
+
+        stats = self._llm_client()
+        if stats is None:
+            return
+        events = CounterMetricFamily("skillpalavar_llm_client_events", "LLM client call outcomes.", labels=["event"])
+        for event in _LLM_CLIENT_EVENTS:
+            events.add_metric([event], stats[event])
+        yield events
+        yield GaugeMetricFamily("skillpalavar_llm_in_flight", "LLM calls in flight.", value=stats["in_flight"])
+        breaker = GaugeMetricFamily("skillpalavar_llm_breaker_state", "1 for the breaker's current state.",
+                                    labels=["state"])
+        for state in _BREAKER_STATES:
+            breaker.add_metric([state], 1.0 if stats["state"] == state else 0.0)
+        yield breaker
+
+
+def register_stats(caches: Callable[[], dict], routes: Callable[[], dict], llm_client: Callable[[], dict | None]) -> None:
+    REGISTRY.register(StatsCollector(caches, routes, llm_client))
+
+
+def render_metrics() -> bytes:
+    """All metrics in the Prometheus text format."""
+    return generate_latest(REGISTRY)
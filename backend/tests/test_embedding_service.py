@@ -0,0 +1,64 @@
+import asyncio
+import gc
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_service import EmbeddingBatcher, QueryEmbeddingCache
+
+
+def test_batch_survives_garbage_collection():
+    async def run_blocking(func, *args):
+        await asyncio.sleep(0.02)
+        gc.collect()
+        return func(*args)
+
+    async def scenario():
+        batcher = EmbeddingBatcher(
+            QueryEmbeddingCache(DeterministicFakeEmbedding(size=8)),
+            lambda vectors, k, queries, subset: [[query] * k for query in queries],
+            run_blocking,
+            max_wait_ms=1,
+        )
+        results = await asyncio.wait_for(asyncio.gather(batcher.search("a", 1), batcher.search("b", 2)), 2)
+        assert results == [["a"], ["b", "b"]]
+        assert not batcher._tasks
+
+    asyncio.run(scenario())
+
+
+class _CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
+
+def test_filtered_searches_share_one_embedding_call():
+    thinkpad, xps = np.array([0, 2, 4]), np.array([1, 3])
+    searches = []
+
+    def search_by_vectors(vectors, k, queries, subset):
+        searches.append((len(vectors), None if subset is None else subset.tolist()))
+        return [[(query, None if subset is None else subset.tolist())] * k for query in queries]
+
+    async def run_blocking(func, *args):
+        return func(*args)
+
+    async def scenario():
+        embeddings = _CountingEmbeddings(size=8)
+        batcher = EmbeddingBatcher(QueryEmbeddingCache(embeddings), search_by_vectors, run_blocking, max_wait_ms=5)
+        results = await asyncio.gather(
+            batcher.search("flicker", 1, thinkpad),
+            batcher.search("battery", 1, xps),
+            batcher.search("black screen", 1, thinkpad),
+            batcher.search("wifi", 1),
+        )
+        assert results == [
+            [("flicker", [0, 2, 4])], [("battery", [1, 3])], [("black screen", [0, 2, 4])], [("wifi", None)],
+        ]
+        assert embeddings.calls == 1
+        assert sorted(searches, key=str) == sorted([(2, [0, 2, 4]), (1, [1, 3]), (1, None)], key=str)
+
+    asyncio.run(scenario())
@@ -0,0 +1,27 @@
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+
+from fake_llm import FakeSupportLLM
+
+
+def _after_search(question: str):
+    llm = FakeSupportLLM()
+    messages = [SystemMessage(content="prompt"), HumanMessage(content=question)]
+    search = llm.respond(messages)
+    assert search.tool_calls[0]["name"] == "search_it_knowledge_base"
+    return llm, messages + [search]
+
+
+def test_reported_issue_gets_a_ticket():
+    llm, messages = _after_search("My Dell XPS 15 9530 battery drains in two hours.")
+    messages.append(ToolMessage(content="1. Calibrate the battery", tool_call_id="call_1_0",
+                                name="search_it_knowledge_base"))
+    assert llm.respond(messages).tool_calls[0]["name"] == "create_support_ticket"
+
+
+def test_how_to_question_gets_no_ticket():
+    llm, messages = _after_search("How do I generate a battery report on my Dell XPS 15 9530?")
+    messages.append(ToolMessage(content="1. Run powercfg /batteryreport", tool_call_id="call_1_0",
+                                name="search_it_knowledge_base"))
+    answer = llm.respond(messages)
+    assert not answer.tool_calls
+    assert "powercfg /batteryreport" in answer.content
@@ -0,0 +1,53 @@
+import textwrap
+
+import pytest
+from langchain_core.documents import Document
+
+from lexical_index import LexicalIndex
+from metadata_index import MetadataIndex
+from mock_data import MOCK_IT_DOCUMENTS
+from vector_index import split_document
+
+
+@pytest.fixture(scope="module")
+def index() -> LexicalIndex:
+    chunks = [
+        chunk
+        for i, text in enumerate(MOCK_IT_DOCUMENTS)
+        for chunk in split_document(Document(page_content=textwrap.dedent(text).strip(), metadata={"source": f"doc_{i}"}))
+    ]
+    lexical = LexicalIndex.build(c.page_content for c in chunks)
+    lexical.model_words = MetadataIndex.build(c.metadata for c in chunks).words("model")
+    return lexical
+
+
+@pytest.mark.parametrize("query", [
+    "ThinkPad T14s screen flicker",
+    "my UX3402 fan is loud",
+    "Latitude 5540 i7-1365U overheating",
+    "screen flickering after driver update",
+])
+def test_natural_language_questions_get_semantic_search(index, query):
+    assert index.exact_match(query, k=3) is None
+
+
+@pytest.mark.parametrize("query", [
+    "FRU #5C10S30404",
+    "DRIVER_IRQL_NOT_LESS_OR_EQUAL",
+    "powercfg /batteryreport",
+])
+def test_exact_token_queries_take_the_shortcut(index, query):
+    assert index.exact_match(query, k=3)
+
+
+def test_identifiers_must_be_most_of_the_query(index):
+    assert index.exact_match("why does my laptop show DRIVER_IRQL_NOT_LESS_OR_EQUAL", k=3) is None
+
+
+def test_saved_index_loads_with_the_same_results(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = LexicalIndex.load(str(tmp_path), model_words=index.model_words)
+    assert loaded.size == index.size
+    for query in ("battery drains overnight", "powercfg /batteryreport", "FRU #5C10S30404", "zzzz"):
+        assert loaded.search(query, k=5) == index.search(query, k=5)
+        assert loaded.exact_match(query, k=5) == index.exact_match(query, k=5)
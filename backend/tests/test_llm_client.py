@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from llm_client import STATE_CLOSED, STATE_HALF_OPEN, CircuitBreaker, CircuitOpenError, LLMCallPolicy
+
+
+def _policy() -> LLMCallPolicy:
+    return LLMCallPolicy(
+        timeout_seconds=5, max_retries=0, backoff_seconds=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0.05),
+    )
+
+
+async def _fail():
+    raise ConnectionError("down")
+
+
+async def _ok():
+    return "ok"
+
+
+async def _open_breaker(policy: LLMCallPolicy) -> None:
+    with pytest.raises(ConnectionError):
+        await policy.acall(_fail)
+    await asyncio.sleep(0.06)
+    assert policy.breaker.state == STATE_HALF_OPEN
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    async def scenario():
+        policy = _policy()
+        await _open_breaker(policy)
+
+        probe = asyncio.create_task(policy.acall(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await policy.acall(_ok) == "ok"
+        assert policy.breaker.state == STATE_CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_stream_probe_releases_half_open_slot():
+    async def stalled():
+        await asyncio.sleep(10)
+        yield "never"
+
+    async def scenario():
+        policy = _policy()
+        await _open_breaker(policy)
+
+        async def consume():
+            async for _ in policy.astream(stalled):
+                pass
+
+        probe = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await policy.acall(_ok) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_probe_in_flight_rejects_other_calls():
+    async def scenario():
+        policy = _policy()
+        await _open_breaker(policy)
+
+        probe = asyncio.create_task(policy.acall(lambda: asyncio.sleep(0.05, "ok")))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpenError):
+            await policy.acall(_ok)
+        assert await probe == "ok"
+        assert policy.breaker.state == STATE_CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_sync_probe_interrupted_releases_half_open_slot():
+    policy = _policy()
+    asyncio.run(_open_breaker(policy))
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        policy.call(interrupted)
+    assert policy.call(lambda: "ok") == "ok"
+
+
+def test_empty_stream_probe_closes_breaker():
+    async def empty():
+        return
+        yield
+
+    async def scenario():
+        policy = _policy()
+        await _open_breaker(policy)
+
+        assert [item async for item in policy.astream(empty)] == []
+        assert policy.breaker.state == STATE_CLOSED
+        assert await policy.acall(_ok) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_empty_sync_stream_probe_closes_breaker():
+    policy = _policy()
+    asyncio.run(_open_breaker(policy))
+
+    assert list(policy.stream(lambda: iter(()))) == []
+    assert policy.breaker.state == STATE_CLOSED
+    assert policy.call(lambda: "ok") == "ok"
@@ -0,0 +1,29 @@
+import numpy as np
+
+from metadata_index import MetadataIndex
+
+METADATAS = [
+    {"model": "Lenovo ThinkPad T14s Gen 3", "category": "Display / Hardware"},
+    {"model": "Dell XPS 15 9530", "category": "Battery"},
+    {},
+    {"model": "Lenovo ThinkPad X1 Carbon", "category": "Display"},
+]
+
+
+def test_subset_includes_unlabeled_chunks():
+    index = MetadataIndex.build(METADATAS)
+    assert index.subset(model="ThinkPad").tolist() == [0, 2, 3]
+    assert index.subset(model="ThinkPad", category="Hardware").tolist() == [0, 2]
+    assert index.subset(model="Surface") is None
+
+
+def test_saved_index_loads_with_the_same_subsets(tmp_path):
+    index = MetadataIndex.build(METADATAS)
+    index.save(str(tmp_path))
+    loaded = MetadataIndex.load(str(tmp_path))
+    assert loaded.size == index.size
+    assert loaded.words("model") == index.words("model")
+    for model, category in (("ThinkPad", None), ("XPS 15", "battery"), (None, "display"), ("Surface", None)):
+        expected = index.subset(model=model, category=category)
+        actual = loaded.subset(model=model, category=category)
+        assert (expected is None and actual is None) or np.array_equal(expected, actual)
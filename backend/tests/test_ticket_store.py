@@ -0,0 +1,46 @@
+import sqlite3
+import threading
+
+import pytest
+
+from ticket_store import KIND_TICKET, TicketStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TicketStore(str(tmp_path / "tickets.db"))
+    yield store
+    store.close()
+
+
+def test_created_ticket_is_committed_when_create_returns(store):
+    ticket = store.create(KIND_TICKET, "Screen flickers", device="Dell XPS 15")
+    tickets, _ = store.list()
+    assert [t["ticket_id"] for t in tickets] == [ticket["ticket_id"]]
+
+
+def test_failed_commit_raises_from_create(store):
+    conn = sqlite3.connect(store.path)
+    conn.execute("DROP TABLE tickets")
+    conn.close()
+
+    with pytest.raises(sqlite3.Error):
+        store.create(KIND_TICKET, "Screen flickers")
+    assert store.stats()["failed"] == 1
+
+
+def test_close_closes_readers_of_every_thread(tmp_path):
+    store = TicketStore(str(tmp_path / "tickets.db"))
+    store.create(KIND_TICKET, "Fan noise")
+    readers = [threading.Thread(target=store.list) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    connections = set(store._readers)
+    assert len(connections) == 3
+
+    store.close()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
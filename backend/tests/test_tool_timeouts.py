@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from langchain_core.tools import StructuredTool
+
+import ai_engine
+
+
+def _slow_tool(name: str, done: threading.Event) -> StructuredTool:
+    def run(issue_summary: str) -> str:
+        done.wait(1)
+        return "created"
+
+    return StructuredTool.from_function(run, name=name, description="test")
+
+
+def test_timed_out_write_is_not_reported_as_an_error(monkeypatch):
+    monkeypatch.setenv("TOOL_TIMEOUT_ESCALATE_TO_TIER2", "0.05")
+    done = threading.Event()
+    agent_tool = _slow_tool("escalate_to_tier2", done)
+    ai_engine._attach_coroutine(agent_tool, offload=True, writes=True)
+
+    output = asyncio.run(agent_tool.ainvoke({"issue_summary": "x"}))
+    done.set()
+    assert not output.startswith("ERROR:")
+    assert "Do NOT call escalate_to_tier2 again" in output
+
+
+def test_timed_out_read_is_an_error(monkeypatch):
+    monkeypatch.setenv("TOOL_TIMEOUT_CHECK_WARRANTY_STATUS", "0.05")
+    done = threading.Event()
+    agent_tool = _slow_tool("check_warranty_status", done)
+    ai_engine._attach_coroutine(agent_tool, offload=True)
+
+    output = asyncio.run(agent_tool.ainvoke({"issue_summary": "x"}))
+    done.set()
+    assert output.startswith("ERROR:")
+
+
+def test_ticket_creation_runs_off_the_event_loop(monkeypatch):
+    threads = []
+
+    class Store:
+        def create(self, kind, issue_summary, **fields):
+            threads.append(threading.current_thread())
+            return {"ticket_id": "INC-1", "created_at": "2026-01-01T00:00:00Z"}
+
+    monkeypatch.setattr(ai_engine, "get_ticket_store", lambda: Store())
+
+    async def create():
+        loop_thread = threading.current_thread()
+        await ai_engine.create_support_ticket.ainvoke({"issue_summary": "x", "laptop_model": "y"})
+        return loop_thread
+
+    loop_thread = asyncio.run(create())
+    assert threads and threads[0] is not loop_thread
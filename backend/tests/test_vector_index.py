@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from vector_index import IndexConfig, sync_vector_store
+
+
+def _corpus(n: int) -> list[Document]:
+    return [
+        Document(page_content=f"Guide {i}: step {i} for device {i * 7}.", metadata={"source": f"doc_{i}"})
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8", "ivf", "hnsw"])
+def test_search_after_deleting_chunks_returns_the_right_documents(tmp_path, index_type):
+    embeddings = DeterministicFakeEmbedding(size=32)
+    config = IndexConfig(index_type=index_type, ivf_nlist=4, ivf_nprobe=4)
+    corpus = _corpus(200)
+    sync_vector_store(str(tmp_path), corpus, embeddings, "fake", config)
+
+    kept = corpus[::2]
+    vs = sync_vector_store(str(tmp_path), kept, embeddings, "fake", config)
+    assert vs.index.ntotal == len(kept)
+
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in kept]), dtype="float32")
+    wrong = 0
+    for document, vector in zip(kept, vectors):
+        found = vs.similarity_search_by_vector(vector.tolist(), k=1)
+        wrong += not found or found[0].page_content != document.page_content
+    assert wrong == 0
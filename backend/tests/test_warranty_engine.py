@@ -0,0 +1,86 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from warranty_engine import WarrantyEngine, aiter_csv_devices
+
+PLANS_PATH = str(Path(__file__).resolve().parent.parent / "data" / "warranty_plans.csv")
+
+
+def _parse(body: bytes, chunk_size: int) -> list[dict]:
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    async def collect():
+        return [device async for batch in aiter_csv_devices(chunks(), batch_size=2) for device in batch]
+
+    return asyncio.run(collect())
+
+
+def test_quoted_newlines_stay_in_one_record():
+    body = (
+        'serial,model,notes\r\n'
+        'PF3ABC12,"Lenovo ThinkPad\r\nT14s Gen 3","spare, ""loaner""\nunit"\r\n'
+        'CN0XPS95,Dell XPS 15 9530,\n'
+        '"SN-77","HP EliteBook 840 G9","multi\n\nline"'
+    ).encode()
+    expected = [
+        {"serial": "PF3ABC12", "model": "Lenovo ThinkPad\r\nT14s Gen 3"},
+        {"serial": "CN0XPS95", "model": "Dell XPS 15 9530"},
+        {"serial": "SN-77", "model": "HP EliteBook 840 G9"},
+    ]
+    for chunk_size in (1, 3, 7, len(body)):
+        assert _parse(body, chunk_size) == expected
+
+
+
+def test_bad_input_after_the_first_batch_ends_the_stream_with_an_error_record():
+    import main
+
+    async def run_blocking(func, *args):
+        return func(*args)
+
+    async def batches():
+        yield [{"model": "Dell XPS 15"}] * 3
+        raise ValueError("Malformed CSV: field larger than field limit")
+
+    async def collect(fmt):
+        response = main._audit_response(engine, batches(), fmt)
+        return "".join([chunk async for chunk in response.body_iterator]).splitlines()
+
+    engine = WarrantyEngine.load(PLANS_PATH)
+    main.app_state["engine"] = SimpleNamespace(run_blocking=run_blocking)
+    try:
+        ndjson, csv_rows = asyncio.run(collect("ndjson")), asyncio.run(collect("csv"))
+    finally:
+        main.app_state.pop("engine", None)
+    assert len(ndjson) == 4
+    assert ndjson[-1] == '{"row": 4, "error": "Malformed CSV: field larger than field limit"}'
+    assert len(csv_rows) == 5
+    assert csv_rows[-1] == "4,,,ERROR: Malformed CSV: field larger than field limit,,,"
+
+
+def test_csv_parse_errors_are_value_errors():
+    body = b"model\n" + b'"' + b"x" * 200_000 + b'"\n'
+    with pytest.raises(ValueError, match="Malformed CSV"):
+        _parse(body, len(body))
+
+
+@pytest.mark.parametrize("model, pattern", [
+    ("Dell XPS 15 9530", "dell xps"),
+    ("Dell XPS15", "dell xps"),
+    ("DellXPS13", "dell xps"),
+    ("ThinkPadX1", "thinkpad"),
+    ("Lenovo ThinkPadT14s Gen 3", "thinkpad"),
+    ("Dell Latitude5540", "dell latitude"),
+])
+def test_models_resolve_with_or_without_spaces(model, pattern):
+    plan = WarrantyEngine.load(PLANS_PATH).match_plan(model)
+    assert plan is not None and plan.pattern == pattern
+
+
+def test_unknown_model_is_not_found():
+    assert WarrantyEngine.load(PLANS_PATH).match_plan("Chromebook 14") is None
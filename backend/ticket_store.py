@@ -0,0 +1,276 @@
+"""
+Persistent store for support tickets and Tier 2 escalations (SQLite, WAL).
+
+Writes are group-committed: ``create`` assigns the ID, queues the row and
+waits while a background writer thread commits everything waiting in one
+transaction, so throughput grows with load instead of paying one commit
+per ticket. ``create`` returns only once its row is on disk and raises
+``sqlite3.Error`` if the batch failed. Rows still in the queue are served
+from memory by ``get``; ``list`` sees them once committed.
+
+Listing is keyset-paginated on the insertion sequence, so deep pages cost
+the same as the first one even with millions of rows.
+"""
+
+import base64
+import datetime
+import logging
+import queue
+import secrets
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from warranty_engine import normalize_model
+
+logger = logging.getLogger(__name__)
+
+KIND_TICKET = "ticket"
+KIND_ESCALATION = "escalation"
+STATUS_OPEN = "Open"
+STATUS_ESCALATED = "Escalated"
+
+RECORD_FIELDS = (
+    "ticket_id", "kind", "issue_summary", "device", "priority", "status", "linked_ticket_id", "created_at",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    seq              INTEGER PRIMARY KEY,
+    ticket_id        TEXT NOT NULL UNIQUE,
+    kind             TEXT NOT NULL,
+    issue_summary    TEXT NOT NULL,
+    device           TEXT NOT NULL DEFAULT '',
+    device_key       TEXT NOT NULL DEFAULT '',
+    priority         TEXT,
+    status           TEXT NOT NULL,
+    linked_ticket_id TEXT,
+    created_at       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets (status, seq);
+CREATE INDEX IF NOT EXISTS idx_tickets_device ON tickets (device_key, seq);
+CREATE INDEX IF NOT EXISTS idx_tickets_kind ON tickets (kind, seq);
+CREATE INDEX IF NOT EXISTS idx_tickets_linked ON tickets (linked_ticket_id) WHERE linked_ticket_id IS NOT NULL;
+"""
+
+_INSERT = (
+    "INSERT INTO tickets (ticket_id, kind, issue_summary, device, device_key, priority, status, "
+    "linked_ticket_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_SELECT = f"SELECT seq, {', '.join(RECORD_FIELDS)} FROM tickets"
+
+_STOP = object()
+
+
+def new_ticket_id(prefix: str) -> str:
+    """``<prefix>-`` plus 12 base32 characters (60 random bits): IDs stay
+    unique across worker processes well past millions of rows."""
+    return f"{prefix}-{base64.b32encode(secrets.token_bytes(8)).decode()[:12]}"
+
+
+class TicketStore:
+    def __init__(self, path: str, max_batch_size: int = 512):
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: dict[str, dict] = {}
+        self._pending_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: set[sqlite3.Connection] = set()
+        self._readers_lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="ticket-store-writer", daemon=True)
+        self._writer.start()
+        logger.info("Ticket store ready at '%s'.", path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the writer.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.execute("PRAGMA query_only=1")
+            with self._readers_lock:
+                self._readers.add(conn)
+        return conn
+
+    # -- writes --------------------------------------------------------------
+
+    def create(
+        self,
+        kind: str,
+        issue_summary: str,
+        device: str = "",
+        priority: str | None = None,
+        linked_ticket_id: str | None = None,
+    ) -> dict:
+        """Write a new ticket or escalation and return its record once it
+        has been committed. Raises ``sqlite3.Error`` if it was not."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("The ticket store is closed.")
+        if kind == KIND_ESCALATION:
+            ticket_id, status = new_ticket_id("ESC"), STATUS_ESCALATED
+        else:
+            ticket_id, status = new_ticket_id("INC"), STATUS_OPEN
+        record = {
+            "ticket_id": ticket_id,
+            "kind": kind,
+            "issue_summary": issue_summary,
+            "device": device,
+            "priority": priority,
+            "status": status,
+            "linked_ticket_id": linked_ticket_id or None,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        committed: Future = Future()
+        with self._pending_lock:
+            self._pending[ticket_id] = record
+        self._queue.put((record, committed))
+        committed.result()
+        return record
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            if item is _STOP:
+                stopping = True
+                self._queue.task_done()
+            else:
+                batch.append(item)
+            # Group commit: take whatever queued up while the last batch was
+            # being written.
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    continue
+                batch.append(item)
+            if batch:
+                self._write_batch(conn, batch)
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list[tuple[dict, Future]]) -> None:
+        rows = [
+            (r["ticket_id"], r["kind"], r["issue_summary"], r["device"], normalize_model(r["device"]),
+             r["priority"], r["status"], r["linked_ticket_id"], r["created_at"])
+            for r, _ in batch
+        ]
+        errors: dict[int, sqlite3.Error] = {}
+        try:
+            try:
+                with conn:
+                    conn.executemany(_INSERT, rows)
+                self.written += len(rows)
+            except sqlite3.IntegrityError:
+                # One bad row must not take the rest of the batch with it.
+                for i, row in enumerate(rows):
+                    try:
+                        with conn:
+                            conn.execute(_INSERT, row)
+                        self.written += 1
+                    except sqlite3.IntegrityError as exc:
+                        errors[i] = exc
+                        self.failed += 1
+                        logger.error("Failed to persist ticket %s: %s", row[0], exc)
+            self.batches += 1
+        except sqlite3.Error as exc:
+            errors = dict.fromkeys(range(len(batch)), exc)
+            self.failed += len(batch)
+            logger.error("Failed to persist %d ticket(s): %s", len(batch), exc)
+        finally:
+            with self._pending_lock:
+                for record, _ in batch:
+                    self._pending.pop(record["ticket_id"], None)
+            for i, (_, committed) in enumerate(batch):
+                if i in errors:
+                    committed.set_exception(errors[i])
+                else:
+                    committed.set_result(None)
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Block until every queued row has been written."""
+        self._queue.join()
+
+    def close(self) -> None:
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        # Every thread that read opened its own connection.
+        with self._readers_lock:
+            readers, self._readers = self._readers, set()
+        for conn in readers:
+            conn.close()
+
+    # -- reads ---------------------------------------------------------------
+
+    @staticmethod
+    def _record(row: tuple) -> dict:
+        return dict(zip(RECORD_FIELDS, row[1:]))
+
+    def get(self, ticket_id: str) -> dict | None:
+        with self._pending_lock:
+            pending = self._pending.get(ticket_id)
+        if pending is not None:
+            return dict(pending)
+        row = self._reader().execute(f"{_SELECT} WHERE ticket_id = ?", (ticket_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def list(
+        self,
+        status: str | None = None,
+        device: str | None = None,
+        kind: str | None = None,
+        limit: int = 50,
+        cursor: int | None = None,
+    ) -> tuple[list[dict], int | None]:
+        """Newest first. Returns (records, next_cursor); pass next_cursor
+        back to get the following page, None means there are no more."""
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if device:
+            clauses.append("device_key = ?")
+            params.append(normalize_model(device))
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if cursor is not None:
+            clauses.append("seq < ?")
+            params.append(cursor)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"{_SELECT}{where} ORDER BY seq DESC LIMIT ?", (*params, limit + 1)
+        ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [self._record(row) for row in rows[:limit]], next_cursor
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,737 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import asdict, dataclass, fields
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from metadata_index import METADATA_FIELDS
+from mmap_store import MmapDocstore, PositionalIds, is_mmap_store, open_mmap_index, write_mmap_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Written by ingest.py. An index directory holding this file is a prebuilt,
+# sharded artifact that the API server loads as-is and never rebuilds.
+PREBUILT_MANIFEST_FILE = "ingest_manifest.json"
+# Lexical postings and metadata posting lists of a prebuilt artifact.
+PREBUILT_LEXICAL_DIR = "lexical"
+PREBUILT_METADATA_DIR = "metadata"
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+CHUNK_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+# "Model: ..." / "Category: ..." lines in a document's header block.
+_HEADER_RE = re.compile(r"^\s*(%s):[ \t]*(\S.*?)\s*$" % "|".join(f.capitalize() for f in METADATA_FIELDS), re.M)
+_HEADER_LINES = 12
+
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=CHUNK_SEPARATORS,
+    )
+
+
+# ---------------------------------------------------------------------------
+# INDEX TYPES
+# ---------------------------------------------------------------------------
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "sq8", "ivfpq")
+
+# Fields that change how vectors are stored; changing one requires a rebuild.
+# The remaining fields are query-time tunables applied after loading.
+_STRUCTURAL_FIELDS = ("index_type", "hnsw_m", "hnsw_ef_construction", "ivf_nlist", "pq_m", "pq_nbits")
+
+STORE_FORMATS = ("pickle", "mmap")
+
+# Full-precision copy of the vectors kept next to a quantized index for
+# exact re-ranking. It is memory-mapped, so only rows of re-ranked
+# candidates are paged in.
+EXACT_VECTORS_FILE = "vectors.npy"
+
+
+@dataclass
+class IndexConfig:
+    """
+    FAISS index structure and query-time tunables.
+
+    - ``flat``: exact search, cost linear in corpus size. Default.
+    - ``hnsw``: graph index; ``hnsw_ef_search`` trades recall for speed.
+      Does not support deletion, so incremental syncs that remove chunks
+      rebuild it.
+    - ``ivf``: inverted lists over ``ivf_nlist`` k-means centroids (0 picks
+      ~4*sqrt(n), capped so each centroid trains on at least 39 points);
+      ``ivf_nprobe`` lists are scanned per query.
+    - ``sq8``: exhaustive search over int8 scalar-quantized vectors (4x
+      smaller than float32).
+    - ``ivfpq``: IVF with product-quantized codes of ``pq_m`` bytes per
+      vector at 8 bits (384-dim MiniLM: 16x smaller with the default 96).
+
+    With ``rerank_factor`` > 1 on a quantized type, float32 vectors are also
+    written to disk and ``rerank_factor * k`` candidates are re-scored
+    exactly against the memory-mapped copy.
+
+    All types use L2 distance, matching the default of ``FAISS.from_documents``
+    (equivalent to cosine ranking for the normalized MiniLM vectors).
+    """
+
+    index_type: str = "flat"
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    ivf_nlist: int = 0
+    ivf_nprobe: int = 8
+    pq_m: int = 96
+    pq_nbits: int = 8
+    rerank_factor: int = 0
+
+    def __post_init__(self):
+        self.index_type = self.index_type.lower()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type '{self.index_type}'. Expected one of {INDEX_TYPES}.")
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "flat"),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+            hnsw_ef_construction=int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200")),
+            hnsw_ef_search=int(os.getenv("FAISS_HNSW_EF_SEARCH", "64")),
+            ivf_nlist=int(os.getenv("FAISS_IVF_NLIST", "0")),
+            ivf_nprobe=int(os.getenv("FAISS_IVF_NPROBE", "8")),
+            pq_m=int(os.getenv("FAISS_PQ_M", "96")),
+            pq_nbits=int(os.getenv("FAISS_PQ_NBITS", "8")),
+            rerank_factor=int(os.getenv("FAISS_RERANK_FACTOR", "0")),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IndexConfig":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def structure(self) -> dict:
+        structure = {name: getattr(self, name) for name in _STRUCTURAL_FIELDS}
+        structure["exact_vectors"] = self.stores_exact_vectors
+        return structure
+
+    @property
+    def quantized(self) -> bool:
+        return self.index_type in ("sq8", "ivfpq")
+
+    @property
+    def stores_exact_vectors(self) -> bool:
+        return self.quantized and self.rerank_factor > 1
+
+    @property
+    def supports_remove(self) -> bool:
+        # LangChain renumbers index_to_docstore_id to 0..n-1 after a delete,
+        # which only matches indexes that renumber too (flat, sq8). IVF keeps
+        # each vector's original id and HNSW cannot remove at all.
+        return self.index_type in ("flat", "sq8")
+
+    @property
+    def supports_incremental(self) -> bool:
+        # The exact-vector file is positional; keeping it aligned through
+        # FAISS deletions is not worth it, so such indexes are rebuilt.
+        return not self.stores_exact_vectors
+
+    def _ivf_nlist(self, n: int) -> int:
+        nlist = self.ivf_nlist or min(int(4 * math.sqrt(n)), n // 39)
+        return max(1, min(nlist, n))
+
+    def build(self, vectors: np.ndarray) -> faiss.Index:
+        """Create, train (if needed) and fill an index with ``vectors``."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        n, dim = vectors.shape
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m)
+            index.hnsw.efConstruction = self.hnsw_ef_construction
+        elif self.index_type == "ivf":
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, self._ivf_nlist(n))
+            index.train(vectors)
+        elif self.index_type == "sq8":
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+            index.train(vectors)
+        elif self.index_type == "ivfpq":
+            if dim % self.pq_m:
+                raise ValueError(f"FAISS_PQ_M={self.pq_m} must divide the embedding dimension {dim}.")
+            # PQ needs at least 2**nbits training points per sub-quantizer.
+            nbits = max(1, min(self.pq_nbits, int(math.log2(max(n, 2)))))
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, self._ivf_nlist(n), self.pq_m, nbits)
+            index.train(vectors)
+        else:
+            index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+        self.apply_search_params(index)
+        return index
+
+    def apply_search_params(self, index: faiss.Index) -> None:
+        if isinstance(index, faiss.IndexShards):
+            for i in range(index.count()):
+                self.apply_search_params(faiss.downcast_index(index.at(i)))
+            return
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.hnsw_ef_search
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = self.ivf_nprobe
+
+
+def resolve_index_config(stored: dict | None, requested: IndexConfig) -> IndexConfig:
+    """Reopen a stored index with its own structure; query-time tunables
+    come from ``requested`` (the current environment)."""
+    if stored is None:
+        return requested
+    return IndexConfig.from_dict({**requested.to_dict(), **IndexConfig.from_dict(stored).structure()})
+
+
+class ExactVectors:
+    """Read-only float32 vectors addressed by FAISS position, possibly split
+    across several memory-mapped files (one per shard)."""
+
+    def __init__(self, segments: list[np.ndarray]):
+        self._segments = segments
+        self._offsets = np.cumsum([0] + [len(seg) for seg in segments])
+
+    @classmethod
+    def open(cls, dirs: list[str]) -> "ExactVectors":
+        return cls([np.load(os.path.join(d, EXACT_VECTORS_FILE), mmap_mode="r") for d in dirs])
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        if len(self._segments) == 1:
+            return np.asarray(self._segments[0][ids])
+        seg_of = np.searchsorted(self._offsets, ids, side="right") - 1
+        return np.stack([self._segments[s][i - self._offsets[s]] for s, i in zip(seg_of, ids)])
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(seg.nbytes for seg in self._segments))
+
+
+def _merge_top_k(parts: list[tuple[np.ndarray, np.ndarray]], nq: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+    if not parts:
+        return np.full((nq, k), np.inf, dtype="float32"), np.full((nq, k), -1, dtype="int64")
+    distances = np.hstack([d for d, _ in parts] + [np.full((nq, k), np.inf, dtype="float32")])
+    ids = np.hstack([i for _, i in parts] + [np.full((nq, k), -1, dtype="int64")])
+    distances = np.where(ids >= 0, distances, np.inf)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def filtered_search(
+    index: faiss.Index, queries: np.ndarray, k: int, subset: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Search only the positions in ``subset`` (sorted int64).
+
+    Shards are searched one by one because IndexShards does not accept
+    search parameters. HNSW graph traversal finds few neighbours under a
+    restrictive filter, so its subset is scored exactly instead.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexShards):
+        parts = []
+        offset = 0
+        for i in range(index.count()):
+            shard = index.at(i)
+            lo, hi = np.searchsorted(subset, [offset, offset + shard.ntotal])
+            if hi > lo:
+                distances, ids = filtered_search(shard, queries, k, subset[lo:hi] - offset)
+                parts.append((distances, np.where(ids >= 0, ids + offset, -1)))
+            offset += shard.ntotal
+        return _merge_top_k(parts, len(queries), k)
+    if isinstance(index, faiss.IndexHNSW):
+        vectors = index.reconstruct_batch(subset)
+        distances = (
+            (queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)
+        ).astype("float32")
+        ids = np.broadcast_to(subset, distances.shape)
+        return _merge_top_k([(distances, ids)], len(queries), k)
+    selector = faiss.IDSelectorBatch(subset)
+    if isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(queries, k, params=params)
+
+
+class KnowledgeBaseStore(FAISS):
+    """
+    LangChain FAISS store with batched search and optional exact re-ranking.
+
+    All knowledge base lookups go through ``search_vectors``. When
+    ``exact_vectors`` is attached (quantized index with rerank_factor > 1),
+    ``rerank_factor * k`` candidates are fetched from the index and re-scored
+    with exact L2 distance before the top ``k`` are returned. ``subset``
+    restricts the search to those FAISS positions (metadata filters).
+    """
+
+    exact_vectors: ExactVectors | None = None
+    rerank_factor: int = 0
+    index_config: IndexConfig | None = None
+    memory_mapped: bool = False
+
+    def _search(self, queries: np.ndarray, k: int, subset: np.ndarray | None) -> tuple[np.ndarray, np.ndarray]:
+        if subset is None:
+            return self.index.search(queries, k)
+        return filtered_search(self.index, queries, k, subset)
+
+    def search_vectors(
+        self, queries: np.ndarray, k: int, subset: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        if self.exact_vectors is None or self.rerank_factor <= 1:
+            return self._search(queries, k, subset)
+
+        fetch_k = min(k * self.rerank_factor, self.index.ntotal)
+        _, candidates = self._search(queries, fetch_k, subset)
+        distances = np.full((len(queries), k), np.inf, dtype="float32")
+        ids = np.full((len(queries), k), -1, dtype="int64")
+        for row, query in enumerate(queries):
+            cand = candidates[row][candidates[row] >= 0]
+            if len(cand) == 0:
+                continue
+            exact = ((self.exact_vectors.take(cand) - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            ids[row, :len(order)] = cand[order]
+        return distances, ids
+
+
+class _OfflineEmbeddings(Embeddings):
+    """Placeholder for stores built from precomputed vectors (ingest shards,
+    memory reports). Whoever loads the store supplies the real model."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        raise RuntimeError("This store was built offline; load it with an embedding model to query it.")
+
+    def embed_query(self, text: str) -> list[float]:
+        raise RuntimeError("This store was built offline; load it with an embedding model to query it.")
+
+
+def build_faiss_store(
+    chunks: list[Document],
+    vectors: np.ndarray,
+    embeddings: Embeddings | None,
+    config: IndexConfig,
+) -> KnowledgeBaseStore:
+    """Wrap a freshly built index of ``config`` type in a knowledge base store.
+    The caller persists it with ``save_store``."""
+    vs = KnowledgeBaseStore(
+        embedding_function=embeddings or _OfflineEmbeddings(),
+        index=config.build(vectors),
+        docstore=InMemoryDocstore({c.id: c for c in chunks}),
+        index_to_docstore_id={i: c.id for i, c in enumerate(chunks)},
+    )
+    vs.index_config = config
+    if config.stores_exact_vectors:
+        vs.exact_vectors = ExactVectors([np.ascontiguousarray(vectors, dtype="float32")])
+        vs.rerank_factor = config.rerank_factor
+    return vs
+
+
+def save_store(vs: KnowledgeBaseStore, folder: str, store_format: str = "pickle") -> None:
+    """Persist a store. ``pickle`` is LangChain's mutable format; ``mmap`` is
+    the read-only format from mmap_store, shared across worker processes."""
+    if store_format == "mmap":
+        documents = [vs.docstore.search(vs.index_to_docstore_id[i]) for i in range(vs.index.ntotal)]
+        write_mmap_store(folder, vs.index, documents)
+    else:
+        vs.save_local(folder)
+    if vs.exact_vectors is not None:
+        np.save(os.path.join(folder, EXACT_VECTORS_FILE), vs.exact_vectors.take(np.arange(vs.index.ntotal)))
+
+
+def _load_pickled(folders: list[str], embeddings: Embeddings) -> KnowledgeBaseStore:
+    stores = [
+        KnowledgeBaseStore.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+        for folder in folders
+    ]
+    if len(stores) == 1:
+        return stores[0]
+    combined = faiss.IndexShards(stores[0].index.d, True, True)
+    docs: dict[str, Document] = {}
+    index_to_docstore_id: dict[int, str] = {}
+    offset = 0
+    for shard_vs in stores:
+        combined.add_shard(shard_vs.index)
+        docs.update(shard_vs.docstore._dict)
+        for i, doc_id in shard_vs.index_to_docstore_id.items():
+            index_to_docstore_id[offset + i] = doc_id
+        offset += shard_vs.index.ntotal
+    return KnowledgeBaseStore(
+        embedding_function=embeddings,
+        index=combined,
+        docstore=InMemoryDocstore(docs),
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def _load_mmapped(folders: list[str], embeddings: Embeddings) -> KnowledgeBaseStore:
+    index = open_mmap_index(folders)
+    vs = KnowledgeBaseStore(
+        embedding_function=embeddings,
+        index=index,
+        docstore=MmapDocstore(folders),
+        index_to_docstore_id=PositionalIds(index.ntotal),
+    )
+    vs.memory_mapped = True
+    return vs
+
+
+def load_store(folders: list[str], embeddings: Embeddings, config: IndexConfig) -> KnowledgeBaseStore:
+    """Load one or more saved stores (shards) as a single read-mostly store.
+
+    Multiple shards are searched together through ``faiss.IndexShards``,
+    which works for every index type (HNSW indexes cannot be merged).
+    Stores in the mmap format are opened read-only without deserializing."""
+    if all(is_mmap_store(folder) for folder in folders):
+        vs = _load_mmapped(folders, embeddings)
+    else:
+        vs = _load_pickled(folders, embeddings)
+    vs.index_config = config
+    config.apply_search_params(vs.index)
+    if config.stores_exact_vectors:
+        vs.exact_vectors = ExactVectors.open(folders)
+        vs.rerank_factor = config.rerank_factor
+    return vs
+
+
+# ---------------------------------------------------------------------------
+# MEMORY FOOTPRINT
+# ---------------------------------------------------------------------------
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Approximate resident size of a FAISS index (codes + graph/centroids)."""
+    if isinstance(index, faiss.IndexShards):
+        return sum(index_memory_bytes(index.at(i)) for i in range(index.count()))
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        hnsw = index.hnsw
+        graph = hnsw.neighbors.size() * 4 + hnsw.levels.size() * 4 + hnsw.offsets.size() * 8
+        return index_memory_bytes(index.storage) + graph
+    if isinstance(index, faiss.IndexIVF):
+        # codes + 8-byte ids per vector, plus the coarse quantizer
+        size = index.ntotal * (index.code_size + 8) + index_memory_bytes(index.quantizer)
+        if isinstance(index, faiss.IndexIVFPQ):
+            size += index.pq.centroids.size() * 4
+        return size
+    return index.ntotal * index.code_size
+
+
+def memory_report(vs: FAISS) -> dict:
+    index = vs.index
+    index_bytes = index_memory_bytes(index)
+    float32_bytes = index.ntotal * index.d * 4
+    config = getattr(vs, "index_config", None)
+    exact = getattr(vs, "exact_vectors", None)
+    return {
+        "index_type": config.index_type if config else "flat",
+        "vectors": index.ntotal,
+        "dim": index.d,
+        "index_bytes": index_bytes,
+        "float32_bytes": float32_bytes,
+        "compression": round(float32_bytes / index_bytes, 2) if index_bytes else 0.0,
+        "rerank_vectors_on_disk_bytes": exact.nbytes if exact is not None else 0,
+        "memory_mapped": getattr(vs, "memory_mapped", False),
+    }
+
+
+# ---------------------------------------------------------------------------
+# CHUNKING & MANIFEST
+# ---------------------------------------------------------------------------
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_document_headers(text: str) -> dict:
+    """Structured fields (``model``, ``category``) from the header block."""
+    head = "\n".join(text.strip().splitlines()[:_HEADER_LINES])
+    headers: dict[str, str] = {}
+    for name, value in _HEADER_RE.findall(head):
+        headers.setdefault(name.lower(), value)
+    return headers
+
+
+def split_document(document: Document, splitter: RecursiveCharacterTextSplitter | None = None) -> list[Document]:
+    """
+    Split one source document into chunks with stable, content-derived IDs.
+
+    The chunk ID is ``<source>#<hash prefix>``, with an ordinal suffix if the
+    same text appears more than once in the document, so an unchanged chunk
+    keeps its ID across rebuilds and can be skipped. Header fields (model,
+    category) are copied onto every chunk unless the document's metadata
+    already sets them.
+    """
+    splitter = splitter or get_text_splitter()
+    source = document.metadata["source"]
+    metadata = {**parse_document_headers(document.page_content), **document.metadata}
+    chunks = splitter.split_documents([Document(page_content=document.page_content, metadata=metadata)])
+    seen: dict[str, int] = {}
+    for chunk in chunks:
+        digest = content_hash(chunk.page_content)[:16]
+        ordinal = seen.get(digest, 0)
+        seen[digest] = ordinal + 1
+        chunk_id = f"{source}#{digest}" if ordinal == 0 else f"{source}#{digest}-{ordinal}"
+        chunk.id = chunk_id
+        chunk.metadata["chunk_id"] = chunk_id
+    return chunks
+
+
+def index_settings(embedding_model: str, config: IndexConfig | None = None) -> dict:
+    """Settings that invalidate every stored vector when they change."""
+    settings = {
+        "embedding_model": embedding_model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "separators": CHUNK_SEPARATORS,
+        "metadata_fields": list(METADATA_FIELDS),
+    }
+    if config is not None:
+        settings["index"] = config.structure()
+    return settings
+
+
+def load_manifest(index_dir: str) -> dict | None:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+    except (OSError, json.JSONDecodeError) as exc:
+        logger.warning("Ignoring unreadable index manifest '%s': %s", path, exc)
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(index_dir: str, manifest: dict) -> None:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _build_full(
+    index_dir: str,
+    documents: list[Document],
+    embeddings: Embeddings,
+    settings: dict,
+    config: IndexConfig,
+) -> KnowledgeBaseStore:
+    splitter = get_text_splitter()
+    chunks: list[Document] = []
+    manifest_docs: dict[str, dict] = {}
+    for document in documents:
+        doc_chunks = split_document(document, splitter)
+        chunks.extend(doc_chunks)
+        manifest_docs[document.metadata["source"]] = {
+            "hash": content_hash(document.page_content),
+            "chunks": [c.id for c in doc_chunks],
+        }
+    if not chunks:
+        raise ValueError("Knowledge base corpus is empty; nothing to index.")
+    logger.info("Split %d raw documents into %d chunks.", len(documents), len(chunks))
+
+    vectors = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype="float32")
+    vs = build_faiss_store(chunks, vectors, embeddings, config)
+    os.makedirs(index_dir, exist_ok=True)
+    save_store(vs, index_dir)
+    save_manifest(index_dir, {
+        "version": MANIFEST_VERSION,
+        "settings": settings,
+        "index_config": config.to_dict(),
+        "documents": manifest_docs,
+    })
+    logger.info("FAISS %s index saved at '%s' with %d chunks.", config.index_type, index_dir, len(chunks))
+    return vs
+
+
+def _sync_incremental(
+    index_dir: str,
+    vs: KnowledgeBaseStore,
+    manifest: dict,
+    documents: list[Document],
+    config: IndexConfig,
+) -> KnowledgeBaseStore | None:
+    """Apply corpus changes in place. Returns None when the index type
+    cannot apply them (deletions from HNSW) and a full rebuild is needed."""
+    splitter = get_text_splitter()
+    old_docs: dict[str, dict] = manifest["documents"]
+    new_docs: dict[str, dict] = {}
+    stored_ids = set(vs.index_to_docstore_id.values())
+    keep_ids: set[str] = set()
+    to_add: list[Document] = []
+    changed_sources = 0
+
+    for document in documents:
+        source = document.metadata["source"]
+        doc_hash = content_hash(document.page_content)
+        previous = old_docs.get(source)
+        if previous is not None and previous["hash"] == doc_hash and stored_ids.issuperset(previous["chunks"]):
+            new_docs[source] = previous
+            keep_ids.update(previous["chunks"])
+            continue
+
+        changed_sources += 1
+        doc_chunks = split_document(document, splitter)
+        new_docs[source] = {"hash": doc_hash, "chunks": [c.id for c in doc_chunks]}
+        for chunk in doc_chunks:
+            keep_ids.add(chunk.id)
+            # Chunks of an edited document whose text did not change keep
+            # their content-derived ID and their existing vector.
+            if chunk.id not in stored_ids:
+                to_add.append(chunk)
+
+    to_delete = [doc_id for doc_id in stored_ids if doc_id not in keep_ids]
+    if not to_add and not to_delete:
+        logger.info("FAISS index is up to date with the knowledge base (%d chunks).", len(stored_ids))
+        return vs
+    if len(keep_ids) == 0:
+        raise ValueError("Knowledge base corpus is empty; nothing to index.")
+    if not config.supports_incremental or (to_delete and not config.supports_remove):
+        logger.info("%s index cannot be updated in place; rebuilding.", config.index_type)
+        return None
+
+    logger.info(
+        "Knowledge base changed in %d document(s): embedding %d new chunk(s), removing %d stale chunk(s).",
+        changed_sources, len(to_add), len(to_delete),
+    )
+    if to_delete:
+        vs.delete(to_delete)
+    if to_add:
+        vs.add_documents(to_add, ids=[c.id for c in to_add])
+    vs.save_local(index_dir)
+    save_manifest(index_dir, {**manifest, "index_config": config.to_dict(), "documents": new_docs})
+    return vs
+
+
+def sync_vector_store(
+    index_dir: str,
+    documents: list[Document],
+    embeddings: Embeddings,
+    embedding_model: str,
+    config: IndexConfig | None = None,
+) -> KnowledgeBaseStore:
+    """
+    Return a FAISS store for ``documents``, reusing the index in ``index_dir``.
+
+    A manifest stored next to the index records a content hash per source
+    document and the IDs of its chunks. At startup the corpus is diffed
+    against it: only new or edited chunks are embedded and removed ones are
+    deleted. A missing or incompatible manifest (different embedding model
+    or chunking settings) triggers a full rebuild, as does a change of the
+    index structure in ``config``.
+    """
+    config = config or IndexConfig()
+    settings = index_settings(embedding_model, config)
+    index_file = os.path.join(index_dir, "index.faiss")
+    manifest = load_manifest(index_dir)
+
+    if os.path.exists(index_file) and manifest is not None and manifest.get("settings") == settings:
+        logger.info("Loading existing FAISS index from '%s'...", index_dir)
+        vs = load_store([index_dir], embeddings, config)
+        logger.info("FAISS %s index loaded successfully.", config.index_type)
+        synced = _sync_incremental(index_dir, vs, manifest, documents, config)
+        if synced is not None:
+            return synced
+    elif os.path.exists(index_file):
+        logger.info("FAISS index at '%s' has no compatible manifest. Rebuilding...", index_dir)
+    else:
+        logger.info("No existing FAISS index. Building from knowledge base documents...")
+    return _build_full(index_dir, documents, embeddings, settings, config)
+
+
+def is_prebuilt_index(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, PREBUILT_MANIFEST_FILE))
+
+
+def load_prebuilt_vector_store(
+    index_dir: str,
+    embeddings: Embeddings,
+    embedding_model: str,
+    config: IndexConfig | None = None,
+) -> KnowledgeBaseStore:
+    """
+    Load the sharded artifact written by ``ingest.py`` as one read-only store.
+
+    Shards keep the index type they were built with (recorded in the
+    manifest); ``config`` only supplies query-time tunables.
+    """
+    with open(os.path.join(index_dir, PREBUILT_MANIFEST_FILE), encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("settings", {}).get("embedding_model") != embedding_model:
+        raise ValueError(
+            f"Prebuilt index at '{index_dir}' was embedded with "
+            f"'{manifest.get('settings', {}).get('embedding_model')}', but the server uses '{embedding_model}'. "
+            f"Re-run ingest.py."
+        )
+    shards = manifest["shards"]
+    if not shards:
+        raise ValueError(f"Prebuilt index at '{index_dir}' contains no shards.")
+
+    requested = config or IndexConfig()
+    config = resolve_index_config(manifest.get("index_config"), requested)
+    if config.structure() != requested.structure():
+        logger.info(
+            "Prebuilt index uses a '%s' index; serving it as built (re-run ingest.py to change).",
+            config.index_type,
+        )
+
+    logger.info(
+        "Loading prebuilt FAISS index from '%s' (%d shards, %s format)...",
+        index_dir, len(shards), manifest.get("store_format", "pickle"),
+    )
+    vs = load_store([os.path.join(index_dir, shard["path"]) for shard in shards], embeddings, config)
+    logger.info("Prebuilt FAISS %s index loaded with %d chunks.", config.index_type, vs.index.ntotal)
+    return vs
+
+
+def memory_footprint_by_mode(vectors: np.ndarray, configs: list[IndexConfig] | None = None) -> list[dict]:
+    """Build each index mode over ``vectors`` and report its footprint."""
+    configs = configs or [IndexConfig(index_type=t) for t in INDEX_TYPES]
+    chunks = [Document(page_content="", id=str(i)) for i in range(len(vectors))]
+    rows = []
+    for config in configs:
+        rows.append(memory_report(build_faiss_store(chunks, vectors, None, config)))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report vector index memory footprint per index mode.")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Number of vectors (default: 100000)")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (default: 384, MiniLM)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sample = rng.standard_normal((args.vectors, args.dim)).astype("float32")
+    sample /= np.linalg.norm(sample, axis=1, keepdims=True)
+    print(f"{'mode':<8}{'index MB':>12}{'float32 MB':>12}{'ratio':>8}")
+    for row in memory_footprint_by_mode(sample):
+        print(
+            f"{row['index_type']:<8}{row['index_bytes'] / 2**20:>12.1f}"
+            f"{row['float32_bytes'] / 2**20:>12.1f}{row['compression']:>7.1f}x"
+        )
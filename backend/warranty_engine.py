@@ -0,0 +1,376 @@
+"""
+Warranty lookups backed by data files instead of code.
+
+Two tables, each read from CSV or from SQLite (``.db`` / ``.sqlite`` /
+``.sqlite3``, table named after the table below):
+
+- ``warranty_plans``: ``pattern, plan, expires, coverage, contact``. One row
+  per model family; ``pattern`` is a word sequence such as "dell latitude".
+- ``assets`` (optional): ``serial, model[, expires]``. One row per device;
+  ``expires`` overrides the plan's expiry date for that device.
+
+Both are loaded once and held in memory. Models are resolved with a word
+trie over all patterns; the longest matching pattern wins, so "Dell Latitude
+5540" resolves to "dell latitude" regardless of row order. Names written
+without spaces ("ThinkPadX1", "Dell XPS15") fall back to a substring match.
+"""
+
+import codecs
+import csv
+import datetime
+import io
+import logging
+import os
+import re
+import sqlite3
+import sys
+from collections.abc import AsyncIterator, Iterable
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_TEXT_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_SQLITE_EXTENSIONS = {".db", ".sqlite", ".sqlite3"}
+
+STATUS_ACTIVE = "Active"
+STATUS_EXPIRED = "Expired"
+STATUS_NOT_FOUND = "Not Found"
+
+# Columns of a bulk audit result, one row per input device.
+AUDIT_FIELDS = ("row", "serial", "model", "status", "days_remaining", "plan", "expires")
+AUDIT_FORMATS = ("ndjson", "csv")
+_SERIAL_COLUMNS = ("serial", "serial_number", "serialnumber")
+_MODEL_COLUMNS = ("model", "laptop_model")
+_NDJSON_ROW = "{{" + ", ".join(f'"{field}": {{}}' for field in AUDIT_FIELDS) + "}}\n"
+
+
+def _json_value(value) -> str:
+    if value is None:
+        return "null"
+    return encode_basestring_ascii(value) if isinstance(value, str) else str(value)
+
+
+def audit_error(row: int, message: str, fmt: str = "ndjson") -> str:
+    """The record that ends an audit stream whose input turned out to be bad
+    after results had started: ``{"row", "error"}`` in NDJSON, a CSV row with
+    ``ERROR: <message>`` as its status otherwise."""
+    if fmt == "csv":
+        out = io.StringIO()
+        csv.writer(out).writerow((row, "", "", f"ERROR: {message}", "", "", ""))
+        return out.getvalue()
+    return f'{{"row": {row}, "error": {_json_value(message)}}}\n'
+
+
+_BRANDS = frozenset({"lenovo", "dell", "hp", "apple", "microsoft", "asus", "acer"})
+_MODEL_SUFFIXES = frozenset({"gen", "pro", "air", "max", "plus", "ultra", "mini", "carbon", "flip", "studio", "laptop"})
+
+
+def _is_model_word(word: str) -> bool:
+    """Words that continue a model name: "T14s", "9530", "Gen", "Pro"."""
+    return word in _MODEL_SUFFIXES or any(c.isdigit() for c in word)
+
+
+def normalize_model(model: str) -> str:
+    """Lowercase words of a model string: "Dell XPS-15 (9530)" -> "dell xps 15 9530"."""
+    return " ".join(_WORD_RE.findall(model.lower()))
+
+
+def normalize_serial(serial: str) -> str:
+    return serial.strip().upper()
+
+
+def _parse_date(value: str | None) -> datetime.date | None:
+    value = (value or "").strip()
+    return datetime.date.fromisoformat(value) if value else None
+
+
+@dataclass(frozen=True)
+class WarrantyPlan:
+    pattern: str
+    plan: str
+    expires: datetime.date
+    coverage: str
+    contact: str
+
+
+@dataclass
+class WarrantyStatus:
+    model: str
+    serial: str
+    status: str
+    days_remaining: int | None = None
+    plan: str = ""
+    expires: str = ""
+    coverage: str = ""
+    contact: str = ""
+
+    @property
+    def found(self) -> bool:
+        return self.status != STATUS_NOT_FOUND
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ModelMatcher:
+    """Word-level trie over model patterns; finds every pattern occurring as
+    a contiguous word sequence in one pass and keeps the longest."""
+
+    def __init__(self, patterns: Iterable[str]):
+        patterns = list(patterns)
+        self._root: dict = {}
+        # Space-free patterns, longest first, for run-together model names.
+        self._compact = sorted(((p.replace(" ", ""), p) for p in patterns), key=lambda item: -len(item[0]))
+        for pattern in patterns:
+            node = self._root
+            for word in pattern.split():
+                node = node.setdefault(word, {})
+            node[None] = pattern
+
+    def find(self, words: list[str]) -> tuple[int, int, str] | None:
+        """(start, end, pattern) of the longest pattern in ``words``."""
+        best: tuple[int, int, str] | None = None
+        for start in range(len(words)):
+            node = self._root
+            for end in range(start, len(words)):
+                node = node.get(words[end])
+                if node is None:
+                    break
+                pattern = node.get(None)
+                if pattern is not None and (best is None or end + 1 - start > best[1] - best[0]):
+                    best = (start, end + 1, pattern)
+        return best
+
+    def match(self, normalized_model: str) -> str | None:
+        found = self.find(normalized_model.split())
+        if found:
+            return found[2]
+        # "thinkpadx1" or "dell xps15": no word boundary after the pattern.
+        compact = normalized_model.replace(" ", "")
+        return next((pattern for key, pattern in self._compact if key in compact), None)
+
+
+def _read_rows(path: str, table: str) -> list[dict]:
+    if os.path.splitext(path)[1].lower() in _SQLITE_EXTENSIONS:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(f"SELECT * FROM {table}")]
+        finally:
+            conn.close()
+    with open(path, newline="", encoding="utf-8") as fh:
+        return list(csv.DictReader(fh))
+
+
+class WarrantyEngine:
+    """In-memory warranty index: serial -> device, model -> plan."""
+
+    def __init__(self, plans: list[WarrantyPlan], assets: dict[str, tuple[str, datetime.date | None]] | None = None):
+        self._plans = {normalize_model(p.pattern): p for p in plans}
+        self._matcher = ModelMatcher(self._plans)
+        self._assets = assets or {}
+        # Keyed by the raw string: a fleet repeats a few thousand model names.
+        self._match = lru_cache(maxsize=65536)(self._match_model)
+
+    @classmethod
+    def load(cls, plans_path: str, assets_path: str | None = None) -> "WarrantyEngine":
+        plans = [
+            WarrantyPlan(
+                pattern=row["pattern"],
+                plan=row["plan"],
+                expires=_parse_date(row["expires"]),
+                coverage=row["coverage"],
+                contact=row["contact"],
+            )
+            for row in _read_rows(plans_path, "warranty_plans")
+        ]
+        assets: dict[str, tuple[str, datetime.date | None]] = {}
+        if assets_path:
+            for row in _read_rows(assets_path, "assets"):
+                assets[normalize_serial(row["serial"])] = (
+                    sys.intern(row.get("model") or ""),
+                    _parse_date(row.get("expires")),
+                )
+        logger.info("Warranty engine loaded: %d plans, %d assets.", len(plans), len(assets))
+        return cls(plans, assets)
+
+    def _match_model(self, model: str) -> WarrantyPlan | None:
+        pattern = self._matcher.match(normalize_model(model))
+        return self._plans[pattern] if pattern is not None else None
+
+    def match_plan(self, model: str) -> WarrantyPlan | None:
+        return self._match(model)
+
+    def find_model(self, text: str) -> str | None:
+        """The laptop model mentioned in free text, as written: the known
+        pattern plus an adjacent brand name and the model number that
+        follows ("my lenovo thinkpad T14s Gen 3 is..." -> "lenovo thinkpad
+        T14s Gen 3"), or None."""
+        spans = [(m.start(), m.end(), m.group().lower()) for m in _TEXT_WORD_RE.finditer(text)]
+        found = self._matcher.find([word for _, _, word in spans])
+        if found is None:
+            return None
+        start, end, _ = found
+        if start > 0 and spans[start - 1][2] in _BRANDS:
+            start -= 1
+        while end < len(spans) and _is_model_word(spans[end][2]):
+            end += 1
+        return text[spans[start][0]:spans[end - 1][1]]
+
+    def _resolve(self, model: str, serial: str) -> tuple[str, WarrantyPlan | None, datetime.date | None]:
+        """(model, plan, expiry date) for one device; both None if unknown."""
+        expires: datetime.date | None = None
+        if serial:
+            asset = self._assets.get(normalize_serial(serial))
+            if asset is not None:
+                model = asset[0] or model
+                expires = asset[1]
+        plan = self.match_plan(model) if model else None
+        if expires is None and plan is not None:
+            expires = plan.expires
+        return model, plan, expires
+
+    def lookup(self, model: str = "", serial: str = "", today: datetime.date | None = None) -> WarrantyStatus:
+        """Resolve one device. A known serial supplies the model (and possibly
+        a device-specific expiry date); otherwise ``model`` is matched."""
+        today = today or datetime.date.today()
+        model, plan, expires = self._resolve(model, serial)
+        if expires is None:
+            return WarrantyStatus(model=model, serial=serial, status=STATUS_NOT_FOUND)
+        days_remaining = (expires - today).days
+        return WarrantyStatus(
+            model=model,
+            serial=serial,
+            status=STATUS_ACTIVE if days_remaining > 0 else STATUS_EXPIRED,
+            days_remaining=days_remaining,
+            plan=plan.plan if plan else "",
+            expires=expires.isoformat(),
+            coverage=plan.coverage if plan else "",
+            contact=plan.contact if plan else "",
+        )
+
+    def lookup_many(self, devices: Iterable[dict], today: datetime.date | None = None) -> list[WarrantyStatus]:
+        """Resolve many devices, each a dict with ``model`` and/or ``serial``."""
+        today = today or datetime.date.today()
+        return [self.lookup(d.get("model") or "", d.get("serial") or "", today) for d in devices]
+
+    def audit(self, devices: list[dict], first_row: int = 1, fmt: str = "ndjson", include_header: bool = False) -> str:
+        """Resolve ``devices`` and render them as NDJSON lines or CSV rows
+        (see AUDIT_FIELDS); ``first_row`` numbers the output rows.
+
+        This is the bulk path: it skips WarrantyStatus objects and computes
+        the status of each distinct expiry date once per call.
+        """
+        today = datetime.date.today()
+        by_expiry: dict[datetime.date, tuple[str, int, str]] = {}
+        rows = []
+        for i, device in enumerate(devices):
+            serial = device.get("serial") or ""
+            model, plan, expires = self._resolve(device.get("model") or "", serial)
+            if expires is None:
+                rows.append((first_row + i, serial, model, STATUS_NOT_FOUND, None, "", ""))
+                continue
+            info = by_expiry.get(expires)
+            if info is None:
+                days_remaining = (expires - today).days
+                info = by_expiry[expires] = (
+                    STATUS_ACTIVE if days_remaining > 0 else STATUS_EXPIRED,
+                    days_remaining,
+                    expires.isoformat(),
+                )
+            rows.append((first_row + i, serial, model, info[0], info[1], plan.plan if plan else "", info[2]))
+
+        if fmt == "csv":
+            out = io.StringIO()
+            writer = csv.writer(out)
+            if include_header:
+                writer.writerow(AUDIT_FIELDS)
+            writer.writerows(rows)
+            return out.getvalue()
+        # Hand-assembled JSON lines: several times faster than json.dumps
+        # per row, which dominates the cost of a large audit.
+        return "".join(_NDJSON_ROW.format(*map(_json_value, row)) for row in rows)
+
+    def stats(self) -> dict:
+        info = self._match.cache_info()
+        return {"plans": len(self._plans), "assets": len(self._assets), "model_cache_hits": info.hits}
+
+
+def _column(header: list[str], names: tuple[str, ...]) -> int | None:
+    for i, name in enumerate(header):
+        if name in names:
+            return i
+    return None
+
+
+async def aiter_csv_devices(chunks: AsyncIterator[bytes], batch_size: int = 5000) -> AsyncIterator[list[dict]]:
+    """Parse a streamed CSV body into batches of ``{"serial", "model"}`` dicts
+    without buffering the whole upload. The header row must name a serial
+    and/or model column; raises ValueError otherwise.
+
+    Lines are handed to the csv reader one complete record at a time: a
+    line that leaves a quote open is held back with the lines after it until
+    the quotes balance, so quoted fields may contain newlines."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""  # text after the last newline
+    record = ""  # lines of a record whose quoted field is still open
+    quotes = 0
+    serial_col = model_col = None
+    header_seen = False
+    batch: list[dict] = []
+
+    def parse(lines: list[str]) -> None:
+        try:
+            parse_records(lines)
+        except csv.Error as exc:
+            raise ValueError(f"Malformed CSV: {exc}") from exc
+
+    def parse_records(lines: list[str]) -> None:
+        nonlocal header_seen, serial_col, model_col
+        for record in csv.reader(lines):
+            if not record or not any(field.strip() for field in record):
+                continue
+            if not header_seen:
+                header = [field.strip().lower() for field in record]
+                serial_col, model_col = _column(header, _SERIAL_COLUMNS), _column(header, _MODEL_COLUMNS)
+                if serial_col is None and model_col is None:
+                    raise ValueError("CSV header must include a 'serial' or 'model' column.")
+                header_seen = True
+                continue
+            batch.append({
+                "serial": record[serial_col].strip() if serial_col is not None and serial_col < len(record) else "",
+                "model": record[model_col].strip() if model_col is not None and model_col < len(record) else "",
+            })
+
+    def complete_records(lines: list[str]) -> list[str]:
+        # An escaped quote ("") counts twice, so an odd count means a quoted
+        # field runs on past this line.
+        nonlocal record, quotes
+        records = []
+        for line in lines:
+            record += line
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                records.append(record)
+                record, quotes = "", 0
+        return records
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        parse(complete_records([line + "\n" for line in lines]))
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            del batch[:batch_size]
+    pending += decoder.decode(b"", final=True)
+    # A quote still open at the end is left to the csv reader's leniency.
+    parse(complete_records([pending]) + ([record] if record else []))
+    if not header_seen:
+        raise ValueError("CSV upload is empty.")
+    while batch:
+        yield batch[:batch_size]
+        del batch[:batch_size]
@@ -1,10 +1,10 @@
 import { useState, useRef, useEffect, useCallback } from 'react'
-import axios from 'axios'
 import ReactMarkdown from 'react-markdown'
 import remarkGfm from 'remark-gfm'
 import { SendHorizonal, TriangleAlert, Cpu, Laptop, Database, Ticket, ShieldCheck, ArrowUpCircle } from 'lucide-react'
 
 const API_BASE_URL = 'http://localhost:8000'
+const REQUEST_TIMEOUT_MS = 90000
 
 const SUGGESTIONS = [
   {
@@ -37,6 +37,48 @@ const TOOL_META = {
   'Escalating to Tier 2':      { icon: ArrowUpCircle,  color: '#f78166', bg: 'rgba(247,129,102,0.12)', border: 'rgba(247,129,102,0.3)' },
 }
 
+// Reads the Server-Sent Events stream from /api/chat/stream and invokes
+// onEvent with each parsed JSON payload as it arrives.
+async function streamChat(body, onEvent, signal) {
+  const res = await fetch(`${API_BASE_URL}/api/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+    signal,
+  })
+  if (!res.ok) {
+    let detail = 'Unknown error.'
+    try {
+      detail = (await res.json()).detail || detail
+    } catch {
+      // non-JSON error body
+    }
+    const err = new Error(detail)
+    err.status = res.status
+    throw err
+  }
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let sep
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, sep)
+      buffer = buffer.slice(sep + 2)
+      const data = frame
+        .split('\n')
+        .filter((line) => line.startsWith('data:'))
+        .map((line) => line.slice(5).trim())
+        .join('\n')
+      if (data) onEvent(JSON.parse(data))
+    }
+  }
+}
+
 function ToolActivityBar({ toolCalls }) {
   if (!toolCalls || toolCalls.length === 0) return null
   return (
@@ -146,6 +188,8 @@ export default function ChatInterface() {
   const [isLoading, setIsLoading] = useState(false)
   const messagesEndRef = useRef(null)
   const textareaRef = useRef(null)
+  // The server keeps the conversation history; only its ID travels.
+  const sessionIdRef = useRef(null)
 
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
@@ -167,47 +211,68 @@ export default function ChatInterface() {
     setInputValue('')
     setIsLoading(true)
 
+    const botId = Date.now() + 1
+    const updateBot = (patch) =>
+      setMessages((prev) => prev.map((m) => (m.id === botId ? { ...m, ...patch(m) } : m)))
+    const controller = new AbortController()
+    const timer = setTimeout(() => controller.abort(), REQUEST_TIMEOUT_MS)
+
     try {
-      // Build history from current messages (exclude errors)
-      const historyPayload = messages
-        .filter((m) => !m.isError)
-        .map((m) => ({ role: m.role, content: m.content }))
+      setMessages((prev) => [
+        ...prev,
+        { role: 'bot', content: '', toolCalls: [], id: botId, isError: false, isStreaming: true },
+      ])
 
-      const response = await axios.post(
-        `${API_BASE_URL}/api/chat`,
-        { message: textToSend, chat_history: historyPayload },
-        { timeout: 90000, headers: { 'Content-Type': 'application/json' } }
+      await streamChat(
+        { message: textToSend, session_id: sessionIdRef.current },
+        (event) => {
+          if (event.session_id) sessionIdRef.current = event.session_id
+          switch (event.type) {
+            case 'tool_start':
+              updateBot((m) => ({
+                // Text streamed before a tool call was the model planning, not the answer.
+                content: '',
+                toolCalls: m.toolCalls.includes(event.tool) ? m.toolCalls : [...m.toolCalls, event.tool],
+              }))
+              break
+            case 'token':
+              updateBot((m) => ({ content: m.content + event.content }))
+              break
+            case 'done':
+              updateBot(() => ({ content: event.response, toolCalls: event.tool_calls || [], isStreaming: false }))
+              break
+            case 'error':
+              updateBot(() => ({ content: event.response, isError: true, isStreaming: false }))
+              break
+            default:
+              break
+          }
+        },
+        controller.signal,
       )
-
-      const botMsg = {
-        role: 'bot',
-        content: response.data.response,
-        toolCalls: response.data.tool_calls || [],
-        id: Date.now() + 1,
-        isError: false,
-      }
-      setMessages((prev) => [...prev, botMsg])
     } catch (err) {
       let errorContent = ''
-      if (err.code === 'ECONNREFUSED' || err.code === 'ERR_NETWORK') {
-        errorContent =
-          '**Connection Error:** Unable to reach the backend server.\n\nEnsure the FastAPI server is running:\n```\ncd backend\n.\\venv\\Scripts\\activate\nuvicorn main:app --reload --port 8000\n```'
-      } else if (err.code === 'ECONNABORTED') {
+      if (err.name === 'AbortError') {
         errorContent =
           '**Timeout:** The agent took too long to respond. The LLM may be busy — please try again.'
-      } else if (err.response) {
-        errorContent = `**Server Error (${err.response.status}):** ${err.response.data?.detail || 'Unknown error.'}`
+      } else if (err.status) {
+        errorContent = `**Server Error (${err.status}):** ${err.message}`
+      } else if (err instanceof TypeError) {
+        errorContent =
+          '**Connection Error:** Unable to reach the backend server.\n\nEnsure the FastAPI server is running:\n```\ncd backend\n.\\venv\\Scripts\\activate\nuvicorn main:app --reload --port 8000\n```'
       } else {
         errorContent = `**Unexpected Error:** ${err.message || 'Something went wrong.'}`
       }
       setMessages((prev) => [
-        ...prev,
-        { role: 'bot', content: errorContent, toolCalls: [], id: Date.now() + 1, isError: true },
+        ...prev.filter((m) => m.id !== botId),
+        { role: 'bot', content: errorContent, toolCalls: [], id: botId, isError: true },
       ])
     } finally {
+      clearTimeout(timer)
+      updateBot(() => ({ isStreaming: false }))
       setIsLoading(false)
     }
-  }, [inputValue, isLoading, messages])
+  }, [inputValue, isLoading])
 
   const handleKeyDown = useCallback((e) => {
     if (e.key === 'Enter' && !e.shiftKey) {
@@ -234,8 +299,10 @@ export default function ChatInterface() {
           <WelcomeScreen onSuggestionClick={(p) => sendMessage(p)} />
         ) : (
           <>
-            {messages.map((msg) => <MessageBubble key={msg.id} message={msg} />)}
-            {isLoading && <TypingIndicator />}
+            {messages
+              .filter((msg) => !(msg.isStreaming && !msg.content && msg.toolCalls.length === 0))
+              .map((msg) => <MessageBubble key={msg.id} message={msg} />)}
+            {isLoading && !messages.some((m) => m.isStreaming && m.content) && <TypingIndicator />}
           </>
         )}
         <div ref={messagesEndRef} />